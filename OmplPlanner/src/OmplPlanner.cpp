@@ -10,11 +10,13 @@
 #include <ompl/geometric/planners/rrt/LazyRRT.h>
 #include <ompl/geometric/planners/rrt/pRRT.h>
 #include <ompl/util/Console.h>
+#include <ompl/util/RandomNumbers.h>
 #include <smpl_ompl_interface/ompl_interface.h>
 
 #include <chrono>
 #include <ctime>
 #include <fstream>
+#include <iomanip>
 #include <iostream>
 
 using namespace mrpt::maps;
@@ -55,10 +57,16 @@ COccupancyGridMap2D GRID_MAP;
 
 extern "C" void cleanupPath(PathPose *path)
 {
-    std::cout << "Cleaning up memory.." << std::endl;
     free(path);
 }
 
+extern "C" void set_planner_seed(unsigned long seed)
+{
+    // OMPL only accepts the seed before its first random number generator is created,
+    // so this has to be called before anything is planned in the process
+    ompl::RNG::setSeed(seed);
+}
+
 og::SimpleSetup *getPlanningSetup(PLANNER_TYPE type, ob::StateSpacePtr space,
                                   std::string dbPath)
 {
@@ -95,7 +103,7 @@ og::SimpleSetup *getPlanningSetup(PLANNER_TYPE type, ob::StateSpacePtr space,
 
 void log(const std::string &logFilename, const std::string &log)
 {
-    if (log.empty() || !LOGGING_ACTIVE)
+    if (log.empty() || logFilename.empty() || !LOGGING_ACTIVE)
         return;
 
     // Open the log file
@@ -119,6 +127,19 @@ void log(const std::string &logFilename, const std::string &log)
     logfile.close();
 }
 
+std::string getPlannerName(PLANNER_TYPE plannerType)
+{
+    if (plannerType == PLANNER_TYPE::EXPERIENCE_LIGHTNING)
+        return "Lightning";
+    else if (plannerType == PLANNER_TYPE::EXPERIENCE_THUNDER)
+        return "Thunder";
+    else if (plannerType == PLANNER_TYPE::EXPERIENCE_GRAPHS)
+        return "EGraphs";
+    else if (plannerType == PLANNER_TYPE::SIMPLE_RRT_CONNECT)
+        return "SIMPLE(RRT-Connect)";
+    return "SIMPLE(RRT-Star)";
+}
+
 std::string getProblemInfo(const char *mapFilename, double mapResolution,
                            double robotRadius, double *xCoords, double *yCoords,
                            int numCoords, double startX, double startY,
@@ -153,26 +174,7 @@ std::string getProblemInfo(const char *mapFilename, double mapResolution,
         << "\n";
     log << "Distance between points: " << distanceBetweenPathPoints << "\n";
     log << "Turning Radius: " << turningRadius << "\n";
-    if (plannerType == PLANNER_TYPE::EXPERIENCE_LIGHTNING) {
-        log << "Planner Type: Lightning"
-            << "\n";
-    }
-    else if (plannerType == PLANNER_TYPE::EXPERIENCE_THUNDER) {
-        log << "Planner Type: Thunder"
-            << "\n";
-    }
-    else if (plannerType == PLANNER_TYPE::EXPERIENCE_GRAPHS) {
-        log << "Planner Type: EGraphs"
-            << "\n";
-    }
-    else if (plannerType == PLANNER_TYPE::SIMPLE_RRT_CONNECT) {
-        log << "Planner Type: SIMPLE(RRT-Connect)"
-            << "\n";
-    }
-    else {
-        log << "Planner Type: SIMPLE(RRT-Star)"
-            << "\n";
-    }
+    log << "Planner Type: " << getPlannerName(plannerType) << "\n";
     log << "Is Holonomic Robot: " << (isHolonomicRobot ? "True" : "False")
         << "\n";
     log << "-------------------------------------------------" << std::endl;
@@ -180,16 +182,111 @@ std::string getProblemInfo(const char *mapFilename, double mapResolution,
     return log.str();
 }
 
+std::string
+formatLogTime(const std::chrono::time_point< std::chrono::system_clock > &time)
+{
+    std::stringstream log;
+    std::time_t time_t = std::chrono::system_clock::to_time_t(time);
+    log << std::put_time(std::localtime(&time_t), "%d-%m-%Y %T");
+    return log.str();
+}
+
 std::string
 getLogTime(const std::string &tag,
            std::chrono::time_point< std::chrono::system_clock > &now)
 {
-    std::stringstream log;
-    log << tag << ": ";
     now = std::chrono::system_clock::now();
-    std::time_t time_now = std::chrono::system_clock::to_time_t(now);
-    log << std::put_time(std::localtime(&time_now), "%d-%m-%Y %T") << std::endl;
-    return log.str();
+    return tag + ": " + formatLogTime(now) + "\n";
+}
+
+// Besides the text log, every planning instance is written as one JSON object per
+// line to a structured event log next to it ("CompleteLog.log" -> "CompleteLog.jsonl"),
+// which the log parser reads without scraping the text.
+std::string getEventsFilename(const std::string &logFilename)
+{
+    std::string::size_type ext = logFilename.rfind(".log");
+    if (ext != std::string::npos && ext + 4 == logFilename.size())
+        return logFilename.substr(0, ext) + ".jsonl";
+    return logFilename + ".jsonl";
+}
+
+std::string escapeJSON(const std::string &str)
+{
+    std::stringstream escaped;
+    for (char c : str) {
+        if (c == '"' || c == '\\')
+            escaped << '\\' << c;
+        else if (c == '\n')
+            escaped << "\\n";
+        else
+            escaped << c;
+    }
+    return escaped.str();
+}
+
+void logEvent(const std::string &logFilename, const std::string &event)
+{
+    if (event.empty() || logFilename.empty() || !LOGGING_ACTIVE)
+        return;
+
+    // The whole line is written at once, so that events of different writers do not interleave
+    std::ofstream eventsFile;
+    eventsFile.open(getEventsFilename(logFilename).c_str(), std::ios_base::app);
+    if (!eventsFile) {
+        std::cout << "Could not open the events file of " << logFilename
+                  << std::endl;
+        return;
+    }
+    eventsFile << event + "\n";
+    eventsFile.close();
+}
+
+std::string getPlanEvent(
+    const char *mapFilename, double mapResolution, double startX,
+    double startY, double startTheta, double goalX, double goalY,
+    double goalTheta, PLANNER_TYPE plannerType, bool isHolonomicRobot,
+    const std::chrono::time_point< std::chrono::system_clock > &startTime,
+    double planningTime, double simplificationTime, int fromRecall,
+    double totalPlanningTime, bool solved, double pathCost, PathPose *path,
+    int pathLength)
+{
+    std::stringstream event;
+    event << std::setprecision(10);
+    event << "{\"event\": \"plan\", \"start_time\": \"" << formatLogTime(startTime)
+          << "\", \"map_filename\": \"" << escapeJSON(mapFilename)
+          << "\", \"map_resolution\": " << mapResolution
+          << ", \"start\": [" << startX << ", " << startY << ", " << startTheta
+          << "], \"goal\": [" << goalX << ", " << goalY << ", " << goalTheta
+          << "], \"planner_type\": \"" << getPlannerName(plannerType)
+          << "\", \"holonomic\": " << (isHolonomicRobot ? "true" : "false")
+          << ", \"planning_time\": " << planningTime
+          << ", \"simplification_time\": " << simplificationTime
+          << ", \"from_recall\": ";
+    // Only the experience based planners can plan from recall
+    if (fromRecall < 0)
+        event << "null";
+    else
+        event << fromRecall;
+    event << ", \"total_planning_time\": " << totalPlanningTime
+          << ", \"solved\": " << (solved ? "true" : "false")
+          << ", \"path_length\": " << pathCost << ", \"path\": [";
+    for (int i = 0; i < pathLength; i++) {
+        event << (i > 0 ? ", [" : "[") << path[i].x << ", " << path[i].y
+              << ", " << path[i].theta << "]";
+    }
+    event << "]}";
+    return event.str();
+}
+
+bool isSolutionFromRecall(og::SimpleSetup *ssPtr)
+{
+    // Same planner names that the log parser uses to tell recalled solutions apart
+    ob::PlannerSolution sol(nullptr);
+    if (!ssPtr->getProblemDefinition()->getSolution(sol))
+        return false;
+    return sol.plannerName_ == "LightningRetrieveRepair" ||
+           sol.plannerName_ == "Thunder_Retrieve_Repair" ||
+           sol.plannerName_.find("Recall") != std::string::npos;
 }
 
 std::string getPathToLog(PathPose **path, int pathLength)
@@ -204,6 +301,145 @@ std::string getPathToLog(PathPose **path, int pathLength)
     return log.str();
 }
 
+void setupOutputHandler(const std::string &logFilename, MODE mode)
+{
+    // The messages of OMPL go to the log file of the normal plans, and nowhere
+    // when there is no log file
+    if (mode == MODE::NORMAL && !logFilename.empty()) {
+        ompl::msg::useOutputHandler(
+            new ompl::msg::OutputHandlerFile(logFilename.c_str()));
+    }
+    else {
+        ompl::msg::noOutputHandler();
+    }
+}
+
+// The solution and the end of a planning instance are logged the same way by the
+// single plans and the planning sessions, the log parser depends on these lines
+void logSolution(const std::string &logFilename, og::SimpleSetup *ssPtr,
+                 PLANNER_TYPE plannerType, double pathCost)
+{
+    if (plannerType == PLANNER_TYPE::EXPERIENCE_GRAPHS) {
+        ob::PlannerSolution sol(nullptr);
+        ssPtr->getProblemDefinition()->getSolution(sol);
+        // Hack: Planner name represents if the solution was from scratch or recall
+        log(logFilename, sol.plannerName_ + std::string("\n"));
+    }
+
+    ompl::tools::ExperienceSetup *ePtr =
+        dynamic_cast< ot::ExperienceSetup * >(ssPtr);
+    if (ePtr != NULL) {
+        // Log the planning logs to the log file
+        std::ostringstream stream;
+        stream << "\n";
+        ePtr->printLogs(stream);
+        log(logFilename, stream.str());
+    }
+
+    std::stringstream pathCostStr;
+    pathCostStr << "Length of computed path = " << pathCost << std::endl;
+    log(logFilename, pathCostStr.str());
+}
+
+void logPlanEnd(
+    const std::string &logFilename, const char *mapFilename,
+    double mapResolution, double startX, double startY, double startTheta,
+    double goalX, double goalY, double goalTheta, PLANNER_TYPE plannerType,
+    MODE mode, bool isHolonomicRobot,
+    const std::chrono::time_point< std::chrono::system_clock > &startTime,
+    double computationTime, double simplificationTime, int fromRecall,
+    bool solved, double pathCost, PathPose **path, int *pathLength)
+{
+    std::chrono::time_point< std::chrono::system_clock > endTime;
+    std::string endTimeLog = getLogTime("End time", endTime);
+    log(logFilename, getPathToLog(path, *pathLength));
+    log(logFilename, endTimeLog);
+
+    std::chrono::duration< double > elapsed_seconds = endTime - startTime;
+    std::stringstream ss;
+    ss << "Planning took ";
+    ss << elapsed_seconds.count() << " seconds" << std::endl;
+    log(logFilename, ss.str());
+    log(logFilename, "========================================\n\n");
+
+    if (mode == MODE::NORMAL) {
+        logEvent(logFilename,
+                 getPlanEvent(mapFilename, mapResolution, startX, startY,
+                              startTheta, goalX, goalY, goalTheta, plannerType,
+                              isHolonomicRobot, startTime, computationTime,
+                              simplificationTime, fromRecall,
+                              elapsed_seconds.count(), solved, pathCost,
+                              *path, *pathLength));
+    }
+}
+
+ob::PlannerPtr getPlanner(PLANNER_TYPE plannerType, MODE mode,
+                          const ob::SpaceInformationPtr &si,
+                          std::string dbPath)
+{
+    ob::PlannerPtr planner;
+    if (mode == MODE::REPLANNING ||
+        plannerType == PLANNER_TYPE::SIMPLE_RRT_CONNECT) {
+        planner = ob::PlannerPtr(new og::RRTConnect(si));
+    }
+    else if (plannerType == PLANNER_TYPE::EXPERIENCE_GRAPHS) {
+        bool useEGraphPlanner = mode == MODE::NORMAL;
+        bool saveExperiences = mode == MODE::EXPERIENCE_GENERATION;
+
+        // If determining optimal paths, do not set a time limit on the search
+        std::string boundExpansions = ((mode == MODE::EXPERIENCE_GENERATION) ||
+                                       (mode == MODE::OPTIMAL_PATHS)) ? "0.0" : "1.0";
+
+        std::string initialEpsilon = "100.0";
+        std::string improveSolution =
+            ((mode == MODE::EXPERIENCE_GENERATION) ||
+             (mode == MODE::OPTIMAL_PATHS)) ? "1.0" : "0.0";
+
+        planner = ob::PlannerPtr(new smpl::OMPLPlanner(
+            si, useEGraphPlanner, dbPath, "", NULL, saveExperiences));
+
+        planner->params().setParam("epsilon", initialEpsilon);
+        planner->params().setParam("improve_solution", improveSolution);
+        planner->params().setParam("bound_expansions", boundExpansions);
+    }
+    else {
+        planner = ob::PlannerPtr(new og::RRTstar(si));
+    }
+
+    return planner;
+}
+
+void copyPathStates(og::PathGeometric &pth, ob::StateSpacePtr space,
+                    PathPose **path, int *pathLength)
+{
+    std::vector< ob::State * > &states = pth.getStates();
+    std::vector< double > reals;
+
+    *pathLength = states.size();
+    *path = (PathPose *)malloc(sizeof(PathPose) * states.size());
+    memset(*path, 0, sizeof(PathPose) * states.size());
+
+    for (unsigned i = 0; i < states.size(); i++) {
+        space->copyToReals(reals, states[i]);
+        (*path)[i].x = reals[0];
+        (*path)[i].y = reals[1];
+        (*path)[i].theta = reals[2];
+    }
+}
+
+void copySolutionPath(og::SimpleSetup *ssPtr, ob::StateSpacePtr space,
+                      double distanceBetweenPathPoints, PathPose **path,
+                      int *pathLength, double *pathCost)
+{
+    og::PathGeometric pth = ssPtr->getSolutionPath();
+    *pathCost = pth.length();
+    int numInterpolationPoints = (*pathCost) / distanceBetweenPathPoints;
+    if (numInterpolationPoints > 0)
+        pth.interpolate(numInterpolationPoints);
+
+    copyPathStates(pth, space, path, pathLength);
+}
+
 extern "C" bool plan_multiple_circles(
     const char *mapFilename, double mapResolution, double robotRadius,
     double *xCoords, double *yCoords, int numCoords, double startX,
@@ -219,8 +455,7 @@ extern "C" bool plan_multiple_circles(
         plannerType < PLANNER_TYPE::PLANNER_TYPE_COUNT &&
         mode == MODE::NORMAL) {
         // Setup OMPL logging stream to the log file
-        ompl::msg::useOutputHandler(
-            new ompl::msg::OutputHandlerFile(logFilename.c_str()));
+        setupOutputHandler(logFilename, mode);
         LOGGING_ACTIVE = true;
     }
     else {
@@ -228,6 +463,9 @@ extern "C" bool plan_multiple_circles(
             // First log that it is a replan and then disable logging
             LOGGING_ACTIVE = true;
             log(logFilename, "Replanning Triggered\n");
+            logEvent(logFilename, "{\"event\": \"replan\", \"time\": \"" +
+                                      formatLogTime(std::chrono::system_clock::now()) +
+                                      "\"}");
         }
         ompl::msg::noOutputHandler();
         LOGGING_ACTIVE = false;
@@ -240,7 +478,6 @@ extern "C" bool plan_multiple_circles(
         isHolonomicRobot);
     log(logFilename, probInfo);
 
-    int numInterpolationPoints = 0;
     bool isReplan = (mode == MODE::REPLANNING);
 
     std::chrono::time_point< std::chrono::system_clock > startTime;
@@ -306,34 +543,7 @@ extern "C" bool plan_multiple_circles(
     ssPtr->getSpaceInformation()->setStateValidityCheckingResolution(0.005);
     ssPtr->setup();
 
-    ob::PlannerPtr planner;
-    if (isReplan || plannerType == PLANNER_TYPE::SIMPLE_RRT_CONNECT) {
-        planner = ob::PlannerPtr(new og::RRTConnect(si));
-    }
-    else if (plannerType == PLANNER_TYPE::EXPERIENCE_GRAPHS) {
-        bool useEGraphPlanner = mode == MODE::NORMAL;
-        bool saveExperiences = mode == MODE::EXPERIENCE_GENERATION;
-
-        // If determining optimal paths, do not set a time limit on the search
-        std::string boundExpansions = ((mode == MODE::EXPERIENCE_GENERATION) ||
-                                       (mode == MODE::OPTIMAL_PATHS)) ? "0.0" : "1.0";
-
-        std::string initialEpsilon = "100.0";
-        std::string improveSolution =
-            ((mode == MODE::EXPERIENCE_GENERATION) ||
-             (mode == MODE::OPTIMAL_PATHS)) ? "1.0" : "0.0";
-
-        planner = ob::PlannerPtr(new smpl::OMPLPlanner(
-            si, useEGraphPlanner, experienceDBPath, "", NULL, saveExperiences));
-
-        planner->params().setParam("epsilon", initialEpsilon);
-        planner->params().setParam("improve_solution", improveSolution);
-        planner->params().setParam("bound_expansions", boundExpansions);
-    }
-    else {
-        planner = ob::PlannerPtr(new og::RRTstar(si));
-    }
-
+    ob::PlannerPtr planner = getPlanner(plannerType, mode, si, experienceDBPath);
     ssPtr->setPlanner(planner);
     ssPtr->setup();
 
@@ -341,55 +551,30 @@ extern "C" bool plan_multiple_circles(
 
     // attempt to solve the problem within the specified planning time
     ob::PlannerStatus solved = ssPtr->solve(planningTime);
+    double computationTime = ssPtr->getLastPlanComputationTime();
+    double simplificationTime = 0.0;
+    int fromRecall = (ePtr != NULL || plannerType == PLANNER_TYPE::EXPERIENCE_GRAPHS) ? 0 : -1;
 
     if (solved) {
         std::cout << "Found solution" << std::endl;
+        if (fromRecall == 0 && isSolutionFromRecall(ssPtr)) {
+            fromRecall = 1;
+        }
         if (plannerType == PLANNER_TYPE::SIMPLE_RRT_CONNECT ||
             plannerType == PLANNER_TYPE::SIMPLE_RRT_STAR ||
             plannerType == PLANNER_TYPE::EXPERIENCE_GRAPHS) {
             ssPtr->simplifySolution();
-        }
-        if (plannerType == PLANNER_TYPE::EXPERIENCE_GRAPHS) {
-            ob::PlannerSolution sol(nullptr);
-            ssPtr->getProblemDefinition()->getSolution(sol);
-            // Hack: Planner name represents if the solution was from scratch or recall
-            log(logFilename, sol.plannerName_ + std::string("\n"));
+            simplificationTime = ssPtr->getLastSimplificationTime();
         }
 
-        og::PathGeometric pth = ssPtr->getSolutionPath();
-        *pathCost = pth.length();
-        numInterpolationPoints = (*pathCost) / distanceBetweenPathPoints;
-        if (numInterpolationPoints > 0)
-            pth.interpolate(numInterpolationPoints);
-
-        std::vector< ob::State * > states = pth.getStates();
-        std::vector< double > reals;
-
-        *pathLength = states.size();
-        *path = (PathPose *)malloc(sizeof(PathPose) * states.size());
-        memset(*path, 0, sizeof(PathPose) * states.size());
-
-        for (unsigned i = 0; i < states.size(); i++) {
-            space->copyToReals(reals, states[i]);
-            (*path)[i].x = reals[0];
-            (*path)[i].y = reals[1];
-            (*path)[i].theta = reals[2];
-        }
+        copySolutionPath(ssPtr, space, distanceBetweenPathPoints, path,
+                         pathLength, pathCost);
 
         if (ePtr != NULL) {
             ePtr->doPostProcessing();
             ePtr->saveIfChanged();
-
-            // Log the planning logs to the log file
-            std::ostringstream stream;
-            stream << "\n";
-            ePtr->printLogs(stream);
-            log(logFilename, stream.str());
         }
-
-        std::stringstream pathCostStr;
-        pathCostStr << "Length of computed path = " << *pathCost << std::endl;
-        log(logFilename, pathCostStr.str());
+        logSolution(logFilename, ssPtr, plannerType, *pathCost);
     }
     else {
         std::cout << "No solution found" << std::endl;
@@ -400,21 +585,330 @@ extern "C" bool plan_multiple_circles(
         ssPtr = NULL;
     }
 
-    std::chrono::time_point< std::chrono::system_clock > endTime;
-    std::string endTimeLog = getLogTime("End time", endTime);
-    log(logFilename, getPathToLog(path, *pathLength));
-    log(logFilename, endTimeLog);
+    logPlanEnd(logFilename, mapFilename, mapResolution, startX, startY,
+               startTheta, goalX, goalY, goalTheta, plannerType, mode,
+               isHolonomicRobot, startTime, computationTime,
+               simplificationTime, fromRecall, solved, *pathCost, path,
+               pathLength);
 
-    std::chrono::duration< double > elapsed_seconds = endTime - startTime;
-    std::stringstream ss;
-    ss << "Planning took ";
-    ss << elapsed_seconds.count() << " seconds" << std::endl;
-    log(logFilename, ss.str());
-    log(logFilename, "========================================\n\n");
+    return solved ? 1 : 0;
+}
+
+// A planning session keeps the map, the state space, the planning setup and the
+// experience database loaded between calls, so that planning many problems with
+// the same configuration only pays for the planning itself.
+typedef struct PlannerSession {
+    COccupancyGridMap2D gridMap;
+    std::string mapFilename;
+    double mapResolution;
+    double robotRadius;
+    std::vector< double > xCoords;
+    std::vector< double > yCoords;
+    ob::StateSpacePtr space;
+    og::SimpleSetup *ssPtr;
+    double distanceBetweenPathPoints;
+    double turningRadius;
+    PLANNER_TYPE plannerType;
+    MODE mode;
+    bool isHolonomicRobot;
+    std::string logFilename;
+    bool lastPlanFromRecall;
+    // Without a database file the experiences are only kept in memory
+    bool hasDatabaseFile;
+} PlannerSession;
+
+extern "C" PlannerSession *create_planner_session(
+    const char *mapFilename, double mapResolution, double robotRadius,
+    double *xCoords, double *yCoords, int numCoords,
+    double distanceBetweenPathPoints, double turningRadius,
+    PLANNER_TYPE plannerType, MODE mode, bool isHolonomicRobot,
+    const char *experienceDBPath, const char *logfile)
+{
+    if (plannerType < PLANNER_TYPE::SIMPLE_RRT_CONNECT ||
+        plannerType >= PLANNER_TYPE::PLANNER_TYPE_COUNT ||
+        mode == MODE::REPLANNING) {
+        std::cout << "Planning sessions do not support replanning or an "
+                     "invalid planner type"
+                  << std::endl;
+        return NULL;
+    }
+
+    setupOutputHandler(std::string(logfile), mode);
+
+    PlannerSession *session = new PlannerSession();
+    session->mapFilename = std::string(mapFilename);
+    session->mapResolution = mapResolution;
+    session->robotRadius = robotRadius;
+    session->xCoords.assign(xCoords, xCoords + numCoords);
+    session->yCoords.assign(yCoords, yCoords + numCoords);
+    session->distanceBetweenPathPoints = distanceBetweenPathPoints;
+    session->turningRadius = turningRadius;
+    session->plannerType = plannerType;
+    session->mode = mode;
+    session->isHolonomicRobot = isHolonomicRobot;
+    session->logFilename = std::string(logfile);
+    session->lastPlanFromRecall = false;
+    session->hasDatabaseFile = experienceDBPath[0] != '\0';
+
+    session->gridMap.loadFromBitmapFile(mapFilename, (float)mapResolution,
+                                        0.0f, 0.0f);
+    std::cout << "Loaded map (session) " << mapFilename << std::endl;
+
+    session->space =
+        isHolonomicRobot
+            ? ob::StateSpacePtr(new ob::SE2StateSpace())
+            : ob::StateSpacePtr(new ob::ReedsSheppStateSpace(turningRadius));
+
+    ob::RealVectorBounds bounds(2);
+    bounds.low[0] = session->gridMap.getXMin();
+    bounds.low[1] = session->gridMap.getYMin();
+    bounds.high[0] = session->gridMap.getXMax();
+    bounds.high[1] = session->gridMap.getYMax();
+    session->space->as< ob::SE2StateSpace >()->setBounds(bounds);
+
+    session->ssPtr =
+        getPlanningSetup(plannerType, session->space, experienceDBPath);
+    ob::SpaceInformationPtr si(session->ssPtr->getSpaceInformation());
+    si->setStateValidityChecker(
+        ob::StateValidityCheckerPtr(new MultipleCircleStateValidityChecker(
+            si, &session->gridMap, robotRadius, session->xCoords.data(),
+            session->yCoords.data(), numCoords)));
+    si->setStateValidityCheckingResolution(0.005);
+
+    ompl::tools::ExperienceSetup *ePtr =
+        dynamic_cast< ot::ExperienceSetup * >(session->ssPtr);
+    if (ePtr != NULL) {
+        ompl::base::PlannerPtr repairPlanner(new og::RRTConnect(si));
+        ePtr->setRepairPlanner(repairPlanner);
+
+        // Disable planning from recall if we are generating experiences
+        if (mode == MODE::EXPERIENCE_GENERATION ||
+            mode == MODE::OPTIMAL_PATHS) {
+            ePtr->enablePlanningFromRecall(false);
+        }
+    }
+
+    session->ssPtr->setPlanner(
+        getPlanner(plannerType, mode, si, experienceDBPath));
+    session->ssPtr->setup();
+
+    return session;
+}
+
+extern "C" bool plan_with_session(PlannerSession *session, double startX,
+                                  double startY, double startTheta,
+                                  double goalX, double goalY,
+                                  double goalTheta, PathPose **path,
+                                  int *pathLength, double *pathCost)
+{
+    if (session == NULL) {
+        return false;
+    }
+
+    LOGGING_ACTIVE = session->mode == MODE::NORMAL;
+    log(session->logFilename,
+        getProblemInfo(session->mapFilename.c_str(), session->mapResolution,
+                       session->robotRadius, session->xCoords.data(),
+                       session->yCoords.data(), (int)session->xCoords.size(),
+                       startX, startY, startTheta, goalX, goalY, goalTheta,
+                       path, pathLength, session->distanceBetweenPathPoints,
+                       session->turningRadius, session->plannerType,
+                       session->mode, session->isHolonomicRobot));
+
+    std::chrono::time_point< std::chrono::system_clock > startTime;
+    log(session->logFilename, getLogTime("Start time", startTime));
+
+    og::SimpleSetup *ssPtr = session->ssPtr;
+    ompl::tools::ExperienceSetup *ePtr =
+        dynamic_cast< ot::ExperienceSetup * >(ssPtr);
+
+    // Forget the previous problem but keep the setup and the loaded experiences
+    ssPtr->clear();
+
+    ob::ScopedState<> start(session->space), goal(session->space);
+    start[0] = startX;
+    start[1] = startY;
+    start[2] = startTheta;
+    goal[0] = goalX;
+    goal[1] = goalY;
+    goal[2] = goalTheta;
+    ssPtr->setStartAndGoalStates(start, goal);
+
+    float planningTime =
+        (session->mode == MODE::EXPERIENCE_GENERATION) ? 120.0 : 30.0; // in seconds
+    ob::PlannerStatus solved = ssPtr->solve(planningTime);
+    double computationTime = ssPtr->getLastPlanComputationTime();
+    double simplificationTime = 0.0;
+    int fromRecall = (ePtr != NULL ||
+                      session->plannerType == PLANNER_TYPE::EXPERIENCE_GRAPHS) ? 0 : -1;
+    session->lastPlanFromRecall = false;
+
+    if (solved) {
+        std::cout << "Found solution" << std::endl;
+
+        session->lastPlanFromRecall = isSolutionFromRecall(ssPtr);
+        if (fromRecall == 0 && session->lastPlanFromRecall) {
+            fromRecall = 1;
+        }
+        if (session->plannerType == PLANNER_TYPE::SIMPLE_RRT_CONNECT ||
+            session->plannerType == PLANNER_TYPE::SIMPLE_RRT_STAR ||
+            session->plannerType == PLANNER_TYPE::EXPERIENCE_GRAPHS) {
+            ssPtr->simplifySolution();
+            simplificationTime = ssPtr->getLastSimplificationTime();
+        }
+
+        copySolutionPath(ssPtr, session->space,
+                         session->distanceBetweenPathPoints, path, pathLength,
+                         pathCost);
+
+        if (ePtr != NULL) {
+            ePtr->doPostProcessing();
+            if (session->hasDatabaseFile) {
+                ePtr->saveIfChanged();
+            }
+        }
+        logSolution(session->logFilename, ssPtr, session->plannerType, *pathCost);
+    }
+    else {
+        std::cout << "No solution found" << std::endl;
+    }
+
+    logPlanEnd(session->logFilename, session->mapFilename.c_str(),
+               session->mapResolution, startX, startY, startTheta, goalX,
+               goalY, goalTheta, session->plannerType, session->mode,
+               session->isHolonomicRobot, startTime, computationTime,
+               simplificationTime, fromRecall, solved, *pathCost, path,
+               pathLength);
 
     return solved ? 1 : 0;
 }
 
+extern "C" bool session_plan_from_recall(PlannerSession *session)
+{
+    return session != NULL && session->lastPlanFromRecall;
+}
+
+// Copies the solution of the last plan as the planner found it, without the
+// interpolation of plan_with_session. The poses are freed with cleanupPath.
+extern "C" bool session_last_solution(PlannerSession *session,
+                                      PathPose **path, int *pathLength)
+{
+    if (session == NULL || !session->ssPtr->haveSolutionPath()) {
+        return false;
+    }
+
+    copyPathStates(session->ssPtr->getSolutionPath(), session->space, path,
+                   pathLength);
+    return true;
+}
+
+extern "C" int session_experience_count(PlannerSession *session)
+{
+    if (session == NULL) {
+        return -1;
+    }
+
+    // Only Lightning and Thunder keep the experiences in a database of their own
+    ompl::tools::ExperienceSetup *ePtr =
+        dynamic_cast< ot::ExperienceSetup * >(session->ssPtr);
+    return ePtr != NULL ? (int)ePtr->getExperiencesCount() : -1;
+}
+
+extern "C" void destroy_planner_session(PlannerSession *session)
+{
+    if (session == NULL) {
+        return;
+    }
+
+    ompl::tools::ExperienceSetup *ePtr =
+        dynamic_cast< ot::ExperienceSetup * >(session->ssPtr);
+    if (ePtr != NULL && session->hasDatabaseFile) {
+        ePtr->saveIfChanged();
+    }
+
+    delete session->ssPtr;
+    delete session;
+}
+
+extern "C" bool add_experiences(
+    const char *mapFilename, double mapResolution, double robotRadius,
+    double *xCoords, double *yCoords, int numCoords, double turningRadius,
+    PLANNER_TYPE plannerType, bool isHolonomicRobot, PathPose *poses,
+    int *pathLengths, int numPaths, const char *experienceDBPath)
+{
+    if (plannerType != PLANNER_TYPE::EXPERIENCE_LIGHTNING &&
+        plannerType != PLANNER_TYPE::EXPERIENCE_THUNDER) {
+        std::cout << "Experiences can only be added to Lightning or Thunder "
+                     "databases"
+                  << std::endl;
+        return false;
+    }
+
+    ompl::msg::noOutputHandler();
+
+    ob::StateSpacePtr space =
+        isHolonomicRobot
+            ? ob::StateSpacePtr(new ob::SE2StateSpace())
+            : ob::StateSpacePtr(new ob::ReedsSheppStateSpace(turningRadius));
+
+    COccupancyGridMap2D gridMap;
+    gridMap.loadFromBitmapFile(mapFilename, (float)mapResolution, 0.0f, 0.0f);
+
+    ob::RealVectorBounds bounds(2);
+    bounds.low[0] = gridMap.getXMin();
+    bounds.low[1] = gridMap.getYMin();
+    bounds.high[0] = gridMap.getXMax();
+    bounds.high[1] = gridMap.getYMax();
+    space->as< ob::SE2StateSpace >()->setBounds(bounds);
+
+    og::SimpleSetup *ssPtr =
+        getPlanningSetup(plannerType, space, experienceDBPath);
+    ob::SpaceInformationPtr si(ssPtr->getSpaceInformation());
+    si->setStateValidityChecker(
+        ob::StateValidityCheckerPtr(new MultipleCircleStateValidityChecker(
+            si, &gridMap, robotRadius, xCoords, yCoords, numCoords)));
+    si->setStateValidityCheckingResolution(0.005);
+    ssPtr->setup();
+
+    int offset = 0;
+    int numAdded = 0;
+    ob::State *state = si->allocState();
+    for (int p = 0; p < numPaths; p++) {
+        og::PathGeometric path(si);
+        for (int i = offset; i < offset + pathLengths[p]; i++) {
+            ob::SE2StateSpace::StateType *se2 =
+                state->as< ob::SE2StateSpace::StateType >();
+            se2->setXY(poses[i].x, poses[i].y);
+            se2->setYaw(poses[i].theta);
+            path.append(state);
+        }
+        offset += pathLengths[p];
+
+        if (path.getStateCount() < 2) {
+            continue;
+        }
+
+        double insertionTime = 0.0;
+        if (plannerType == PLANNER_TYPE::EXPERIENCE_LIGHTNING) {
+            static_cast< ot::Lightning * >(ssPtr)->getExperienceDB()->addPath(
+                path, insertionTime);
+        }
+        else {
+            static_cast< ot::Thunder * >(ssPtr)->getExperienceDB()->addPath(
+                path, insertionTime);
+        }
+        numAdded++;
+    }
+    si->freeState(state);
+
+    dynamic_cast< ot::ExperienceSetup * >(ssPtr)->save();
+    std::cout << "Added " << numAdded << " experiences to "
+              << experienceDBPath << std::endl;
+
+    delete ssPtr;
+    return true;
+}
+
 extern "C" bool plan_multiple_circles_nomap(
     double *xCoords, double *yCoords, int numCoords, double startX,
     double startY, double startTheta, double goalX, double goalY,
@@ -0,0 +1,245 @@
+import os
+import sys
+import json
+import sqlite3
+import hashlib
+import datetime
+import argparse
+
+# Builds the paths of everything that is generated below generated/ and keeps an index
+# of the generated files in a SQLite database (generated/ArtifactRegistry.db). Every
+# artifact is stored with the configuration it was generated for, the hash, size and
+# modification time of its content and the artifacts it was generated from, for example
+# the training dataset of an experience database. The tools register their
+# outputs when they are done, so outdated or missing artifacts can be found with a query
+# instead of walking the directories:
+#
+#   python3 artifactRegistry.py stale
+#   python3 artifactRegistry.py missing
+#   python3 artifactRegistry.py list --kind=experienceDB
+#
+# The paths of the Java tests are built in CustomTesting and have to match the ones here.
+
+root_dir = os.path.dirname(os.path.abspath(__file__))
+generated_dir = os.path.join(root_dir, "generated")
+registry_filepath = os.path.join(generated_dir, "ArtifactRegistry.db")
+
+planner_names = ["SIMPLE(RRT-Connect)", "Lightning", "Thunder", "EGraphs", "SIMPLE(RRT-Star)"]
+experienceDB_names = {1: "Lightning.db", 2: "Thunder.db"}
+
+def get_sampling_name(uniform):
+    return "Uniform" if uniform else "UsingHotspots"
+
+def get_kinematics_name(constrained):
+    return "ReedsSheep" if constrained else "Holonomic"
+
+def get_map_filepath(map_filename):
+    return os.path.join(root_dir, "maps", map_filename)
+
+def get_training_data_dir(uniform):
+    return os.path.join(generated_dir, "trainingData", "UniformSampling" if uniform else "UsingHospots")
+
+def get_training_dataset_filepath(map_name, count, uniform):
+    return os.path.join(get_training_data_dir(uniform), map_name + "-" + str(count) + "Problems.txt")
+
+def get_testing_data_dir():
+    return os.path.join(generated_dir, "testingData")
+
+def get_testing_dataset_filepath(map_name, count):
+    return os.path.join(get_testing_data_dir(), map_name + "-" + str(count) + "Problems.txt")
+
+def get_optimality_data_dir():
+    return os.path.join(get_testing_data_dir(), "Optimality")
+
+def get_optimality_dir(planner_name, map_name, count):
+    '''Optimal paths of the testing dataset of map_name with count problems, found by planner_name.'''
+    return os.path.join(get_optimality_data_dir(), planner_name, map_name + "-" + str(count) + "Problems")
+
+def get_optimality_store_dir(planner_name, map_name):
+    '''Optimal paths of all the problems planned on map_name by planner_name, one file per input hash.'''
+    return os.path.join(get_optimality_data_dir(), planner_name, map_name + "-Solutions")
+
+def get_experienceDB_dir(map_name, nExperiences, uniform, constrained, planner):
+    directory = os.path.join(generated_dir, "experienceDBs", map_name, str(nExperiences)+"_TrainingExperiences",
+                             get_sampling_name(uniform), get_kinematics_name(constrained))
+    # The EGraphs database is a directory of paths
+    if planner == 3:
+        directory = os.path.join(directory, planner_names[planner])
+    return directory
+
+def get_experienceDB_path(map_name, nExperiences, uniform, constrained, planner):
+    '''Same as CustomTesting.getExperienceDBName, None for the planners without a database.'''
+    directory = get_experienceDB_dir(map_name, nExperiences, uniform, constrained, planner)
+    if planner == 3:
+        return directory
+    if planner in experienceDB_names:
+        return os.path.join(directory, experienceDB_names[planner])
+    return None
+
+def get_temp_experienceDB_dir(map_name, count, uniform, constrained, planner):
+    '''Experience databases filled while the optimal paths of a testing dataset are searched.'''
+    directory = os.path.join(generated_dir, "tempExpDB", map_name, str(count)+"_optimalityExperiences",
+                             get_sampling_name(uniform), get_kinematics_name(constrained))
+    if planner == 3:
+        directory = os.path.join(directory, planner_names[planner])
+    return directory
+
+def get_execution_dir(map_name, planner_name, nRobots, constrained, uniform, nExperiences):
+    return os.path.join(generated_dir, "executionData", map_name, planner_name, str(nRobots)+"_Robots",
+                        get_kinematics_name(constrained), get_sampling_name(uniform), str(nExperiences)+"_TrainingExperiences")
+
+def get_execution_log_dir(map_name, planner_name, nRobots, constrained, uniform, nExperiences):
+    return os.path.join(get_execution_dir(map_name, planner_name, nRobots, constrained, uniform, nExperiences), "Logs")
+
+def hash_file(filepath):
+    sha = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def hash_artifact(path):
+    # The files of a directory are hashed in a fixed order together with their names
+    if os.path.isfile(path):
+        return hash_file(path), os.path.getsize(path)
+    sha = hashlib.sha256()
+    size = 0
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for file in sorted(files):
+            filepath = os.path.join(root, file)
+            sha.update(os.path.relpath(filepath, path).encode())
+            sha.update(hash_file(filepath).encode())
+            size += os.path.getsize(filepath)
+    return sha.hexdigest(), size
+
+def get_modification_time(path):
+    if os.path.isfile(path):
+        return os.path.getmtime(path)
+    return max([os.path.getmtime(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files],
+               default=os.path.getmtime(path))
+
+class ArtifactRegistry():
+    def __init__(self, filepath=registry_filepath):
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        # Several tools may register their artifacts at the same time, for example the jobs of a campaign
+        self.connection = sqlite3.connect(filepath, timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        with self.connection:
+            self.connection.execute('''CREATE TABLE IF NOT EXISTS artifacts (
+                                       path TEXT PRIMARY KEY, kind TEXT NOT NULL, config TEXT NOT NULL,
+                                       sha256 TEXT NOT NULL, size INTEGER NOT NULL, modified REAL NOT NULL,
+                                       changed TEXT NOT NULL, registered TEXT NOT NULL)''')
+            self.connection.execute('''CREATE TABLE IF NOT EXISTS sources (
+                                       path TEXT NOT NULL, source TEXT NOT NULL, PRIMARY KEY (path, source))''')
+            self.connection.execute("CREATE INDEX IF NOT EXISTS artifacts_config ON artifacts (kind, config)")
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def get_key(path):
+        # Paths are stored relative to the repository, so the registry stays valid when it is moved
+        return os.path.relpath(os.path.abspath(path), root_dir)
+
+    def register(self, kind, path, config, sources=()):
+        '''Records the current content of the file or directory at path as the artifact of
+        the given kind generated for config (a dict), and the artifacts it was generated from.'''
+        key = self.get_key(path)
+        sha256, size = hash_artifact(path)
+        now = datetime.datetime.now().isoformat(timespec="seconds")
+        with self.connection:
+            row = self.connection.execute("SELECT sha256, changed FROM artifacts WHERE path = ?", (key,)).fetchone()
+            # The time of the last change of the content, the artifacts generated from this one
+            # before that time are stale
+            changed = row[1] if row is not None and row[0] == sha256 else now
+            self.connection.execute("INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                    (key, kind, json.dumps(config, sort_keys=True), sha256, size,
+                                     get_modification_time(path), changed, now))
+            self.connection.execute("DELETE FROM sources WHERE path = ?", (key,))
+            self.connection.executemany("INSERT OR IGNORE INTO sources VALUES (?, ?)",
+                                        [(key, self.get_key(s)) for s in sources if s is not None])
+        return sha256
+
+    def find(self, kind, config):
+        '''Path of the artifact of the given kind that was generated for config, or None.'''
+        row = self.connection.execute("SELECT path FROM artifacts WHERE kind = ? AND config = ?",
+                                      (kind, json.dumps(config, sort_keys=True))).fetchone()
+        return os.path.join(root_dir, row[0]) if row is not None else None
+
+    def list(self, kind=None):
+        query = "SELECT path, kind, config, sha256, size, changed FROM artifacts"
+        if kind is not None:
+            return self.connection.execute(query + " WHERE kind = ? ORDER BY path", (kind,)).fetchall()
+        return self.connection.execute(query + " ORDER BY kind, path").fetchall()
+
+    def find_stale(self):
+        '''Artifacts whose sources changed after them, with the changed source.'''
+        return self.connection.execute('''SELECT a.path, s.path FROM artifacts a
+                                          JOIN sources d ON d.path = a.path
+                                          JOIN artifacts s ON s.path = d.source
+                                          WHERE s.changed > a.registered ORDER BY a.path''').fetchall()
+
+    def find_missing(self):
+        '''Registered artifacts that no longer exist, and sources that were never registered.'''
+        missing = [(path, "deleted") for path, in self.connection.execute("SELECT path FROM artifacts ORDER BY path")
+                   if not os.path.exists(os.path.join(root_dir, path))]
+        missing.extend((source, "not registered, source of " + path) for path, source in self.connection.execute(
+                       '''SELECT d.path, d.source FROM sources d LEFT JOIN artifacts s ON s.path = d.source
+                          WHERE s.path IS NULL ORDER BY d.source'''))
+        return missing
+
+    def find_modified(self):
+        '''Artifacts that were changed without being registered again.'''
+        return [path for path, modified in self.connection.execute("SELECT path, modified FROM artifacts ORDER BY path")
+                if os.path.exists(os.path.join(root_dir, path)) and get_modification_time(os.path.join(root_dir, path)) != modified]
+
+def register_artifact(kind, path, config, sources=()):
+    # Registering is bookkeeping, a failure must not fail the tool that generated the artifact
+    if not os.path.exists(path):
+        print("Could not register missing artifact", path)
+        return
+    try:
+        with ArtifactRegistry() as registry:
+            registry.register(kind, path, config, sources)
+    except (sqlite3.Error, OSError) as exc:
+        print("Could not register artifact {}: {}".format(path, exc))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("query", type=str, choices=["list", "stale", "missing", "modified"], help="Artifacts to print")
+    parser.add_argument("--kind", type=str, help="Only list the artifacts of this kind (ex. experienceDB)", default=None)
+    args = parser.parse_args()
+
+    if not os.path.isfile(registry_filepath):
+        print("No artifacts registered yet at", registry_filepath)
+        return
+
+    with ArtifactRegistry() as registry:
+        if args.query == "list":
+            for path, kind, config, sha256, size, changed in registry.list(args.kind):
+                print("{:<14} {} ({} bytes, changed {}, sha256 {})\n{:<14} {}".format(kind, path, size, changed, sha256[:12], "", config))
+        elif args.query == "stale":
+            rows = registry.find_stale()
+            for path, source in rows:
+                print(path, "is older than its source", source)
+        elif args.query == "modified":
+            rows = registry.find_modified()
+            for path in rows:
+                print(path, "was changed since it was registered")
+        else:
+            rows = registry.find_missing()
+            for path, reason in rows:
+                print(path, reason)
+        if args.query != "list":
+            print(len(rows), "{} artifacts".format(args.query))
+            sys.exit(1 if len(rows) > 0 else 0)
+
+if __name__ == "__main__":
+    main()
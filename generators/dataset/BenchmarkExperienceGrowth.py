@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import numpy as np
+import os
+import sys
+import argparse
+import shutil
+import time
+import pandas as pd
+import OmplWrapper
+from GenerateExperiences import OMPL_Wrapper as Training_OMPL_Wrapper, get_footprint, planner_names
+from ProblemSet import get_binary_filepath, load_testing_problem_set
+import artifactRegistry
+
+# Builds an experience database of increasing sizes by appending the problems of a
+# training dataset to it, and replays a fixed testing set against every size in the
+# normal planning mode to measure how recall and planning time scale with the database.
+
+class Replay_OMPL_Wrapper(OmplWrapper.OMPL_Wrapper):
+    mode = OmplWrapper.NORMAL_MODE
+
+def get_database_size(database_path):
+    if os.path.isdir(database_path):
+        return sum(os.path.getsize(os.path.join(database_path, f)) for f in os.listdir(database_path))
+    return os.path.getsize(database_path) if os.path.isfile(database_path) else 0
+
+def remove_database(database_path):
+    if os.path.isdir(database_path):
+        shutil.rmtree(database_path)
+    elif os.path.isfile(database_path):
+        os.remove(database_path)
+
+def copy_database(database_path, copy_path):
+    remove_database(copy_path)
+    if os.path.isdir(database_path):
+        shutil.copytree(database_path, copy_path)
+    elif os.path.isfile(database_path):
+        shutil.copy(database_path, copy_path)
+
+class ExperienceGrowthBenchmark():
+    def __init__(self, args, map_filepath, training_dataset, testing_dataset, output_dir):
+        self.args = args
+        self.map_filepath = map_filepath
+        self.output_dir = output_dir
+        self.footprint = get_footprint(args)
+        self.testing_problems = load_testing_problem_set(testing_dataset)
+
+        name = planner_names[args.planner_type]
+        self.database_path = os.path.join(output_dir, name)
+        self.replay_database_path = os.path.join(output_dir, "Replay_" + name)
+        self.replay_logfile = os.path.join(output_dir, "Replay.log")
+        remove_database(self.database_path)
+        if args.planner_type == 3:
+            os.makedirs(self.database_path)
+
+        self.trainer = Training_OMPL_Wrapper(map_filepath, self.footprint, args.robot_radius, args.turning_radius,
+                                             args.dist_between_points, args.planner_type, "",
+                                             not args.non_holonomic, training_dataset, self.database_path)
+        assert self.trainer.training_problems.shape[0] >= max(args.sizes), \
+            "The training dataset has less problems than the largest database size"
+
+    def grow_database(self, start_index, end_index):
+        # Only the problems added since the previous size are planned, into the same database
+        for p_idx in range(start_index, end_index):
+            self.trainer.invoke(self.trainer.start_training_poses[p_idx], self.trainer.goal_training_poses[p_idx])
+        # Closing the session saves the database to the disk
+        self.trainer.close_session()
+
+    def replay_testing_set(self):
+        copy_database(self.database_path, self.replay_database_path)
+        args = self.args
+        replay = Replay_OMPL_Wrapper(self.map_filepath, self.footprint, args.robot_radius, args.turning_radius,
+                                     args.dist_between_points, args.planner_type, self.replay_logfile,
+                                     not args.non_holonomic, self.replay_database_path)
+
+        load_start = time.perf_counter()
+        replay.open_session()
+        load_time = time.perf_counter() - load_start
+
+        planning_times = []
+        from_recall = []
+        solved = []
+        for p_idx in range(self.testing_problems.shape[0]):
+            plan_start = time.perf_counter()
+            _, path = replay.invoke(self.testing_problems[p_idx, 0], self.testing_problems[p_idx, 1])
+            planning_times.append(time.perf_counter() - plan_start)
+            solved.append(path.shape[0] > 0)
+            from_recall.append(solved[-1] and replay.last_plan_from_recall())
+        replay.close_session()
+
+        return load_time, np.array(planning_times), np.array(from_recall), np.array(solved)
+
+    def run(self):
+        rows = []
+        previous_size = 0
+        for size in sorted(self.args.sizes):
+            print("\n============ Growing the database to", size, "experiences ============")
+            self.grow_database(previous_size, size)
+            previous_size = size
+
+            print("\n============ Replaying", self.testing_problems.shape[0], "testing problems ============")
+            load_time, planning_times, from_recall, solved = self.replay_testing_set()
+            rows.append({"Map": os.path.splitext(self.args.map_filename)[0],
+                         "Planner": planner_names[self.args.planner_type],
+                         "SamplingStrategy": "Uniform" if self.args.uniform_sampling else "UsingHotspots",
+                         "Kinematics": "ReedsSheep" if self.args.non_holonomic else "Holonomic",
+                         "NumExperiences": size,
+                         "DatabaseBytes": get_database_size(self.database_path),
+                         "LoadTime": load_time,
+                         "NumQueries": planning_times.size,
+                         "SuccessRate": np.mean(solved),
+                         "RecallRate": np.mean(from_recall),
+                         "PlanningTimeMean": np.mean(planning_times),
+                         "PlanningTimeP50": np.percentile(planning_times, 50),
+                         "PlanningTimeP90": np.percentile(planning_times, 90),
+                         "PlanningTimeP99": np.percentile(planning_times, 99)})
+            print(rows[-1])
+
+        remove_database(self.replay_database_path)
+        return pd.DataFrame(rows)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("map_filename", type=str, help="Filename of the map image that should be used for the benchmark (ex. map1.png)")
+    parser.add_argument("--sizes", nargs="*", type=int, help="Database sizes (number of experiences) to benchmark", default=[10, 25, 50, 100])
+    parser.add_argument("--training_count", type=int, help="Number of problems in the training dataset the experiences are taken from. Default: largest size", default=None)
+    parser.add_argument("--testing_count", type=int, help="Number of robots in the testing dataset that is replayed. Default: 10", default=10)
+    parser.add_argument("--robot_radius", type=float, help="Radius of the robot (in pixels) to be used for collision detection", default=0.1)
+    parser.add_argument("--turning_radius", type=float, help="Turning radius of the vehicle in case of ReedsSheep type car", default=4.0)
+    parser.add_argument("--dist_between_points", type=float, help="Max distance between two poses in the generated path", default=0.3)
+    parser.add_argument("--planner_type", type=int, help="Type of experience based planner (LIGHTNING:1, THUNDER:2, EGRAPHS:3), Default: Lightning", default=1)
+    parser.add_argument("--non_holonomic", type=bool, help="Flag to specify if the robot is non_holonomic. Default: False", default=False)
+    parser.add_argument("--footprint", nargs="*", type=float, help="Robot footprint as a list of xmin xmax ymin ymax", default=[-0.25, 0.25, -0.25, 0.25])
+    parser.add_argument("--uniform_sampling", type=bool, help="Use the training dataset generated with uniform sampling of the map. Default: False (hotspots used)", default=False)
+    args = parser.parse_args()
+
+    assert args.planner_type in [1, 2, 3], "Only the experience based planners can be benchmarked"
+
+    root_dir = os.path.abspath(os.path.split(os.path.abspath(sys.argv[0]))[0]  + "/../../")
+    map_filepath = os.path.abspath(root_dir + "/maps/" + args.map_filename)
+    map_name = os.path.splitext(args.map_filename)[0]
+
+    training_count = args.training_count if args.training_count is not None else max(args.sizes)
+    training_dataset = artifactRegistry.get_training_dataset_filepath(map_name, training_count, args.uniform_sampling)
+    if not os.path.isfile(training_dataset) and not os.path.isfile(get_binary_filepath(training_dataset)):
+        print("Could not find training dataset file at", training_dataset)
+        return
+
+    testing_dataset = artifactRegistry.get_testing_dataset_filepath(map_name, args.testing_count)
+    if not os.path.isfile(testing_dataset):
+        print("Could not find testing dataset file at", testing_dataset)
+        return
+
+    output_dir = os.path.join(artifactRegistry.generated_dir, "benchmarks", map_name, "ExperienceGrowth",
+                              artifactRegistry.get_sampling_name(args.uniform_sampling),
+                              artifactRegistry.get_kinematics_name(args.non_holonomic))
+    os.makedirs(output_dir, exist_ok=True)
+
+    benchmark = ExperienceGrowthBenchmark(args, map_filepath, training_dataset, testing_dataset, output_dir)
+    results = benchmark.run()
+
+    results_filepath = os.path.join(output_dir, os.path.splitext(planner_names[args.planner_type])[0] + "_Growth.csv")
+    results.to_csv(results_filepath, index=False)
+    print("\nBenchmark results saved to", results_filepath)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import sys
+import argparse
+import time
+import OmplWrapper
+from GenerateExperiences import get_footprint
+from ProblemSet import load_testing_problem_set
+import artifactRegistry
+
+# Long-run memory check of the planning library binding. The problems of a testing
+# dataset are planned over and over in one planning session, and the resident memory
+# of the process is sampled while planning. Every returned path is allocated by the
+# library and has to be freed again, so the resident memory has to stay flat once the
+# planner and the allocator have warmed up. Exits with 1 if it grew by more than the
+# allowed bound. Only works on Linux, since it reads /proc.
+
+class Memory_OMPL_Wrapper(OmplWrapper.OMPL_Wrapper):
+    mode = OmplWrapper.NORMAL_MODE
+
+def get_resident_memory():
+    # In bytes, the second field of statm is the number of resident pages
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def check_path_memory(ompl_wrapper, problems, n_plans, n_warmup, sample_interval):
+    '''Plans n_plans problems and returns the resident memory after the warm up and at
+    the end, in bytes, and the mean size of the returned paths.'''
+    baseline = None
+    # Only the sum is kept, a list of the sizes would grow the memory itself
+    total_path_bytes = 0
+    start_time = time.time()
+    for i in range(n_plans):
+        start, goal = problems[i % problems.shape[0]]
+        _, path = ompl_wrapper.invoke(start, goal)
+        total_path_bytes += path.nbytes
+        if i + 1 == n_warmup:
+            baseline = get_resident_memory()
+        if (i + 1) % sample_interval == 0 or i + 1 == n_plans:
+            rss = get_resident_memory()
+            growth = "" if baseline is None else ", {:+.2f} MB since the warm up".format((rss - baseline) / 2**20)
+            print("{:>6}/{} plans: resident memory {:.2f} MB{} ({:.1f} s)".format(i + 1, n_plans, rss / 2**20, growth,
+                                                                                  time.time() - start_time))
+    return baseline, get_resident_memory(), total_path_bytes / n_plans
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("map_filename", type=str, help="Filename of the map image that should be used for planning (ex. map1.png)")
+    parser.add_argument("--robot_radius", type=float, help="Radius of the robot (in pixels) to be used for collision detection", default=0.1)
+    parser.add_argument("--turning_radius", type=float, help="Turning radius of the vehicle in case of ReedsSheep type car", default=4.0)
+    parser.add_argument("--dist_between_points", type=float, help="Max distance between two poses in the generated path", default=0.3)
+    parser.add_argument("--planner_type", type=int, choices=[0, 4], help="Type of planner to be used (SIMPLE_RRT-Connect: 0, SIMPLE_RRT-Star: 4). The experience based planners grow their database while planning. Default: RRT-Connect", default=0)
+    parser.add_argument("--non_holonomic", type=bool, help="Flag to specify if the robot is non_holonomic. Default: False", default=False)
+    parser.add_argument("--count", type=int, help="Number of problems present in the testing dataset. Default: 10", default=10)
+    parser.add_argument("--footprint", nargs="*", type=float, help="Robot footprint as a list of xmin xmax ymin ymax", default=[-0.25, 0.25, -0.25, 0.25])
+    parser.add_argument("--nPlans", type=int, help="Number of plans. Default: 10000", default=10000)
+    parser.add_argument("--nWarmup", type=int, help="Number of plans before the resident memory is expected to stay flat. Default: 1000", default=1000)
+    parser.add_argument("--sample_interval", type=int, help="Number of plans between two samples of the resident memory. Default: 1000", default=1000)
+    parser.add_argument("--max_growth", type=float, help="Allowed growth of the resident memory after the warm up in MB. Default: 4", default=4.0)
+    args = parser.parse_args()
+
+    assert args.nWarmup < args.nPlans, "The warm up has to be shorter than the run"
+    map_filepath = artifactRegistry.get_map_filepath(args.map_filename)
+    map_name = os.path.splitext(args.map_filename)[0]
+    testing_dataset = artifactRegistry.get_testing_dataset_filepath(map_name, args.count)
+    if not os.path.isfile(testing_dataset):
+        print("Could not find testing dataset file at", testing_dataset)
+        return
+
+    # Without a log file the library does not write any logs
+    ompl_wrapper = Memory_OMPL_Wrapper(map_filepath, get_footprint(args), args.robot_radius, args.turning_radius,
+                                       args.dist_between_points, args.planner_type, "", not args.non_holonomic, "")
+
+    print("\n============ Planning", args.nPlans, "problems in one session ============")
+    baseline, final, mean_path_bytes = check_path_memory(ompl_wrapper, load_testing_problem_set(testing_dataset),
+                                                         args.nPlans, args.nWarmup, args.sample_interval)
+    ompl_wrapper.close_session()
+
+    growth = final - baseline
+    n_measured = args.nPlans - args.nWarmup
+    # Leaking every path would grow the resident memory by about the mean path size per plan
+    print("Resident memory grew by {:.2f} MB over the last {} plans ({:.0f} bytes per plan, the mean path has {:.0f} bytes)".format(
+          growth / 2**20, n_measured, growth / n_measured, mean_path_bytes))
+    if growth > args.max_growth * 2**20:
+        print("Resident memory grew by more than", args.max_growth, "MB")
+        sys.exit(1)
+    print("Resident memory stayed flat")
+
+if __name__ == "__main__":
+    main()
@@ -7,116 +7,252 @@ import os
 import errno
 import sys
 import pandas as pd
-import yaml
 import argparse
 import shutil
+import hashlib
+import datetime
+import yaml
+from ProblemSet import get_binary_filepath, load_problem_set, load_text_problem_set
+import OmplWrapper
+from OmplWrapper import PathPose, as_pose_pointer
+from PlanningJobs import PlanningJobScheduler
+import artifactRegistry
+
+planner_names = ["SIMPLE(RRT-Connect)", "Lightning.db", "Thunder.db", "EGraphs", "SIMPLE(RRT-Star)"]
+staging_dirname = "staging"
+
+def init_training_worker(slot, seed, wrapper_kwargs, workers_dir):
+    if wrapper_kwargs["planner_type"] != 3:
+        # Lightning and Thunder workers plan without a database file. The solutions are sent
+        # back as the planners found them and inserted into the final database in one go.
+        ompl_wrapper = OMPL_Wrapper(**dict(wrapper_kwargs, experienceDBPath=""))
+        ompl_wrapper.set_seed(seed)
+
+        def solve_training_problem(p_idx):
+            success, path = ompl_wrapper.solve_training_problem(p_idx)
+            return success, ompl_wrapper.last_solution() if success else path
+        return solve_training_problem
 
-# A class to receive the array of poses from the shared libarary
-class PathPose(Structure):
-    _fields_=[("x", c_double),
-              ("y", c_double),
-              ("theta", c_double)]
+    # EGraphs write every experience to its own file while planning, so a worker killed in
+    # the middle of a job can leave a partial file behind. The worker plans into a staging
+    # directory and the experiences of a solved problem are renamed into the worker
+    # directory, which is the only one that gets merged. A replaced worker gets a new one.
+    worker_dir = os.path.join(workers_dir, "worker_{}_{}".format(slot, seed))
+    staging_dir = os.path.join(worker_dir, staging_dirname)
+    os.makedirs(staging_dir)
+    ompl_wrapper = OMPL_Wrapper(**dict(wrapper_kwargs, experienceDBPath=staging_dir))
+    ompl_wrapper.set_seed(seed)
+
+    def solve_training_problem(p_idx):
+        # Leftovers of a problem that failed with an exception
+        for f in os.listdir(staging_dir):
+            os.remove(os.path.join(staging_dir, f))
+        success, path = ompl_wrapper.solve_training_problem(p_idx)
+        if success:
+            for f in os.listdir(staging_dir):
+                os.rename(os.path.join(staging_dir, f), os.path.join(worker_dir, "{}_{}".format(p_idx, f)))
+        return success, path
+    return solve_training_problem
+
+# The manifest next to a database records which prefix of the training dataset it contains
+def get_manifest_filepath(database_path):
+    return database_path.rstrip('/') + "-Manifest.yaml"
+
+def get_problems_hash(problems):
+    # Rounded so that the text and the binary copy of a dataset give the same hash
+    return hashlib.sha256(np.round(np.ascontiguousarray(problems, dtype=np.float64), 9).tobytes()).hexdigest()
+
+def load_manifest(database_path):
+    filepath = get_manifest_filepath(database_path)
+    if not os.path.isfile(filepath):
+        return None
+    with open(filepath, 'r') as f:
+        return yaml.safe_load(f)
+
+def copy_database(source_path, database_path):
+    if os.path.isdir(source_path):
+        for f in os.listdir(source_path):
+            shutil.copy(os.path.join(source_path, f), os.path.join(database_path, f))
+    else:
+        shutil.copy(source_path, database_path)
+
+class OMPL_Wrapper(OmplWrapper.OMPL_Wrapper):
+    mode = OmplWrapper.EXPERIENCE_GENERATION_MODE
 
-class OMPL_Wrapper():
     def __init__(self, map_filepath,
                  robot_footprint, robot_radius, turning_radius,
                  dist_between_points, planner_type, logfile,
                  is_holonomic_robot, training_data_file_name,
                  experienceDBPath, libname = 'libomplMotionPlanner.so'):
-        self.map_filepath = map_filepath.encode(encoding='utf-8')
-        self.robot_radius = c_double(robot_radius)
-        self.turning_radius = c_double(turning_radius)
-        self.dist_between_points = c_double(dist_between_points)
-        self.planner_type = c_int(planner_type)
-        self.logfile = logfile.encode(encoding='utf-8')
-        self.is_holonomic_robot = c_bool(is_holonomic_robot)
-        self.experienceDBPath = experienceDBPath.encode(encoding='utf-8')
-
-        self.generate_collision_centers(robot_footprint)
-        self.load_shared_library(libname)
-        self.load_training_dataset(training_data_file_name)
+        super().__init__(map_filepath, robot_footprint, robot_radius, turning_radius,
+                         dist_between_points, planner_type, logfile,
+                         is_holonomic_robot, experienceDBPath, libname)
+        # Only the parallel training of Lightning and Thunder keeps the paths, to merge them
+        self.training_paths = {}
+        self.base_experiences = 0
+        # Keep the arguments to be able to create the same wrapper in the worker processes
+        self.wrapper_kwargs = {"map_filepath": map_filepath, "robot_footprint": robot_footprint,
+                               "robot_radius": robot_radius, "turning_radius": turning_radius,
+                               "dist_between_points": dist_between_points, "planner_type": planner_type,
+                               "logfile": logfile, "is_holonomic_robot": is_holonomic_robot,
+                               "training_data_file_name": training_data_file_name,
+                               "experienceDBPath": experienceDBPath, "libname": libname}
 
-        yaml_file_path = os.path.splitext(map_filepath)[0] + ".yaml"
-        self.map_resolution = c_double(self.get_YAML_data(yaml_file_path)['resolution'])
-
-    def get_YAML_data(self, filepath):
-        data = None
-        with open(filepath, 'r') as stream:
-            try:
-                data = yaml.safe_load(stream)
-            except yaml.YAMLError as exc:
-                print(exc)
-        return data
+        self.load_training_dataset(training_data_file_name)
+        self.solved = np.zeros(self.training_problems.shape[0], dtype=bool)
 
     def load_training_dataset(self, training_data_filename):
-        df = pd.read_csv(training_data_filename, header=None, sep='\t', usecols=[1,2,3])
-        data = df.values
-        nProblems = int(data.shape[0]/2)
-        self.start_training_poses = data[:nProblems, :]
-        self.goal_training_poses = data[nProblems:, :]
-
-    def generate_collision_centers(self, robot_footprint):
-        xCoords = []
-        yCoords = []
-        for i in range(robot_footprint.shape[0]):
-            start = robot_footprint[i - 1]
-            end = robot_footprint[i]
-            xLen = np.abs(start[0] - end[0])
-            yLen = np.abs(start[1] - end[1])
-
-            numSamples = 4
-            xCoords.extend(np.linspace(start[0], end[0], numSamples).tolist())
-            yCoords.extend(np.linspace(start[1], end[1], numSamples).tolist())
-
-        self.n_collsion_centers = len(xCoords)
-        DoublesArray = c_double * self.n_collsion_centers
-        self.collision_centers_x = (c_double * len(xCoords))(*xCoords)
-        self.collision_centers_y = (c_double * len(yCoords))(*yCoords)
+        # Prefer the binary problem set since it is memory mapped and the problems
+        # are then only read from the disk when they are planned for
+        binary_filename = get_binary_filepath(training_data_filename)
+        if os.path.isfile(binary_filename):
+            print("Using binary training dataset", binary_filename)
+            self.training_problems = load_problem_set(binary_filename)
+        else:
+            self.training_problems = load_text_problem_set(training_data_filename)
+        self.start_training_poses = self.training_problems[:, 0, :]
+        self.goal_training_poses = self.training_problems[:, 1, :]
 
     def load_shared_library(self, lib_name):
-        self.cdll = cdll.LoadLibrary(lib_name)
+        super().load_shared_library(lib_name)
 
         # Function signature:
-        # extern "C" bool plan_multiple_circles(
+        # extern "C" bool add_experiences(
         #     const char *mapFilename, double mapResolution, double robotRadius,
-        #     double *xCoords, double *yCoords, int numCoords, double startX,
-        #     double startY, double startTheta, double goalX, double goalY,
-        #     double goalTheta, PathPose **path, int *pathLength, double* pathCost,
-        #     double distanceBetweenPathPoints, double turningRadius,
-        #     PLANNER_TYPE plannerType, MODE mode, bool isHolonomicRobot,
-        #     const char *experienceDBPath, const char *logfile)
-        self.cdll.plan_multiple_circles.arguments = [c_char_p, c_double,
-                                       c_double, POINTER(c_double), POINTER(c_double), 
-                                       c_int, c_double, c_double, 
-                                       c_double, c_double, c_double, 
-                                       c_double, POINTER(POINTER(PathPose)), POINTER(c_int), 
-                                       POINTER(c_double), c_double, c_double, 
-                                       c_int, c_int, c_bool,
-                                       c_char_p, c_char_p]
-        self.cdll.plan_multiple_circles.restype = c_bool
-
-    def invoke(self, start, goal):
-        # Preparing to receive array of structs from the library
-        path = POINTER(PathPose)()
-        path_length = c_int(0)
-        path_cost = c_double(0)
-        mode = 2 # Corresponds to the experience generation mode
-
-        self.cdll.plan_multiple_circles(self.map_filepath, self.map_resolution, self.robot_radius,
-                                        self.collision_centers_x, self.collision_centers_y, self.n_collsion_centers,
-                                        c_double(start[0]), c_double(start[1]), c_double(start[2]),
-                                        c_double(goal[0]), c_double(goal[1]), c_double(goal[2]),
-                                        byref(path), byref(path_length), byref(path_cost), self.dist_between_points,
-                                        self.turning_radius, self.planner_type, mode, self.is_holonomic_robot,
-                                        self.experienceDBPath, self.logfile)
-
-    def start_training(self):
+        #     double *xCoords, double *yCoords, int numCoords, double turningRadius,
+        #     PLANNER_TYPE plannerType, bool isHolonomicRobot, PathPose *poses,
+        #     int *pathLengths, int numPaths, const char *experienceDBPath)
+        self.cdll.add_experiences.argtypes = [c_char_p, c_double, c_double,
+                                       POINTER(c_double), POINTER(c_double), c_int, c_double,
+                                       c_int, c_bool, POINTER(PathPose),
+                                       POINTER(c_int), c_int, c_char_p]
+        self.cdll.add_experiences.restype = c_bool
+
+    def start_training(self, start_index=0):
         print("\n============ Starting Training ============")
-        n_training_problems = self.start_training_poses.shape[0]
-        for p_idx in range(n_training_problems):
+        n_training_problems = self.training_problems.shape[0]
+        if start_index > 0:
+            print("Resuming training from problem", start_index+1)
+        for p_idx in range(start_index, n_training_problems):
             print("\n----------- Problem", p_idx+1, "/", n_training_problems, "-----------")
-            self.invoke(self.start_training_poses[p_idx], self.goal_training_poses[p_idx])
+            _, path = self.invoke(self.start_training_poses[p_idx], self.goal_training_poses[p_idx])
+            self.solved[p_idx] = path.shape[0] > 0
+        self.close_session()
+        print("\n============ Training Complete ============")
+
+    def count_experiences(self):
+        if self.planner_type.value == 3:
+            # Every EGraphs experience is a file in the database directory
+            database_path = self.experienceDBPath.decode('utf-8')
+            return len([f for f in os.listdir(database_path) if os.path.isfile(os.path.join(database_path, f))])
+        count = self.experience_count()
+        self.close_session()
+        return count
+
+    def extend_database(self, source_path):
+        # Starts from a database built on a prefix of the training dataset, so that only
+        # the remaining problems have to be planned. Returns the number of problems included.
+        manifest = load_manifest(source_path)
+        assert manifest is not None, "No manifest found for the database {}".format(source_path)
+        n_problems = manifest["problems"]
+        assert n_problems <= self.training_problems.shape[0], \
+            "The database {} contains more problems than the training dataset".format(source_path)
+        assert manifest["problems_sha256"] == get_problems_hash(self.training_problems[:n_problems]), \
+            "The database {} was not built on a prefix of this training dataset".format(source_path)
+        assert manifest["planner"] == planner_names[self.planner_type.value], \
+            "The database {} was built for another planner".format(source_path)
+
+        copy_database(source_path, self.experienceDBPath.decode('utf-8'))
+        self.base_experiences = manifest["experiences"]
+        print("Extending the database with", n_problems, "problems from", source_path)
+        return n_problems
+
+    def save_manifest(self, start_index):
+        database_path = self.experienceDBPath.decode('utf-8')
+        n_problems = self.training_problems.shape[0]
+        n_new = int(np.count_nonzero(self.solved[start_index:]))
+        n_experiences = self.count_experiences()
+
+        # Integrity check of the extended database: no experience may be lost, and Lightning
+        # and EGraphs store one experience per solved problem
+        previous = self.base_experiences if start_index > 0 else 0
+        assert n_experiences >= previous, \
+            "The database {} has {} experiences, less than the {} it was extended from".format(database_path, n_experiences, previous)
+        if self.planner_type.value != 2 and n_experiences != previous + n_new:
+            print("Warning: expected", previous + n_new, "experiences in the database but found", n_experiences)
+
+        manifest = {"training_dataset": os.path.basename(self.wrapper_kwargs["training_data_file_name"]),
+                    "planner": planner_names[self.planner_type.value],
+                    "problems": int(n_problems),
+                    "problems_sha256": get_problems_hash(self.training_problems),
+                    "experiences": int(n_experiences),
+                    "updated_at": datetime.datetime.now().isoformat(timespec='seconds')}
+        with open(get_manifest_filepath(database_path), 'w') as f:
+            yaml.safe_dump(manifest, f, default_flow_style=False, sort_keys=False)
+
+    def solve_training_problem(self, p_idx):
+        _, path = self.invoke(self.start_training_poses[p_idx], self.goal_training_poses[p_idx])
+        # invoke returns the cost and the path, which is empty when no solution was found
+        return path.shape[0] > 0, path
+
+    def add_experiences(self, poses, lengths):
+        poses, pose_array = as_pose_pointer(poses)
+        length_array = (c_int * lengths.size)(*lengths.tolist())
+        return self.cdll.add_experiences(self.map_filepath, self.map_resolution, self.robot_radius,
+                                         self.collision_centers_x, self.collision_centers_y, self.n_collsion_centers,
+                                         self.turning_radius, self.planner_type, self.is_holonomic_robot,
+                                         pose_array, length_array, lengths.size, self.experienceDBPath)
+
+    def start_parallel_training(self, n_workers, start_index=0, job_timeout=None, max_retries=2):
+        database_path = self.experienceDBPath.decode('utf-8')
+        workers_dir = database_path.rstrip('/') + "_workers"
+        if os.path.isdir(workers_dir):
+            shutil.rmtree(workers_dir)
+        os.makedirs(workers_dir)
+
+        n_training_problems = self.training_problems.shape[0]
+        problem_indices = range(start_index, n_training_problems)
+        print("\n============ Starting Training with", n_workers, "workers ============")
+        scheduler = PlanningJobScheduler(init_training_worker, (self.wrapper_kwargs, workers_dir),
+                                         n_workers=n_workers, job_timeout=job_timeout, max_retries=max_retries)
+        failed = scheduler.run(((p_idx, p_idx) for p_idx in problem_indices), n_jobs=len(problem_indices),
+                               on_result=self.store_training_result)
+        if len(failed) > 0:
+            print("No experience generated for the training problems:", [p_idx+1 for p_idx, _ in failed])
+
+        self.merge_experiences(workers_dir, database_path)
+        shutil.rmtree(workers_dir)
         print("\n============ Training Complete ============")
+        return failed
+
+    def store_training_result(self, p_idx, path):
+        self.solved[p_idx] = True
+        if self.planner_type.value in (1, 2):
+            self.training_paths[p_idx] = path
+
+    def merge_experiences(self, workers_dir, database_path):
+        print("\nMerging the experiences of the workers into", database_path)
+        if self.planner_type.value == 3:
+            # EGraphs experiences are individual files in the database directory. Only the
+            # experiences of the solved problems were moved out of the staging directories.
+            for worker_name in sorted(os.listdir(workers_dir)):
+                worker_dir = os.path.join(workers_dir, worker_name)
+                for f in os.listdir(worker_dir):
+                    src = os.path.join(worker_dir, f)
+                    if os.path.isfile(src):
+                        shutil.copy(src, os.path.join(database_path, worker_name + "_" + f))
+            return
+
+        # Lightning and Thunder databases can not be concatenated (Thunder stores a sparse
+        # roadmap), so the solutions of the workers are inserted into the final database the
+        # same way the planners insert their own solutions after planning
+        indices = sorted(self.training_paths.keys())
+        paths = [self.training_paths[i].reshape((-1, 3)) for i in indices]
+        if len(paths) == 0:
+            return
+        lengths = np.array([p.shape[0] for p in paths])
+        success = self.add_experiences(np.vstack(paths), lengths)
+        assert success, "Could not merge the experiences into {}".format(database_path)
 
 def get_footprint(args):
     xmin = args.footprint[0]
@@ -130,18 +266,11 @@ def get_footprint(args):
                           [xmin, ymin]])
     return footprint
 
-def get_database_filepath(args, map_name):
-    sampling_name = "Uniform" if args.uniform_sampling else "UsingHotspots"
-    kinematics = "ReedsSheep" if args.non_holonomic else "Holonomic"
-    planner_names = ["SIMPLE(RRT-Connect)", "Lightning.db", "Thunder.db", "EGraphs", "SIMPLE(RRT-Star)"]
-    directory = os.path.abspath(os.path.split(os.path.abspath(sys.argv[0]))[0]  + "/../../generated/experienceDBs/")
-    directory = os.path.join(directory, map_name)
-    directory = os.path.join(directory, str(args.count)+"_TrainingExperiences")
-    directory = os.path.join(directory, sampling_name)
-    directory = os.path.join(directory, kinematics)
+def get_database_filepath(args, map_name, clear_existing=True, count=None):
+    count = args.count if count is None else count
+    directory = artifactRegistry.get_experienceDB_dir(map_name, count, args.uniform_sampling, args.non_holonomic, args.planner_type)
     if args.planner_type == 3:
-        directory = os.path.join(directory, planner_names[args.planner_type])
-        if os.path.isdir(directory):
+        if clear_existing and os.path.isdir(directory):
             print("Clearing already existing EGraph paths")
             shutil.rmtree(directory)
 
@@ -159,7 +288,7 @@ def get_database_filepath(args, map_name):
     else:
         path = os.path.join(directory, planner_names[args.planner_type])
 
-    if os.path.isfile(path):
+    if clear_existing and os.path.isfile(path):
         print("A database already exists. Deleting it and creating a new one.")
         os.remove(path)
 
@@ -177,6 +306,11 @@ def main():
     parser.add_argument("--count", type=int, help="Number of problems present in the training dataset. Default: 10", default=10)
     parser.add_argument("--footprint", nargs="*", type=float, help="Robot footprint as a list of xmin xmax ymin ymax", default=[-0.25, 0.25, -0.25, 0.25])
     parser.add_argument("--uniform_sampling", type=bool, help="Indicate if the experience database is being generated using uniform sampling of the map. Default: False (hotspots used)", default=False)
+    parser.add_argument("--nWorkers", type=int, help="Number of worker processes that plan the training problems in parallel. Default: 1", default=1)
+    parser.add_argument("--job_timeout", type=float, help="Time limit in seconds for planning one problem when using worker processes. Default: no limit", default=None)
+    parser.add_argument("--max_retries", type=int, help="Number of times a failed problem is planned again by a new worker process with a different seed. Default: 2", default=2)
+    parser.add_argument("--extend_from", type=int, help="Extend the database built from the training dataset with this number of problems instead of planning all the problems again. Default: not used", default=None)
+    parser.add_argument("--start_index", type=int, help="Index of the training problem to resume the training from. The existing database is kept when resuming. Default: 0", default=0)
     args = parser.parse_args()
 
     root_dir = os.path.abspath(os.path.split(os.path.abspath(sys.argv[0]))[0]  + "/../../")
@@ -184,21 +318,49 @@ def main():
     footprint = get_footprint(args)
 
     map_name = os.path.splitext(args.map_filename)[0]
-    strategy = "UniformSampling/" if args.uniform_sampling else "UsingHospots/"
-    training_dataset = os.path.abspath(root_dir + "/generated/trainingData/" + strategy + map_name + "-" + str(args.count) + "Problems.txt")
+    training_dataset = artifactRegistry.get_training_dataset_filepath(map_name, args.count, args.uniform_sampling)
 
-    if not os.path.isfile(training_dataset):
+    if not os.path.isfile(training_dataset) and not os.path.isfile(get_binary_filepath(training_dataset)):
         print("Could not find training dataset file at",training_dataset)
         return
 
-    database_path = get_database_filepath(args, map_name)
+    # Extending starts after the problems of the extended database, which is recorded in its manifest
+    if args.extend_from is not None and args.start_index > 0:
+        print("--start_index can not be used with --extend_from, the training continues after the problems of the extended database")
+        return
+
+    source_path = None
+    if args.extend_from is not None:
+        source_path = get_database_filepath(args, map_name, clear_existing=False, count=args.extend_from)
+        if load_manifest(source_path) is None:
+            print("Could not find the database to extend with its manifest at", source_path)
+            return
+
+    database_path = get_database_filepath(args, map_name, clear_existing=(args.start_index == 0))
 
     ompl_wrapper = OMPL_Wrapper(map_filepath,
                     footprint, args.robot_radius, args.turning_radius,
                     args.dist_between_points, args.planner_type, "",
                     not args.non_holonomic, training_dataset, database_path)
 
-    ompl_wrapper.start_training()
+    start_index = args.start_index
+    if source_path is not None:
+        start_index = ompl_wrapper.extend_database(source_path)
+    elif start_index > 0:
+        manifest = load_manifest(database_path)
+        ompl_wrapper.base_experiences = manifest["experiences"] if manifest is not None else 0
+
+    if args.nWorkers > 1 or args.job_timeout is not None:
+        ompl_wrapper.start_parallel_training(args.nWorkers, start_index, args.job_timeout, args.max_retries)
+    else:
+        ompl_wrapper.start_training(start_index)
+    ompl_wrapper.save_manifest(start_index)
+
+    # Same keys as the configuration of the tests in launchTests.py
+    config = {"map": map_name, "planner": args.planner_type, "nExperiences": args.count,
+              "no_hotspots": args.uniform_sampling, "constrained": args.non_holonomic}
+    sources = [training_dataset if os.path.isfile(training_dataset) else get_binary_filepath(training_dataset), source_path]
+    artifactRegistry.register_artifact("experienceDB", database_path, config, sources)
 
 if __name__ == "__main__":
     main()
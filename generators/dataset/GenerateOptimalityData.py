@@ -1,165 +1,209 @@
 #!/usr/bin/env python
 # coding: utf-8
 
-from ctypes import *
 import numpy as np
 import os
 import errno
-import sys
-import pandas as pd
-import yaml
 import argparse
 import shutil
 import matplotlib.pyplot as plt
+import hashlib
+import OmplWrapper
+from ProblemSet import load_testing_problem_set
+from PlanningJobs import PlanningJobScheduler
+import artifactRegistry
+
+# Planners used to find the optimal solutions and the names of their result directories
+optimality_planner_ids = [0, 3, 4] # RRT-Connect, E-Graphs and RRT-Star
+optimality_planner_names = ["RRT-Connect", "ARA-Star", "RRT*"]
+
+INPUT_HASH_PREFIX = "# input_hash="
+
+def read_input_hash(filepath):
+    # The input hash is stored as a comment in the first line, which np.loadtxt skips
+    if not os.path.isfile(filepath):
+        return None
+    with open(filepath, 'r') as f:
+        first_line = f.readline()
+    if not first_line.startswith(INPUT_HASH_PREFIX):
+        return None
+    return first_line[len(INPUT_HASH_PREFIX):].strip()
+
+def write_optimal_path(filepath, cost, path, input_hash):
+    combined_data = np.vstack((np.ones((1, 3)) * cost, np.reshape(path, (-1, 3))))
+    # Write to a temporary file first so that an interrupted run never leaves a partial result
+    tmp_filepath = os.path.join(os.path.dirname(filepath), "." + os.path.basename(filepath) + ".tmp")
+    np.savetxt(tmp_filepath, combined_data, delimiter='\t', header=INPUT_HASH_PREFIX[2:] + input_hash)
+    os.replace(tmp_filepath, filepath)
+
+def copy_optimal_path(src_filepath, filepath):
+    tmp_filepath = os.path.join(os.path.dirname(filepath), "." + os.path.basename(filepath) + ".tmp")
+    shutil.copyfile(src_filepath, tmp_filepath)
+    os.replace(tmp_filepath, filepath)
+
+# The optimal solutions of one planner for a testing dataset are also stored in a single
+# compressed file next to the directory of Path<i>.txt files. It holds the costs, all the
+# paths concatenated into one (n, 3) array and the offsets of every path in that array.
+def get_optimal_results_filepath(directory):
+    return directory.rstrip(os.sep) + ".npz"
+
+def save_optimal_results(filepath, costs, paths, input_hashes):
+    lengths = [p.shape[0] for p in paths]
+    offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+    poses = np.vstack(paths) if len(paths) > 0 else np.zeros((0, 3))
+    tmp_filepath = os.path.join(os.path.dirname(filepath), "." + os.path.basename(filepath) + ".tmp")
+    with open(tmp_filepath, 'wb') as f:
+        np.savez_compressed(f, costs=np.asarray(costs, dtype=np.float64), poses=poses,
+                            offsets=offsets, input_hashes=np.array(input_hashes))
+    os.replace(tmp_filepath, filepath)
+
+def load_optimal_results(filepath):
+    with np.load(filepath) as data:
+        costs = data["costs"]
+        poses = data["poses"]
+        offsets = data["offsets"]
+        input_hashes = data["input_hashes"]
+    paths = [poses[offsets[i]:offsets[i+1]] for i in range(costs.size)]
+    return costs, paths, input_hashes
+
+def init_optimality_worker(slot, seed, wrapper_kwargs):
+    # Every worker process keeps its own wrapper, and with it its own planning sessions
+    ompl_wrapper = OMPL_Wrapper(**wrapper_kwargs)
+    ompl_wrapper.set_seed(seed)
+    return ompl_wrapper.solve_task
+
+class OMPL_Wrapper(OmplWrapper.OMPL_Wrapper):
+    mode = OmplWrapper.OPTIMAL_PATHS_MODE
 
-# A class to receive the array of poses from the shared libarary
-class PathPose(Structure):
-    _fields_=[("x", c_double),
-              ("y", c_double),
-              ("theta", c_double)]
-
-    def printPose(self):
-        print("(", self.x, self.y, self.theta, ")")
-
-    def as_numpy_array(self):
-        return np.array([self.x, self.y, self.theta])
-
-
-planner_names = ["SIMPLE(RRT-Connect)", "Lightning.db", "Thunder.db", "EGraphs", "SIMPLE(RRT-Star)"]
-
-class OMPL_Wrapper():
     def __init__(self, map_filepath,
                  robot_footprint, robot_radius, turning_radius,
                  dist_between_points, planner_type, logfile,
                  is_holonomic_robot, testing_data_file_name,
                  experienceDBPath, libname = 'libomplMotionPlanner.so'):
-        self.map_filepath = map_filepath.encode(encoding='utf-8')
-        self.robot_radius = c_double(robot_radius)
-        self.turning_radius = c_double(turning_radius)
-        self.dist_between_points = c_double(dist_between_points)
-        self.planner_type = c_int(planner_type)
-        self.logfile = logfile.encode(encoding='utf-8')
-        self.is_holonomic_robot = c_bool(is_holonomic_robot)
-        self.experienceDBPath = experienceDBPath.encode(encoding='utf-8')
+        super().__init__(map_filepath, robot_footprint, robot_radius, turning_radius,
+                         dist_between_points, planner_type, logfile,
+                         is_holonomic_robot, experienceDBPath, libname)
         self.testing_data_file_name = testing_data_file_name
-
-        self.generate_collision_centers(robot_footprint)
-        self.load_shared_library(libname)
         self.load_testing_dataset(self.testing_data_file_name)
-
-        yaml_file_path = os.path.splitext(map_filepath)[0] + ".yaml"
-        self.map_resolution = c_double(self.get_YAML_data(yaml_file_path)['resolution'])
-
-    def get_YAML_data(self, filepath):
-        data = None
-        with open(filepath, 'r') as stream:
-            try:
-                data = yaml.safe_load(stream)
-            except yaml.YAMLError as exc:
-                print(exc)
-        return data
+        # Every mission of the testing dataset is made of three problems
+        self.map_name = os.path.splitext(os.path.basename(map_filepath))[0]
+        self.count = int(self.start_testing_poses.shape[0]/3)
+        # Keep the arguments to be able to create the same wrapper in the worker processes
+        self.wrapper_kwargs = {"map_filepath": map_filepath, "robot_footprint": robot_footprint,
+                               "robot_radius": robot_radius, "turning_radius": turning_radius,
+                               "dist_between_points": dist_between_points, "planner_type": planner_type,
+                               "logfile": logfile, "is_holonomic_robot": is_holonomic_robot,
+                               "testing_data_file_name": testing_data_file_name,
+                               "experienceDBPath": experienceDBPath, "libname": libname}
+        self.config_hash = self.get_config_hash(map_filepath)
 
     def load_testing_dataset(self, testing_data_filename):
-        df = pd.read_csv(testing_data_filename, header=None, sep='\t', usecols=[1,2,3])
-        data = df.values
-        n_missions = int(data.shape[0]/3)
-
-        source_offset = n_missions
-        dest_offset = (2 * n_missions)
-
-        self.start_testing_poses = []
-        self.goal_testing_poses = []
-        for mission in range(n_missions):
-            start = data[mission]
-            source = data[mission + source_offset]
-            dest = data[mission + dest_offset]
-            self.start_testing_poses.append(start)
-            self.goal_testing_poses.append(source)
-            self.start_testing_poses.append(source)
-            self.goal_testing_poses.append(dest)
-            self.start_testing_poses.append(dest)
-            self.goal_testing_poses.append(start)
-        self.start_testing_poses = np.array(self.start_testing_poses)
-        self.goal_testing_poses = np.array(self.goal_testing_poses)
-
-    def generate_collision_centers(self, robot_footprint):
-        xCoords = []
-        yCoords = []
-        for i in range(robot_footprint.shape[0]):
-            start = robot_footprint[i - 1]
-            end = robot_footprint[i]
-            xLen = np.abs(start[0] - end[0])
-            yLen = np.abs(start[1] - end[1])
-
-            numSamples = 4
-            xCoords.extend(np.linspace(start[0], end[0], numSamples).tolist())
-            yCoords.extend(np.linspace(start[1], end[1], numSamples).tolist())
-
-        self.n_collsion_centers = len(xCoords)
-        DoublesArray = c_double * self.n_collsion_centers
-        self.collision_centers_x = (c_double * len(xCoords))(*xCoords)
-        self.collision_centers_y = (c_double * len(yCoords))(*yCoords)
-
-    def load_shared_library(self, lib_name):
-        self.cdll = cdll.LoadLibrary(lib_name)
-
-        # Function signature:
-        # extern "C" bool plan_multiple_circles(
-        #     const char *mapFilename, double mapResolution, double robotRadius,
-        #     double *xCoords, double *yCoords, int numCoords, double startX,
-        #     double startY, double startTheta, double goalX, double goalY,
-        #     double goalTheta, PathPose **path, int *pathLength, double* pathCost,
-        #     double distanceBetweenPathPoints, double turningRadius,
-        #     PLANNER_TYPE plannerType, MODE mode, bool isHolonomicRobot,
-        #     const char *experienceDBPath, const char *logfile)
-        self.cdll.plan_multiple_circles.arguments = [c_char_p, c_double,
-                                       c_double, POINTER(c_double), POINTER(c_double), 
-                                       c_int, c_double, c_double, 
-                                       c_double, c_double, c_double, 
-                                       c_double, POINTER(POINTER(PathPose)), POINTER(c_int), 
-                                       POINTER(c_double), c_double, c_double, 
-                                       c_int, c_int, c_bool,
-                                       c_char_p, c_char_p]
-        self.cdll.plan_multiple_circles.restype = c_bool
-
-    def invoke(self, start, goal):
-        # Preparing to receive array of structs from the library
-        path = POINTER(PathPose)()
-        path_length = c_int(0)
-        path_cost = c_double(0)
-        mode = 3 # Corresponds to the optimal path generation mode
-
-        self.cdll.plan_multiple_circles(self.map_filepath, self.map_resolution, self.robot_radius,
-                                        self.collision_centers_x, self.collision_centers_y, self.n_collsion_centers,
-                                        c_double(start[0]), c_double(start[1]), c_double(start[2]),
-                                        c_double(goal[0]), c_double(goal[1]), c_double(goal[2]),
-                                        byref(path), byref(path_length), byref(path_cost), self.dist_between_points,
-                                        self.turning_radius, self.planner_type, mode, self.is_holonomic_robot,
-                                        self.experienceDBPath, self.logfile)
-        extracted_path = []
-        for i in range(path_length.value):
-            extracted_path.append(path[i].as_numpy_array())
-
-        return path_cost.value, np.array(extracted_path)
-
-    def find_optimal_solutions(self):
-        planner_ids = [0, 3, 4] # RRT-Connect, E-Graphs and RRT-Star
-        planner_names = ["RRT-Connect", "ARA-Star", "RRT*"]
-        for i, planner in enumerate(planner_ids):
-            print("\n============ Finding optimal solutions for planner {} ============".format(planner_names[i]))
-            self.planner_type = c_int(planner)
-            n_testing_problems = self.start_testing_poses.shape[0]
-            path_costs = []
+        testing_problems = load_testing_problem_set(testing_data_filename)
+        self.start_testing_poses = testing_problems[:, 0, :]
+        self.goal_testing_poses = testing_problems[:, 1, :]
+
+    def get_config_hash(self, map_filepath):
+        config = hashlib.sha256()
+        with open(map_filepath, 'rb') as f:
+            config.update(f.read())
+        config.update(repr((self.map_resolution.value, self.robot_radius.value, self.turning_radius.value,
+                            self.dist_between_points.value, self.is_holonomic_robot.value,
+                            list(self.collision_centers_x), list(self.collision_centers_y))).encode('utf-8'))
+        return config.hexdigest()
+
+    def get_input_hash(self, planner, p_idx):
+        input_hash = hashlib.sha256(self.config_hash.encode('utf-8'))
+        input_hash.update(repr(planner).encode('utf-8'))
+        input_hash.update(np.asarray(self.start_testing_poses[p_idx], dtype=np.float64).tobytes())
+        input_hash.update(np.asarray(self.goal_testing_poses[p_idx], dtype=np.float64).tobytes())
+        return input_hash.hexdigest()
+
+    def get_optimality_directory(self, planner_name):
+        return artifactRegistry.get_optimality_dir(planner_name, self.map_name, self.count)
+
+    def get_store_filepath(self, planner_name, input_hash):
+        # The solutions are stored by their input hash, so that they are shared by all the testing datasets of the map
+        return os.path.join(artifactRegistry.get_optimality_store_dir(planner_name, self.map_name), input_hash + ".txt")
+
+    def get_pending_tasks(self):
+        # A (planner, problem) pair is only planned if no solution was stored for the same inputs
+        tasks = []
+        n_testing_problems = self.start_testing_poses.shape[0]
+        for i, planner in enumerate(optimality_planner_ids):
+            os.makedirs(artifactRegistry.get_optimality_store_dir(optimality_planner_names[i], self.map_name), exist_ok=True)
+            pending_hashes = set()
+            for p_idx in range(n_testing_problems):
+                input_hash = self.get_input_hash(planner, p_idx)
+                filepath = self.get_store_filepath(optimality_planner_names[i], input_hash)
+                if read_input_hash(filepath) != input_hash and input_hash not in pending_hashes:
+                    pending_hashes.add(input_hash)
+                    tasks.append((planner, p_idx, filepath, input_hash))
+        return tasks
+
+    def solve_task(self, task):
+        planner, p_idx, filepath, input_hash = task
+        if self.planner_type.value != planner:
+            self.set_planner_type(planner)
+        cost, path = self.invoke(self.start_testing_poses[p_idx], self.goal_testing_poses[p_idx])
+        solved = path.shape[0] > 0
+        if solved:
+            write_optimal_path(filepath, cost, path, input_hash)
+        return solved, cost
+
+    def find_optimal_solutions(self, n_workers=1, job_timeout=None, max_retries=2):
+        tasks = self.get_pending_tasks()
+        n_total = len(optimality_planner_ids) * self.start_testing_poses.shape[0]
+        print("\n============ Finding optimal solutions for", len(tasks), "of", n_total, "planning problems ============")
+        if len(tasks) == 0:
+            return []
+
+        if n_workers > 1 or job_timeout is not None:
+            scheduler = PlanningJobScheduler(init_optimality_worker, (self.wrapper_kwargs,), n_workers=n_workers,
+                                             job_timeout=job_timeout, max_retries=max_retries)
+            failed = scheduler.run((((task[0], task[1]+1), task) for task in tasks), n_jobs=len(tasks))
+            failed = [job_id for job_id, _ in failed]
+        else:
+            failed = []
+            for task in tasks:
+                print("\n----------- Problem", task[1]+1, "with planner", task[0], "-----------")
+                success, _ = self.solve_task(task)
+                if not success:
+                    failed.append((task[0], task[1]+1))
+            self.close_session()
+
+        if len(failed) > 0:
+            print("\nFailed to find solution for the planning problems (planner, problem):", failed)
+        else:
+            print("\n============ Found all optimal solutions ============")
+        return failed
+
+    def save_optimal_results(self):
+        # The Path<i>.txt files and the compressed file of the testing dataset are built from the stored solutions
+        n_testing_problems = self.start_testing_poses.shape[0]
+        for i, planner in enumerate(optimality_planner_ids):
+            directory = self.get_optimality_directory(optimality_planner_names[i])
+            os.makedirs(directory, exist_ok=True)
+            input_hashes = [self.get_input_hash(planner, p_idx) for p_idx in range(n_testing_problems)]
+            filepath = get_optimal_results_filepath(directory)
+            for p_idx, input_hash in enumerate(input_hashes):
+                path_filepath = os.path.join(directory, "Path" + str(p_idx+1) + ".txt")
+                if read_input_hash(path_filepath) != input_hash:
+                    # The compressed file must never be read together with other Path<i>.txt files
+                    if os.path.isfile(filepath):
+                        os.remove(filepath)
+                    copy_optimal_path(self.get_store_filepath(optimality_planner_names[i], input_hash), path_filepath)
+
+            if os.path.isfile(filepath) and load_optimal_results(filepath)[2].tolist() == input_hashes:
+                continue
+
+            costs = []
             paths = []
             for p_idx in range(n_testing_problems):
-                print("\n----------- Problem", p_idx+1, "/", n_testing_problems, "-----------")
-                path_len, path = self.invoke(self.start_testing_poses[p_idx], self.goal_testing_poses[p_idx])
-                assert path_len > 0, "Failed to find solution for the planning problem!"
-                path_costs.append(path_len)
-                paths.append(path)
-            print("\n============ Found all optimal solutions for planner {} ============".format(planner_names[i]))
-            print("\nSaving optimality data")
-            self.save_optimal_costs(np.array(path_costs), paths, planner_names[i])
+                loaded_data = np.loadtxt(os.path.join(directory, "Path" + str(p_idx+1) + ".txt"), delimiter='\t')
+                costs.append(loaded_data[0, 0])
+                paths.append(loaded_data[1:, :].reshape((-1, 3)))
+            save_optimal_results(filepath, costs, paths, input_hashes)
+            print("Optimal solutions saved to:", filepath)
 
     def reject_outliers(self, data, m=2):
         if data.size <= 20:
@@ -181,19 +225,8 @@ class OMPL_Wrapper():
         planner_costs = []
         planner_paths = []
         for planner_idx, planner in enumerate(planner_ids):
-            directory = os.path.join(os.path.dirname(self.testing_data_file_name), "Optimality")
-            directory = os.path.join(directory, planner_names[planner_idx])
-            directory = os.path.join(directory, os.path.splitext(os.path.basename(self.testing_data_file_name))[0])
-            files = [f for f in os.listdir(directory) if os.path.isfile(os.path.join(directory, f))]
-            costs = []
-            paths = []
-            # Recontruct file names to avoid sorting problems for filenames greater than 9
-            for i in range(len(files)):
-                files[i] = "Path" + str(i+1) + ".txt"
-                filepath = os.path.join(directory, files[i])
-                loaded_data = np.loadtxt(filepath, delimiter='\t')
-                costs.append(loaded_data[0, 0])
-                paths.append(loaded_data[1:, :])
+            directory = self.get_optimality_directory(planner_names[planner_idx])
+            costs, paths, _ = load_optimal_results(get_optimal_results_filepath(directory))
             planner_costs.append(np.array(costs))
             planner_paths.append(paths)
         planner_costs = np.array(planner_costs).T
@@ -235,32 +268,9 @@ class OMPL_Wrapper():
         ax1.grid()
         ax1.legend()
 
-        plot_filename = "Optimality/" + nProblems + "_Comparison.svg"
-        plot_name = os.path.join(os.path.dirname(self.testing_data_file_name), plot_filename)
+        plot_name = os.path.join(artifactRegistry.get_optimality_data_dir(), nProblems + "_Comparison.svg")
         plt.savefig(plot_name, format='svg')
 
-    def save_optimal_costs(self, path_costs, paths, planner_name):
-        assert path_costs.size == len(paths)
-        save_dir = os.path.join(os.path.dirname(self.testing_data_file_name), "Optimality")
-        save_dir = os.path.join(save_dir, planner_name)
-        save_dir = os.path.join(save_dir, os.path.splitext(os.path.basename(self.testing_data_file_name))[0])
-        # Make the directory if it does not exist
-        try:
-            os.makedirs(save_dir)
-        except OSError as exc:
-            if exc.errno ==errno.EEXIST and os.path.isdir(save_dir):
-                pass
-            else:
-                raise "Could not create directory {}".format(save_dir)
-
-        for i, p in enumerate(paths):
-            path_len = np.ones((1, 3)) * path_costs[i]
-            combined_data = np.vstack((path_len, np.array(p)))
-            filename = "Path" + str(i+1) + ".txt"
-            save_path = os.path.join(save_dir, filename)
-            np.savetxt(save_path, combined_data, delimiter='\t')
-        print("Optimal costs saved to directory:", save_dir)
-
 
 def get_footprint(args):
     xmin = args.footprint[0]
@@ -275,15 +285,9 @@ def get_footprint(args):
     return footprint
 
 def get_database_filepath(args, map_name):
-    sampling_name = "Uniform" if args.no_hotspots else "UsingHotspots"
-    kinematics = "ReedsSheep" if args.non_holonomic else "Holonomic"
-    directory = os.path.abspath(os.path.split(os.path.abspath(sys.argv[0]))[0]  + "/../../generated/tempExpDB/")
-    directory = os.path.join(directory, map_name)
-    directory = os.path.join(directory, str(args.count)+"_optimalityExperiences")
-    directory = os.path.join(directory, sampling_name)
-    directory = os.path.join(directory, kinematics)
+    directory = artifactRegistry.get_temp_experienceDB_dir(map_name, args.count, args.no_hotspots,
+                                                           args.non_holonomic, args.planner_type)
     if args.planner_type == 3:
-        directory = os.path.join(directory, planner_names[args.planner_type])
         if os.path.isdir(directory):
             print("Clearing already existing EGraph paths")
             # shutil.rmtree(directory)
@@ -300,7 +304,7 @@ def get_database_filepath(args, map_name):
     if args.planner_type == 3:
         path = directory
     else:
-        path = os.path.join(directory, planner_names[args.planner_type])
+        path = os.path.join(directory, artifactRegistry.experienceDB_names[args.planner_type])
 
     if os.path.isfile(path):
         print("A database already exists. Deleting it and creating a new one.")
@@ -319,15 +323,17 @@ def main():
     parser.add_argument("--non_holonomic", type=bool, help="Flag to specify if the robot is non_holonomic. Default: False", default=False)
     parser.add_argument("--count", type=int, help="Number of problems present in the testing dataset. Default: 10", default=10)
     parser.add_argument("--footprint", nargs="*", type=float, help="Robot footprint as a list of xmin xmax ymin ymax", default=[-0.25, 0.25, -0.25, 0.25])
+    parser.add_argument("--nWorkers", type=int, help="Number of worker processes that solve the planning problems in parallel. Default: 1", default=1)
+    parser.add_argument("--job_timeout", type=float, help="Time limit in seconds for one planning problem. Problems are then solved in worker processes. Default: no limit", default=None)
+    parser.add_argument("--max_retries", type=int, help="Number of times a failed problem is planned again by a new worker process with a different seed. Default: 2", default=2)
     parser.add_argument("--no_hotspots", type=bool, help="Indicate if the experience database is being generated using uniform sampling of the map. Default: False (hotspots used)", default=False)
     args = parser.parse_args()
 
-    root_dir = os.path.abspath(os.path.split(os.path.abspath(sys.argv[0]))[0]  + "/../../")
-    map_filepath = os.path.abspath(root_dir + "/maps/" + args.map_filename)
+    map_filepath = artifactRegistry.get_map_filepath(args.map_filename)
     footprint = get_footprint(args)
 
     map_name = os.path.splitext(args.map_filename)[0]
-    testing_dataset = os.path.abspath(root_dir + "/generated/testingData/" + map_name + "-" + str(args.count) + "Problems.txt")
+    testing_dataset = artifactRegistry.get_testing_dataset_filepath(map_name, args.count)
 
     if not os.path.isfile(testing_dataset):
         print("Could not find testing dataset file at",testing_dataset)
@@ -340,7 +346,11 @@ def main():
                     args.dist_between_points, args.planner_type, "",
                     not args.non_holonomic, testing_dataset, database_path)
 
-    ompl_wrapper.find_optimal_solutions()
+    failed = ompl_wrapper.find_optimal_solutions(args.nWorkers, args.job_timeout, args.max_retries)
+    if len(failed) > 0:
+        print("Run again to retry the failed problems, the solved ones are kept")
+        return
+    ompl_wrapper.save_optimal_results()
     ompl_wrapper.compare_optimal_solution_costs()
 
 if __name__ == "__main__":
@@ -9,9 +9,12 @@ import glob
 import subprocess
 import sys
 import os
+import errno
 import yaml
 import time
 import pandas as pd
+from SamplingUtils import ClearanceMap, sample_gaussian_mixture, split_equally
+import artifactRegistry
 
 class DatasetGenerator():
     def __init__(self, args):
@@ -21,6 +24,8 @@ class DatasetGenerator():
         self.oversamplingFactor = args.oversampling
         self.save_dbg_image = args.dbg_image
         self.nRobotsList = args.nRobots
+        # All the randomness is derived from this seed so that the generated datasets are reproducible
+        self.seed_sequence = np.random.SeedSequence(args.seed)
 
         self.map_file_path = os.path.abspath(self.root_dir + "/maps/" + self.map_filename)
         self.map_name = os.path.splitext(self.map_filename)[0]
@@ -32,6 +37,8 @@ class DatasetGenerator():
         yaml_file_path = os.path.splitext(self.map_file_path)[0] + ".yaml"
         self.resolution = float(self.get_YAML_data(yaml_file_path)['resolution'])
 
+        self.clearance_map = ClearanceMap(self.img, self.robot_radius)
+
         self.samples = None
         self.hotspot_means = None
         self.hotspot_covs = None
@@ -79,79 +86,6 @@ class DatasetGenerator():
                 print(exc)
         return data
 
-    def get_color_vector(self, pos):
-        # Inverted pos indices because image is given as height x width
-        # Also used just the RGB channels.
-        return self.img[int(pos[1]), int(pos[0]), 0:3]
-
-    def close_to_obstacles(self, pos):
-        collides_with_obstacle = False
-
-        box_half_width = self.robot_radius
-        
-        min_x = int(max(0, pos[0] - box_half_width))
-        max_x = int(min(self.img_width-1, pos[0] + box_half_width))
-        min_y = int(max(0, pos[1] - box_half_width))
-        max_y = int(min(self.img_height-1, pos[1] + box_half_width))
-
-        # max to min iterations since probability of collision is higher
-        # at the borders of the bounding box than at the center
-        for i in range(max_x, min_x, -1):
-            for j in range(max_y, min_y, -1):
-                p = np.array([i, j])
-                if np.allclose(np.linalg.norm(self.get_color_vector(p)), 0.0):
-                    collides_with_obstacle = True
-                    break
-
-        return collides_with_obstacle
-
-    def discard_samples_near_obstacle(self, samples, maxNumSamples, print_progress=False):
-        filtered_sample_indices = []
-        for s_id in range(samples.shape[0]):
-            pos = samples[s_id]
-            # Check if point lies on the obstacles
-            if np.linalg.norm(self.get_color_vector(pos)) > 0.0:
-                # Check if point is close to the obstacle
-                if not self.close_to_obstacles(pos):
-                    filtered_sample_indices.append(s_id)
-                    # Periodically print number of samples generated
-                    if print_progress and (len(filtered_sample_indices) % 100) == 0:
-                        print("\tGenerated", len(filtered_sample_indices), "samples")
-                    # Check if we obtained the max required number of samples
-                    if len(filtered_sample_indices) >= maxNumSamples:
-                        break
-
-        return samples[filtered_sample_indices,:]
-
-    def discard_outside_map_samples(self, samples):
-        filtered_sample_indices = []
-        for s_id in range(samples.shape[0]):
-            pos = samples[s_id]
-            if (pos[0] > 0) and (pos[0] < self.img_width) and \
-               (pos[1] > 0) and (pos[1] < self.img_height):
-                filtered_sample_indices.append(s_id)
-
-        return samples[filtered_sample_indices,:]
-
-    def get_bivariate_samples(self, nSamples, mean, cov):
-        samples = None
-        while (samples is None) or (samples.shape[0] < nSamples):
-            requiredSamples = nSamples if samples is None else (nSamples - samples.shape[0])
-            # Oversample to account for samples that will discarded due to obstacles
-            overSampledSize = int(requiredSamples * self.oversamplingFactor)
-            newSamples = np.zeros((overSampledSize, 3))
-            newSamples[:, 0:2] = np.random.multivariate_normal(mean, cov, overSampledSize)
-            newSamples[:,2] = np.random.uniform(-np.pi, np.pi, overSampledSize)
-            newSamples = self.discard_outside_map_samples(newSamples)
-            newSamples = self.discard_samples_near_obstacle(newSamples, requiredSamples)
-            if samples is None:
-                samples = newSamples
-            else:
-                samples = np.vstack((samples, newSamples))
-
-        assert(samples.shape[0] == nSamples)
-        return samples
-
     def generate_focussed_samples(self):
         # Ensure that the number of means and covariances is same
         nMeans = self.hotspot_means.shape[0]
@@ -162,32 +96,19 @@ class DatasetGenerator():
         assert((self.source_cov is not None) and (self.source_mean is not None))
 
         # Get samples for source positions
-        self.source_samples = self.get_bivariate_samples(self.nRobots, self.source_mean, self.source_cov)
+        self.source_samples = sample_gaussian_mixture(self.source_mean, self.source_cov, [self.nRobots],
+                                                      self.clearance_map, self.oversamplingFactor, self.source_rng)
         # Set the resolution
         self.source_samples[:, 0:2] = self.source_samples[:, 0:2] * self.resolution
         print("\tGenerated", self.source_samples.shape[0], "samples for source hotspot")
 
         # Divide all samples equally among the different target hotspot centers
-        sampleSize = int(float(self.nRobots) / nMeans)
-
-        if sampleSize > 0:
-            extra_samples = self.nRobots % nMeans
-            for i in range(nMeans):
-                size = (sampleSize + 1) if (i < extra_samples) else sampleSize
-                newSamples = self.get_bivariate_samples(size, self.hotspot_means[i], self.hotspot_covs[i])
-                if self.samples is None:
-                    self.samples = newSamples
-                else:
-                    self.samples = np.vstack((self.samples, newSamples))
-                print("\tGenerated", newSamples.shape[0], "samples for target hotspot", i+1, "of", nMeans)
-        else:
-            for i in range(self.nRobots):
-                newSamples = self.get_bivariate_samples(1, self.hotspot_means[i], self.hotspot_covs[i])
-                if self.samples is None:
-                    self.samples = newSamples
-                else:
-                    self.samples = np.vstack((self.samples, newSamples))
-                print("\tGenerated", newSamples.shape[0], "samples for target hotspot", i+1, "of", nMeans)
+        counts = split_equally(self.nRobots, nMeans)
+        self.samples = sample_gaussian_mixture(self.hotspot_means, self.hotspot_covs, counts,
+                                               self.clearance_map, self.oversamplingFactor, self.target_rng)
+        for i in range(nMeans):
+            if counts[i] > 0:
+                print("\tGenerated", counts[i], "samples for target hotspot", i+1, "of", nMeans)
 
         # Set the resolution
         self.samples[:, 0:2] = self.samples[:, 0:2] * self.resolution
@@ -199,11 +120,10 @@ class DatasetGenerator():
         assert(self.source_samples.shape[0] == self.nRobots)
         assert(self.samples.shape[0] == self.nRobots)
 
-        self.problems = np.arange(0, self.nRobots, 1).astype(int)
-        np.random.shuffle(self.problems)
+        self.problems = self.pairing_rng.permutation(self.nRobots)
 
     def get_or_create_dir(self, debugMaps=False):
-        directory = os.path.join(self.root_dir, "generated/testingData/")
+        directory = artifactRegistry.get_testing_data_dir()
         if debugMaps:
             directory = os.path.join(directory, "debugMaps")
 
@@ -258,6 +178,8 @@ class DatasetGenerator():
 
         df.to_csv(file_path, sep="\t", header=False, index=False)
         print("Saved generated dataset at", file_path)
+        artifactRegistry.register_artifact("testingData", file_path, {"map": self.map_name, "count": int(nProblems),
+                                           "seed": str(self.seed_sequence.entropy)})
 
     def plot_map(self, ax):
         ax.imshow(self.img)
@@ -342,6 +264,15 @@ class DatasetGenerator():
         plt.savefig(file_path, format='svg')
         print("Saved debug map at", file_path)
 
+    def setup_random_streams(self):
+        # Independent streams for every fleet size, and for the source hotspot, the
+        # target hotspots and the pairing within it
+        dataset_seed = np.random.SeedSequence(self.seed_sequence.entropy, spawn_key=(self.nRobots,))
+        source_seed, target_seed, pairing_seed = dataset_seed.spawn(3)
+        self.source_rng = np.random.default_rng(source_seed)
+        self.target_rng = np.random.default_rng(target_seed)
+        self.pairing_rng = np.random.default_rng(pairing_seed)
+
     def generate_dataset(self):
         for n in self.nRobotsList:
             self.nRobots = n
@@ -352,7 +283,9 @@ class DatasetGenerator():
             print("Num of robots:\t\t", self.nRobots)
             print("Robot radius:\t\t", self.robot_radius)
             print("Oversampling rate:\t", self.oversamplingFactor)
+            print("Seed:\t\t\t", self.seed_sequence.entropy)
             print("------------------------------------------------")
+            self.setup_random_streams()
 
             if (self.nRobots <= self.charging_positions.shape[0]):
                 print("Requested to place", n, "robots for testing.")
@@ -380,6 +313,7 @@ def main():
     parser.add_argument("--robot_radius", type=int, help="Radius of the robot (in pixels) to be used for collision detection", default=10)
     parser.add_argument("--oversampling", type=float, help="Oversampling factor so to account for samples that will discarded due to their proximity to obstacles. (Default=4.0)", default=4.0)
     parser.add_argument("--dbg_image", type=bool, help="Generate a debug image to visualize generated dataset (Disabled by default)", default=False)
+    parser.add_argument("--seed", type=int, help="Seed used to generate the datasets. The same seed always produces the same datasets. Default: random", default=None)
     args = parser.parse_args()
 
     data_gen = DatasetGenerator(args)
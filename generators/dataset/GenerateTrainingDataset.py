@@ -4,6 +4,9 @@
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.patches import Ellipse
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import argparse
 import glob
 import subprocess
@@ -13,7 +16,97 @@ import errno
 import yaml
 import time
 import pandas as pd
-import glob
+import multiprocessing
+from ProblemSet import save_problem_set, get_binary_filepath
+from SamplingUtils import ClearanceMap, sample_gaussian_mixture, split_equally
+import artifactRegistry
+
+def write_dataset_file(df, file_path, binary=False):
+    df.to_csv(file_path, sep="\t", header=False, index=False)
+    if binary:
+        poses = df[["X", "Y", "Theta"]].values.astype(np.float64)
+        nProblems = int(poses.shape[0]/2)
+        save_problem_set(get_binary_filepath(file_path), poses[:nProblems], poses[nProblems:])
+    return file_path
+
+def build_dataset_dataframe(start_poses, goal_poses):
+    # The (x, y, theta) poses are already in the map frame
+    nProblems = start_poses.shape[0]
+    pose_names = ["Start_" + str(i) for i in range(nProblems)]
+    pose_names.extend(["Goal_" + str(i) for i in range(nProblems)])
+    poses = np.vstack((start_poses, goal_poses)).astype(float)
+
+    headers = ["Pose_name", "X", "Y", "Theta"]
+    indices = np.arange(0, 2 * nProblems, 1)
+
+    df = pd.DataFrame(index=indices, columns=headers)
+    df = df.fillna("-")
+    df["Pose_name"] = pose_names
+    df["X"] = poses[:, 0].tolist()
+    df["Y"] = poses[:, 1].tolist()
+    df["Theta"] = poses[:, 2].tolist()
+    return df
+
+# The nested datasets are prefixes of the problems of the largest one. Its poses are
+# handed to every worker process once, and the workers build and write the datasets.
+nested_start_poses = None
+nested_goal_poses = None
+
+def init_nested_dataset_worker(start_poses, goal_poses):
+    global nested_start_poses, nested_goal_poses
+    nested_start_poses = start_poses
+    nested_goal_poses = goal_poses
+
+def write_nested_dataset_file(nProblems, file_path, binary=False):
+    df = build_dataset_dataframe(nested_start_poses[:nProblems], nested_goal_poses[:nProblems])
+    return write_dataset_file(df, file_path, binary)
+
+def get_cov_ellipse(cov, centre, nstd, **kwargs):
+    '''Source of this snippet for plotting ellipses: 
+    https://scipython.com/book/chapter-7-matplotlib/examples/bmi-data-with-confidence-ellipses/
+    '''
+    # Find and sort eigenvalues and eigenvectors into descending order
+    eigvals, eigvecs = np.linalg.eigh(cov)
+    order = eigvals.argsort()[::-1]
+    eigvals, eigvecs = eigvals[order], eigvecs[:, order]
+
+    # The anti-clockwise angle to rotate our ellipse by 
+    vx, vy = eigvecs[:,0][0], eigvecs[:,0][1]
+    theta = np.arctan2(vy, vx)
+
+    # Width and height of ellipse to draw
+    width, height = 2 * nstd * np.sqrt(eigvals)
+    ell= Ellipse(xy=centre, width=width, height=height,
+                   angle=np.degrees(theta), **kwargs)
+    ell.set_facecolor('none')
+    ell.set_edgecolor('r')
+    return ell
+
+def render_fast_debug_map(img, poses, segments, arrow_length, ellipses, file_path):
+    # One pixel in the saved image corresponds to one pixel of the map
+    dpi = 100.0
+    fig = Figure(figsize=(img.shape[1] / dpi, img.shape[0] / dpi), dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.axis('off')
+    ax.imshow(img, interpolation='nearest')
+
+    # Draw all the problems and all the poses with a single artist each
+    if segments is not None:
+        colors = plt.rcParams['axes.prop_cycle'].by_key()['color']
+        ax.add_collection(LineCollection(segments, colors=colors, linewidths=0.5))
+    ax.scatter(poses[:, 0], poses[:, 1], s=arrow_length/10.0)
+    ax.quiver(poses[:, 0], poses[:, 1], arrow_length*np.cos(poses[:, 2]), arrow_length*np.sin(poses[:, 2]),
+              angles='xy', scale_units='xy', scale=1, color='k', width=0.001)
+
+    if ellipses is not None:
+        for cov, mean, nstd in ellipses:
+            ax.add_artist(get_cov_ellipse(cov, mean, nstd, linewidth=1))
+
+    ax.set_xlim(0, img.shape[1])
+    ax.set_ylim(img.shape[0], 0)
+    fig.savefig(file_path, format='png', dpi=dpi)
+    return file_path
 
 class DatasetGenerator():
     def __init__(self, args):
@@ -22,7 +115,13 @@ class DatasetGenerator():
         self.nProblemsList = args.nProblems
         self.robot_radius = int(args.robot_radius)
         self.oversamplingFactor = args.oversampling
-        self.save_dbg_image = args.dbg_image
+        self.save_dbg_image = args.dbg_image or args.fast_dbg_image
+        self.fast_dbg_image = args.fast_dbg_image
+        self.nested = args.nested
+        self.nWorkers = args.nWorkers
+        self.save_binary = args.binary
+        # All the randomness is derived from this seed so that the generated datasets are reproducible
+        self.seed_sequence = np.random.SeedSequence(args.seed)
 
         self.map_file_path = os.path.abspath(self.root_dir + "/maps/" + self.map_filename)
         self.map_name = os.path.splitext(self.map_filename)[0]
@@ -34,6 +133,8 @@ class DatasetGenerator():
         yaml_file_path = os.path.splitext(self.map_file_path)[0] + ".yaml"
         self.resolution = float(self.get_YAML_data(yaml_file_path)['resolution'])
 
+        self.clearance_map = ClearanceMap(self.img, self.robot_radius)
+
         self.samples = None
         self.hotspot_means = None
         self.hotspot_covs = None
@@ -65,60 +166,6 @@ class DatasetGenerator():
                 print(exc)
         return data
 
-    def get_color_vector(self, pos):
-        # Inverted pos indices because image is given as height x width
-        # Also used just the RGB channels.
-        return self.img[int(pos[1]), int(pos[0]), 0:3]
-
-    def close_to_obstacles(self, pos):
-        collides_with_obstacle = False
-
-        box_half_width = self.robot_radius
-        
-        min_x = int(max(0, pos[0] - box_half_width))
-        max_x = int(min(self.img_width-1, pos[0] + box_half_width))
-        min_y = int(max(0, pos[1] - box_half_width))
-        max_y = int(min(self.img_height-1, pos[1] + box_half_width))
-
-        # max to min iterations since probability of collision is higher
-        # at the borders of the bounding box than at the center
-        for i in range(max_x, min_x, -1):
-            for j in range(max_y, min_y, -1):
-                p = np.array([i, j])
-                if np.allclose(np.linalg.norm(self.get_color_vector(p)), 0.0):
-                    collides_with_obstacle = True
-                    break
-
-        return collides_with_obstacle
-
-    def discard_samples_near_obstacle(self, samples, maxNumSamples, print_progress=False):
-        filtered_sample_indices = []
-        for s_id in range(samples.shape[0]):
-            pos = samples[s_id]
-            # Check if point lies on the obstacles
-            if np.linalg.norm(self.get_color_vector(pos)) > 0.0:
-                # Check if point is close to the obstacle
-                if not self.close_to_obstacles(pos):
-                    filtered_sample_indices.append(s_id)
-                    # Periodically print number of samples generated
-                    if print_progress and (len(filtered_sample_indices) % 100) == 0:
-                        print("\tGenerated", len(filtered_sample_indices), "samples")
-                    # Check if we obtained the max required number of samples
-                    if len(filtered_sample_indices) >= maxNumSamples:
-                        break
-
-        return samples[filtered_sample_indices,:]
-
-    def discard_outside_map_samples(self, samples):
-        filtered_sample_indices = []
-        for s_id in range(samples.shape[0]):
-            pos = samples[s_id]
-            if (pos[0] > 0) and (pos[0] < self.img_width) and \
-               (pos[1] > 0) and (pos[1] < self.img_height):
-                filtered_sample_indices.append(s_id)
-
-        return samples[filtered_sample_indices,:]
-
     def load_previously_generated_samples(self):
         directory = self.get_or_create_dir()
         files = [f for f in glob.glob(directory + '/' + self.map_filename.split('.')[0]+'*.txt')]
@@ -150,35 +197,16 @@ class DatasetGenerator():
         sampleSize = int(nSamples * self.oversamplingFactor)
 
         self.samples = np.zeros((sampleSize, 3))
-        self.samples[:,0] = np.random.randint(0, self.img_width, self.samples.shape[0])
-        self.samples[:,1] = np.random.randint(0, self.img_height, self.samples.shape[0])
-        self.samples[:,2] = np.random.uniform(-np.pi, np.pi, self.samples.shape[0])
-        self.samples = self.discard_samples_near_obstacle(self.samples, nSamples, print_progress=True)
+        self.samples[:,0] = self.sampling_rng.integers(0, self.img_width, self.samples.shape[0])
+        self.samples[:,1] = self.sampling_rng.integers(0, self.img_height, self.samples.shape[0])
+        self.samples[:,2] = self.sampling_rng.uniform(-np.pi, np.pi, self.samples.shape[0])
+        self.samples = self.clearance_map.filter_samples(self.samples, nSamples)
 
         # Set the resolution
         self.samples[:, 0:2] = self.samples[:, 0:2] * self.resolution
 
         print("Discarded", nSamples - self.samples.shape[0], "samples as they were on/close to obstacles")
 
-    def get_bivariate_samples(self, nSamples, mean, cov):
-        samples = None
-        while (samples is None) or (samples.shape[0] < nSamples):
-            requiredSamples = nSamples if samples is None else (nSamples - samples.shape[0])
-            # Oversample to account for samples that will discarded due to obstacles
-            overSampledSize = int(requiredSamples * self.oversamplingFactor)
-            newSamples = np.zeros((overSampledSize, 3))
-            newSamples[:, 0:2] = np.random.multivariate_normal(mean, cov, overSampledSize)
-            newSamples[:,2] = np.random.uniform(-np.pi, np.pi, overSampledSize)
-            newSamples = self.discard_outside_map_samples(newSamples)
-            newSamples = self.discard_samples_near_obstacle(newSamples, requiredSamples)
-            if samples is None:
-                samples = newSamples
-            else:
-                samples = np.vstack((samples, newSamples))
-
-        assert(samples.shape[0] == nSamples)
-        return samples
-
     def generate_focussed_samples(self, nSamples):
         # Ensure that the number of means and covariances is same
         nMeans = self.hotspot_means.shape[0]
@@ -186,27 +214,14 @@ class DatasetGenerator():
         assert(nMeans == nCov)
 
         # Divide all samples equallly among the different hotspot centers
-        sampleSize = int(float(nSamples) / nMeans)
-        print("Sample Size:", sampleSize)
-
-        if sampleSize > 0:
-            extra_samples = nSamples % nMeans
-            for i in range(nMeans):
-                size = (sampleSize + 1) if (i < extra_samples) else sampleSize
-                newSamples = self.get_bivariate_samples(size, self.hotspot_means[i], self.hotspot_covs[i])
-                if self.samples is None:
-                    self.samples = newSamples
-                else:
-                    self.samples = np.vstack((self.samples, newSamples))
-                print("\tGenerated", newSamples.shape[0], "samples for hotspot", i+1, "of", nMeans)
-        else:
-            for i in range(nSamples):
-                newSamples = self.get_bivariate_samples(1, self.hotspot_means[i], self.hotspot_covs[i])
-                if self.samples is None:
-                    self.samples = newSamples
-                else:
-                    self.samples = np.vstack((self.samples, newSamples))
-                print("\tGenerated", newSamples.shape[0], "samples for hotspot", i+1, "of", nMeans)
+        counts = split_equally(nSamples, nMeans)
+        print("Sample Size:", counts[-1])
+
+        self.samples = sample_gaussian_mixture(self.hotspot_means, self.hotspot_covs, counts,
+                                               self.clearance_map, self.oversamplingFactor, self.sampling_rng)
+        for i in range(nMeans):
+            if counts[i] > 0:
+                print("\tGenerated", counts[i], "samples for hotspot", i+1, "of", nMeans)
 
         # Set the resolution
         self.samples[:, 0:2] = self.samples[:, 0:2] * self.resolution
@@ -221,34 +236,15 @@ class DatasetGenerator():
             print("Try increasing the oversampling factor to generate more samples")
             return False
 
-        used_samples = np.full((1, nSamples), False)
-
-        self.problems = np.zeros((self.nProblems, 2))
-
-        for p_idx in range(self.nProblems):
-            start = 0
-            goal = 0
-
-            # Find a unique start position
-            while used_samples[0,start]:
-                start = np.random.randint(0, nSamples, 1)[0]
-            used_samples[0, start] = True
-                
-            # Find a unique goal position
-            while used_samples[0,goal]:
-                goal = np.random.randint(0, nSamples, 1)[0] 
-            used_samples[0, goal] = True
-
-            self.problems[p_idx, 0] = start
-            self.problems[p_idx, 1] = goal
+        # Pick unique samples for all the start and goal positions
+        sample_ids = self.pairing_rng.choice(nSamples, 2 * self.nProblems, replace=False)
+        self.problems = sample_ids.reshape((2, self.nProblems)).T
 
         self.problems = self.problems.astype(int)
         return True
 
     def get_or_create_dir(self, debugMaps=False):
-        strategy = "UniformSampling" if self.hotspot_means is None else "UsingHospots"
-        directory = os.path.join(self.root_dir, "generated/trainingData/")
-        directory = os.path.join(directory, strategy)
+        directory = artifactRegistry.get_training_data_dir(self.hotspot_means is None)
         if debugMaps:
             directory = os.path.join(directory, "debugMaps")
 
@@ -262,49 +258,54 @@ class DatasetGenerator():
 
         return directory
 
-    def save_dataset_to_file(self, file_path=None):
-        print("\nSaving dataset to a file...")
-
-        if file_path is None:
-            directory = self.get_or_create_dir()
-            filename = self.map_name + "-" + str(self.problems.shape[0]) + "Problems.txt"
-            file_path = os.path.join(directory, filename)
+    def get_dataset_filepath(self, nProblems):
+        filename = self.map_name + "-" + str(nProblems) + "Problems.txt"
+        return os.path.join(self.get_or_create_dir(), filename)
 
+    def get_problem_poses(self, problems):
+        # Start and goal poses of the problems with the y axis of the map frame
         height = self.img_height * self.resolution
+        poses = []
+        for pose_ids in [problems[:, 0].astype(int), problems[:, 1].astype(int)]:
+            sample_poses = self.samples[pose_ids, :].astype(float)
+            sample_poses[:, 1] = height - sample_poses[:, 1]
+            poses.append(sample_poses)
+        return poses
 
-        nProblems = self.problems.shape[0]
-        pose_names = ["Start_" + str(i) for i in range(nProblems)]
-        pose_names.extend(["Goal_" + str(i) for i in range(nProblems)])
-
-        start_pose_ids = self.problems[:, 0].astype(int)
-        goal_pose_ids = self.problems[:, 1].astype(int)
-
-        start_sample_poses = self.samples[start_pose_ids, :]
-        goal_sample_poses = self.samples[goal_pose_ids, :]
-
-        x_pos = start_sample_poses[:, 0].astype(float).tolist()
-        y_pos = (height - start_sample_poses[:, 1]).astype(float).tolist()
-        theta = start_sample_poses[:, 2].astype(float).tolist()
-
-        x_pos.extend(goal_sample_poses[:, 0].astype(float).tolist())
-        y_pos.extend((height - goal_sample_poses[:, 1]).astype(float).tolist())
-        theta.extend(goal_sample_poses[:, 2].astype(float).tolist())
+    def get_dataset_dataframe(self, problems):
+        return build_dataset_dataframe(*self.get_problem_poses(problems))
 
-        headers = ["Pose_name", "X", "Y", "Theta"]
-        indices = np.arange(0, len(x_pos), 1)
+    def save_dataset_to_file(self, file_path=None):
+        print("\nSaving dataset to a file...")
 
-        self.df = pd.DataFrame(index=indices, columns=headers)
-        self.df = self.df.fillna("-")
-        self.df["Pose_name"] = pose_names
-        self.df["X"] = x_pos
-        self.df["Y"] = y_pos
-        self.df["Theta"] = theta
+        if file_path is None:
+            file_path = self.get_dataset_filepath(self.problems.shape[0])
 
+        self.df = self.get_dataset_dataframe(self.problems)
         self.df = self.replace_with_generated_data(self.df)
 
-        self.df.to_csv(file_path, sep="\t", header=False, index=False)
+        write_dataset_file(self.df, file_path, self.save_binary)
         print("Saved generated dataset at", file_path)
 
+    def save_manifest(self, file_paths):
+        manifest = {"map": self.map_filename,
+                    "sampling": "UniformSampling" if self.hotspot_means is None else "UsingHospots",
+                    "robot_radius": self.robot_radius,
+                    "oversampling": self.oversamplingFactor,
+                    "seed": str(self.seed_sequence.entropy),
+                    "generated_at": time.strftime("%d-%m-%Y %H:%M:%S"),
+                    "datasets": {int(n): {"file": os.path.basename(f), "sha256": artifactRegistry.hash_file(f)}
+                                 for n, f in file_paths.items()}}
+
+        manifest_path = os.path.join(self.get_or_create_dir(), self.map_name + "-Manifest.yaml")
+        with open(manifest_path, 'w') as stream:
+            yaml.safe_dump(manifest, stream, default_flow_style=False)
+        print("Saved dataset manifest at", manifest_path)
+
+        for n, f in file_paths.items():
+            artifactRegistry.register_artifact("trainingData", f, {"map": self.map_name, "count": int(n),
+                                               "no_hotspots": self.hotspot_means is None, "seed": manifest["seed"]})
+
     def replace_with_generated_data(self, df):
         nProblems = self.problems.shape[0]
 
@@ -340,25 +341,7 @@ class DatasetGenerator():
         ax.imshow(self.img)
 
     def get_cov_ellipse(self, cov, centre, nstd, **kwargs):
-        '''Source of this snippet for plotting ellipses: 
-        https://scipython.com/book/chapter-7-matplotlib/examples/bmi-data-with-confidence-ellipses/
-        '''
-        # Find and sort eigenvalues and eigenvectors into descending order
-        eigvals, eigvecs = np.linalg.eigh(cov)
-        order = eigvals.argsort()[::-1]
-        eigvals, eigvecs = eigvals[order], eigvecs[:, order]
-
-        # The anti-clockwise angle to rotate our ellipse by 
-        vx, vy = eigvecs[:,0][0], eigvecs[:,0][1]
-        theta = np.arctan2(vy, vx)
-
-        # Width and height of ellipse to draw
-        width, height = 2 * nstd * np.sqrt(eigvals)
-        ell= Ellipse(xy=centre, width=width, height=height,
-                       angle=np.degrees(theta), linewidth=5, **kwargs)
-        ell.set_facecolor('none')
-        ell.set_edgecolor('r')
-        return ell
+        return get_cov_ellipse(cov, centre, nstd, linewidth=5, **kwargs)
 
     def get_poses_to_polt(self, filter_samples=True):
         if filter_samples:
@@ -423,42 +406,142 @@ class DatasetGenerator():
         plt.savefig(file_path, format='svg')
         print("Saved debug map at", file_path)
 
+    def get_fast_debug_map_job(self, plot_problems=True, plot_ellipses=True):
+        poses = self.get_poses_to_polt(filter_samples=True)
+        pixel_poses = np.copy(poses)
+        pixel_poses[:, 0:2] = pixel_poses[:, 0:2] / self.resolution
+
+        segments = None
+        if plot_problems:
+            segments = np.stack((pixel_poses[0:self.nProblems, 0:2], pixel_poses[self.nProblems:, 0:2]), axis=1)
+
+        ellipses = None
+        if plot_ellipses and self.hotspot_covs is not None:
+            ellipses = [(self.hotspot_covs[i], self.hotspot_means[i], self.sigma_interval) for i in range(self.hotspot_covs.shape[0])]
+
+        directory = self.get_or_create_dir(debugMaps=True)
+        file_path = os.path.join(directory, self.map_name + "-" + str(self.nProblems) + "Problems.png")
+
+        return (self.img, pixel_poses, segments, self.robot_radius, ellipses, file_path)
+
+    def save_fast_debug_maps(self, jobs):
+        print("\nGenerating", len(jobs), "debug maps...")
+        if len(jobs) == 1:
+            saved_files = [render_fast_debug_map(*jobs[0])]
+        else:
+            pool = multiprocessing.Pool(min(self.nWorkers, len(jobs)))
+            try:
+                saved_files = pool.starmap(render_fast_debug_map, jobs)
+            finally:
+                pool.close()
+                pool.join()
+        for f in saved_files:
+            print("Saved debug map at", f)
+
+    def save_debug_maps(self):
+        if self.fast_dbg_image:
+            self.save_fast_debug_maps([self.get_fast_debug_map_job()])
+        else:
+            self.save_debug_map()
+
+    def print_generation_info(self):
+        print("\n========= Generating Training Dataset ==========")
+        print("Map:\t\t\t", self.map_filename)
+        print("Num of problems:\t", self.nProblems)
+        print("Robot radius:\t\t", self.robot_radius)
+        print("Oversampling rate:\t", self.oversamplingFactor)
+        print("Seed:\t\t\t", self.seed_sequence.entropy)
+        print("------------------------------------------------")
+
+    def setup_random_streams(self):
+        # Independent streams for every dataset size, so that a dataset only depends
+        # on the seed and its own size and not on the other requested sizes
+        dataset_seed = np.random.SeedSequence(self.seed_sequence.entropy, spawn_key=(self.nProblems,))
+        sampling_seed, pairing_seed = dataset_seed.spawn(2)
+        self.sampling_rng = np.random.default_rng(sampling_seed)
+        self.pairing_rng = np.random.default_rng(pairing_seed)
+
+    def generate_samples_and_problems(self):
+        self.setup_random_streams()
+
+        # Ideally we need (nProblems * 2) samples for nProblems.
+        nSamples = self.nProblems * 2
+
+        if self.hotspot_means is not None:
+            print("Generating", nSamples, "samples at the hotspots...")
+            self.generate_focussed_samples(nSamples)
+        else:
+            # Add some wiggle room for creating problems.
+            # We generate more samples than needed to spread out the problems more evenly
+            wiggle_factor = 2
+            nSamples = nSamples * wiggle_factor
+            print("Generating", nSamples, "samples (with wiggle factor of", wiggle_factor, "), uniformly over the map...")
+            self.generate_random_samples(nSamples)
+        print("Successfully generated", self.samples.shape[0], "samples")
+
+        print("\nGenerating", self.nProblems, "unique problems from generated samples...")
+        success = self.generate_problem_scenarios()
+        if success:
+            print("Successfully generated", self.problems.shape[0], "problems")
+        print("================================================")
+        return success
+
     def generate_dataset(self):
+        if self.nested:
+            self.generate_nested_datasets()
+            return
+
         for n in self.nProblemsList:
             self.nProblems = n
             self.samples = None
-            print("\n========= Generating Training Dataset ==========")
-            print("Map:\t\t\t", self.map_filename)
-            print("Num of problems:\t", self.nProblems)
-            print("Robot radius:\t\t", self.robot_radius)
-            print("Oversampling rate:\t", self.oversamplingFactor)
-            print("------------------------------------------------")
-
-            # Ideally we need (nProblems * 2) samples for nProblems.
-            nSamples = self.nProblems * 2
-
-            if self.hotspot_means is not None:
-                print("Generating", nSamples, "samples at the hotspots...")
-                self.generate_focussed_samples(nSamples)
-            else:
-                # Add some wiggle room for creating problems.
-                # We generate more samples than needed to spread out the problems more evenly
-                wiggle_factor = 2
-                nSamples = nSamples * wiggle_factor
-                print("Generating", nSamples, "samples (with wiggle factor of", wiggle_factor, "), uniformly over the map...")
-                self.generate_random_samples(nSamples)
-            print("Successfully generated", self.samples.shape[0], "samples")
-
-            print("\nGenerating", self.nProblems, "unique problems from generated samples...")
-            success = self.generate_problem_scenarios()
-            if not success:
+            self.print_generation_info()
+
+            if not self.generate_samples_and_problems():
                 return
-            print("Successfully generated", self.problems.shape[0], "problems")
-            print("================================================")
 
             self.save_dataset_to_file()
             if self.save_dbg_image:
-                self.save_debug_map()
+                self.save_debug_maps()
+
+    def generate_nested_datasets(self):
+        # Sample only once for the largest dataset. Every smaller dataset is a prefix
+        # of the problems of the largest one, which keeps all the datasets nested.
+        sizes = sorted(set(self.nProblemsList))
+        self.nProblems = sizes[-1]
+        self.samples = None
+        self.print_generation_info()
+
+        if not self.generate_samples_and_problems():
+            return
+        all_problems = self.problems
+
+        print("\nSaving", len(sizes), "nested datasets using", self.nWorkers, "workers...")
+        jobs = [(n, self.get_dataset_filepath(n), self.save_binary) for n in sizes]
+
+        pool = multiprocessing.Pool(self.nWorkers, initializer=init_nested_dataset_worker,
+                                    initargs=self.get_problem_poses(all_problems))
+        try:
+            saved_files = pool.starmap(write_nested_dataset_file, jobs)
+        finally:
+            pool.close()
+            pool.join()
+
+        for f in saved_files:
+            print("Saved generated dataset at", f)
+        self.save_manifest(dict(zip(sizes, saved_files)))
+
+        if self.save_dbg_image:
+            debug_map_jobs = []
+            for i, n in enumerate(sizes):
+                self.nProblems = n
+                self.problems = all_problems[:n]
+                self.df = self.get_dataset_dataframe(self.problems)
+                if self.fast_dbg_image:
+                    debug_map_jobs.append(self.get_fast_debug_map_job())
+                else:
+                    self.save_debug_map()
+            if self.fast_dbg_image:
+                self.save_fast_debug_maps(debug_map_jobs)
 
 def main():
     parser = argparse.ArgumentParser()
@@ -467,7 +550,12 @@ def main():
     parser.add_argument("--robot_radius", type=int, help="Radius of the robot (in pixels) to be used for collision detection", default=10)
     parser.add_argument("--oversampling", type=float, help="Oversampling factor so to account for samples that will discarded due to their proximity to obstacles. (Default=4.0)", default=4.0)
     parser.add_argument("--dbg_image", type=bool, help="Generate a debug image to visualize generated dataset (Disabled by default)", default=False)
+    parser.add_argument("--fast_dbg_image", type=bool, help="Generate the debug images as PNGs at map resolution using a faster batched renderer (Disabled by default)", default=False)
     parser.add_argument("--use_hotspots", type=bool, help="Flag to activate use of hotspots for dataset generation (Disabled by default)", default=False)
+    parser.add_argument("--nested", type=bool, help="Sample once for the largest of --nProblems and derive the smaller datasets as nested prefixes of it (Disabled by default)", default=False)
+    parser.add_argument("--binary", type=bool, help="Also save every dataset as a memory-mappable binary problem set (.npy) next to the text file (Disabled by default)", default=False)
+    parser.add_argument("--seed", type=int, help="Seed used to generate the datasets. The same seed always produces the same datasets. Default: random", default=None)
+    parser.add_argument("--nWorkers", type=int, help="Number of worker processes used to save the nested datasets. Default: number of CPUs", default=multiprocessing.cpu_count())
     args = parser.parse_args()
 
     data_gen = DatasetGenerator(args)
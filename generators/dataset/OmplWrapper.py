@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+from ctypes import *
+import numpy as np
+import os
+import weakref
+import yaml
+
+# A class to receive the array of poses from the shared libarary
+class PathPose(Structure):
+    _fields_=[("x", c_double),
+              ("y", c_double),
+              ("theta", c_double)]
+
+    def printPose(self):
+        print("(", self.x, self.y, self.theta, ")")
+
+def as_pose_array(path, path_length):
+    # Copies the native array of poses into an (n, 3) array in one go
+    if path_length == 0:
+        return np.zeros((0, 3))
+    return np.ctypeslib.as_array(cast(path, POINTER(c_double)), shape=(path_length, 3)).copy()
+
+def as_pose_pointer(poses):
+    # Inverse of as_pose_array without copying, the (n, 3) array has the layout of PathPose[n].
+    # The returned pointer is only valid as long as the returned array is alive.
+    poses = np.ascontiguousarray(poses, dtype=np.float64).reshape((-1, 3))
+    return poses, poses.ctypes.data_as(POINTER(PathPose))
+
+def declare_cleanup_path(cdll):
+    # Function signature:
+    # extern "C" void cleanupPath(PathPose *path)
+    cdll.cleanupPath.argtypes = [POINTER(PathPose)]
+    cdll.cleanupPath.restype = None
+
+# The path returned by plan_multiple_circles is allocated by the shared library and
+# has to be handed back to cleanupPath. The result copies the poses into a numpy array
+# and frees the native buffer when the with block is left, or at the latest when the
+# result is garbage collected.
+class PlanningResult():
+    def __init__(self, cdll, path, path_length, path_cost):
+        self.cost = path_cost.value
+        self.path = as_pose_array(path, path_length.value)
+        # A failed plan does not allocate a path
+        self._finalizer = weakref.finalize(self, cdll.cleanupPath, path) if path else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def release(self):
+        if self._finalizer is not None:
+            self._finalizer()
+
+# Modes of the planning library
+NORMAL_MODE = 0
+EXPERIENCE_GENERATION_MODE = 2
+OPTIMAL_PATHS_MODE = 3
+
+# Common binding to the motion planning library. The map, the collision checker and
+# the experience database are loaded once into a planning session that is reused for
+# every problem until the planner type changes or the session is closed.
+class OMPL_Wrapper():
+    mode = NORMAL_MODE
+
+    def __init__(self, map_filepath,
+                 robot_footprint, robot_radius, turning_radius,
+                 dist_between_points, planner_type, logfile,
+                 is_holonomic_robot, experienceDBPath,
+                 libname = 'libomplMotionPlanner.so'):
+        self.map_filepath = map_filepath.encode(encoding='utf-8')
+        self.robot_radius = c_double(robot_radius)
+        self.turning_radius = c_double(turning_radius)
+        self.dist_between_points = c_double(dist_between_points)
+        self.planner_type = c_int(planner_type)
+        self.logfile = logfile.encode(encoding='utf-8')
+        self.is_holonomic_robot = c_bool(is_holonomic_robot)
+        self.experienceDBPath = experienceDBPath.encode(encoding='utf-8')
+        self.session = None
+        self._session_finalizer = None
+
+        self.generate_collision_centers(robot_footprint)
+        self.load_shared_library(libname)
+
+        yaml_file_path = os.path.splitext(map_filepath)[0] + ".yaml"
+        self.map_resolution = c_double(self.get_YAML_data(yaml_file_path)['resolution'])
+
+    def get_YAML_data(self, filepath):
+        data = None
+        with open(filepath, 'r') as stream:
+            try:
+                data = yaml.safe_load(stream)
+            except yaml.YAMLError as exc:
+                print(exc)
+        return data
+
+    # The footprint is converted once, every plan reuses the same c_double arrays
+    def generate_collision_centers(self, robot_footprint):
+        xCoords = []
+        yCoords = []
+        for i in range(robot_footprint.shape[0]):
+            start = robot_footprint[i - 1]
+            end = robot_footprint[i]
+
+            numSamples = 4
+            xCoords.extend(np.linspace(start[0], end[0], numSamples).tolist())
+            yCoords.extend(np.linspace(start[1], end[1], numSamples).tolist())
+
+        self.n_collsion_centers = len(xCoords)
+        self.collision_centers_x = (c_double * len(xCoords))(*xCoords)
+        self.collision_centers_y = (c_double * len(yCoords))(*yCoords)
+
+    def load_shared_library(self, lib_name):
+        self.cdll = cdll.LoadLibrary(lib_name)
+
+        # Function signature:
+        # extern "C" bool plan_multiple_circles(
+        #     const char *mapFilename, double mapResolution, double robotRadius,
+        #     double *xCoords, double *yCoords, int numCoords, double startX,
+        #     double startY, double startTheta, double goalX, double goalY,
+        #     double goalTheta, PathPose **path, int *pathLength, double* pathCost,
+        #     double distanceBetweenPathPoints, double turningRadius,
+        #     PLANNER_TYPE plannerType, MODE mode, bool isHolonomicRobot,
+        #     const char *experienceDBPath, const char *logfile)
+        self.cdll.plan_multiple_circles.argtypes = [c_char_p, c_double,
+                                       c_double, POINTER(c_double), POINTER(c_double),
+                                       c_int, c_double, c_double,
+                                       c_double, c_double, c_double,
+                                       c_double, POINTER(POINTER(PathPose)), POINTER(c_int),
+                                       POINTER(c_double), c_double, c_double,
+                                       c_int, c_int, c_bool,
+                                       c_char_p, c_char_p]
+        self.cdll.plan_multiple_circles.restype = c_bool
+        declare_cleanup_path(self.cdll)
+
+        # Function signature:
+        # extern "C" void set_planner_seed(unsigned long seed)
+        self.cdll.set_planner_seed.argtypes = [c_ulong]
+        self.cdll.set_planner_seed.restype = None
+
+        # Function signature:
+        # extern "C" PlannerSession *create_planner_session(
+        #     const char *mapFilename, double mapResolution, double robotRadius,
+        #     double *xCoords, double *yCoords, int numCoords,
+        #     double distanceBetweenPathPoints, double turningRadius,
+        #     PLANNER_TYPE plannerType, MODE mode, bool isHolonomicRobot,
+        #     const char *experienceDBPath, const char *logfile)
+        self.cdll.create_planner_session.argtypes = [c_char_p, c_double, c_double,
+                                       POINTER(c_double), POINTER(c_double), c_int,
+                                       c_double, c_double,
+                                       c_int, c_int, c_bool,
+                                       c_char_p, c_char_p]
+        self.cdll.create_planner_session.restype = c_void_p
+
+        # Function signature:
+        # extern "C" bool plan_with_session(PlannerSession *session, double startX,
+        #     double startY, double startTheta, double goalX, double goalY,
+        #     double goalTheta, PathPose **path, int *pathLength, double *pathCost)
+        self.cdll.plan_with_session.argtypes = [c_void_p, c_double, c_double, c_double,
+                                       c_double, c_double, c_double,
+                                       POINTER(POINTER(PathPose)), POINTER(c_int), POINTER(c_double)]
+        self.cdll.plan_with_session.restype = c_bool
+
+        # Function signature:
+        # extern "C" bool session_plan_from_recall(PlannerSession *session)
+        self.cdll.session_plan_from_recall.argtypes = [c_void_p]
+        self.cdll.session_plan_from_recall.restype = c_bool
+
+        # Function signature:
+        # extern "C" bool session_last_solution(PlannerSession *session,
+        #     PathPose **path, int *pathLength)
+        self.cdll.session_last_solution.argtypes = [c_void_p, POINTER(POINTER(PathPose)), POINTER(c_int)]
+        self.cdll.session_last_solution.restype = c_bool
+
+        # Function signature:
+        # extern "C" int session_experience_count(PlannerSession *session)
+        self.cdll.session_experience_count.argtypes = [c_void_p]
+        self.cdll.session_experience_count.restype = c_int
+
+        # Function signature:
+        # extern "C" void destroy_planner_session(PlannerSession *session)
+        self.cdll.destroy_planner_session.argtypes = [c_void_p]
+        self.cdll.destroy_planner_session.restype = None
+
+    def set_seed(self, seed):
+        # Has to be called before the first plan of the process
+        self.cdll.set_planner_seed(seed)
+
+    def open_session(self):
+        if self.session is not None:
+            return
+        self.session = self.cdll.create_planner_session(self.map_filepath, self.map_resolution, self.robot_radius,
+                                        self.collision_centers_x, self.collision_centers_y, self.n_collsion_centers,
+                                        self.dist_between_points, self.turning_radius, self.planner_type,
+                                        self.mode, self.is_holonomic_robot, self.experienceDBPath, self.logfile)
+        assert self.session is not None, "Could not create a planning session"
+        self._session_finalizer = weakref.finalize(self, self.cdll.destroy_planner_session, self.session)
+
+    def close_session(self):
+        if self._session_finalizer is not None:
+            self._session_finalizer()
+        self.session = None
+        self._session_finalizer = None
+
+    def last_plan_from_recall(self):
+        return self.cdll.session_plan_from_recall(self.session)
+
+    def experience_count(self):
+        # Loading the database into a session also checks that it can be read
+        self.open_session()
+        return self.cdll.session_experience_count(self.session)
+
+    def set_planner_type(self, planner_type):
+        # The session is tied to a planner, so a new one is created on the next plan
+        self.close_session()
+        self.planner_type = c_int(planner_type)
+
+    def invoke(self, start, goal):
+        self.open_session()
+
+        # Preparing to receive array of structs from the library
+        path = POINTER(PathPose)()
+        path_length = c_int(0)
+        path_cost = c_double(0)
+
+        self.cdll.plan_with_session(self.session,
+                                    start[0], start[1], start[2],
+                                    goal[0], goal[1], goal[2],
+                                    byref(path), byref(path_length), byref(path_cost))
+        with PlanningResult(self.cdll, path, path_length, path_cost) as result:
+            return result.cost, result.path
+
+    def last_solution(self):
+        # The last solution as the planner found it, without the interpolation of invoke
+        path = POINTER(PathPose)()
+        path_length = c_int(0)
+        self.cdll.session_last_solution(self.session, byref(path), byref(path_length))
+        with PlanningResult(self.cdll, path, path_length, c_double(0)) as result:
+            return result.path
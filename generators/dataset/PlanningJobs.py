@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+from collections import deque
+from multiprocessing.connection import wait
+import multiprocessing
+import numpy as np
+import time
+
+# Runs planning jobs on a pool of worker processes. Every worker owns its own instance
+# of the planning library and works on one job at a time, so a job that exceeds its
+# time limit is stopped by killing its worker, which is then replaced by a new one, as
+# is a worker that crashed. Failed jobs are retried. OMPL only takes a seed before its
+# first random number generator is created, so the planner can not be reseeded between
+# two jobs of a worker. Every retry is therefore planned by a new worker process in the
+# slot of the failed job, seeded with a new seed of the seed sequence of the scheduler.
+#
+# worker_init(slot, seed, *init_args) is called once in every worker process and must
+# return a function that solves the payload of a job and returns (success, result).
+# Both worker_init and the payloads have to be picklable.
+
+def run_worker(worker_init, slot, seed, init_args, conn):
+    solve = worker_init(slot, seed, *init_args)
+    conn.send(("ready", None, None))
+    while True:
+        job = conn.recv()
+        if job is None:
+            break
+        job_id, payload = job
+        try:
+            success, result = solve(payload)
+        except Exception as exc:
+            success, result = False, repr(exc)
+        conn.send((job_id, success, result))
+    conn.close()
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    return "{:02d}:{:02d}:{:02d}".format(seconds // 3600, (seconds // 60) % 60, seconds % 60)
+
+class Worker():
+    def __init__(self, process, conn, seed):
+        self.process = process
+        self.conn = conn
+        self.seed = seed
+        self.ready = False
+        self.job = None
+        # Failed job that is planned again by this worker before any other job
+        self.retry = None
+        self.deadline = None
+
+class PlanningJobScheduler():
+    def __init__(self, worker_init, init_args=(), n_workers=1, job_timeout=None, max_retries=2, queue_size=None, seed=None):
+        self.worker_init = worker_init
+        self.init_args = init_args
+        self.n_workers = n_workers
+        self.job_timeout = job_timeout
+        self.max_retries = max_retries
+        # Number of jobs taken from the job iterator ahead of the workers
+        self.queue_size = queue_size if queue_size is not None else 2 * n_workers
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.context = multiprocessing.get_context("spawn")
+        self.workers = [None] * n_workers
+
+    def start_worker(self, slot):
+        seed = int(self.seed_sequence.spawn(1)[0].generate_state(1)[0])
+        parent_conn, child_conn = self.context.Pipe()
+        process = self.context.Process(target=run_worker, daemon=True,
+                                       args=(self.worker_init, slot, seed, self.init_args, child_conn))
+        process.start()
+        child_conn.close()
+        self.workers[slot] = Worker(process, parent_conn, seed)
+
+    def stop_worker(self, slot, kill=False):
+        worker = self.workers[slot]
+        if worker is None:
+            return
+        if kill:
+            worker.process.kill()
+        else:
+            try:
+                worker.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        worker.process.join()
+        worker.conn.close()
+        self.workers[slot] = None
+
+    def restart_worker(self, slot):
+        self.stop_worker(slot, kill=True)
+        self.start_worker(slot)
+
+    def run(self, jobs, n_jobs=None, on_result=None):
+        '''Solves all the (job_id, payload) pairs of the jobs iterable and calls
+        on_result(job_id, result) for every solved job. Returns the list of
+        (job_id, reason) of the jobs that failed after all the retries.'''
+        jobs = iter(jobs)
+        pending = deque()
+        attempts = {}
+        failed = []
+        n_done = 0
+        jobs_exhausted = False
+        start_time = time.time()
+
+        def report(job_id, status):
+            elapsed = time.time() - start_time
+            total = "/" + str(n_jobs) if n_jobs is not None else ""
+            eta = ""
+            if n_jobs is not None and n_done > 0:
+                eta = ", ETA " + format_duration(elapsed / n_done * (n_jobs - n_done))
+            print("[{}{}] Job {} {} (failed: {}, elapsed {}{})".format(n_done, total, job_id, status,
+                                                                       len(failed), format_duration(elapsed), eta))
+
+        def handle_failure(slot, job, reason, restart=False):
+            nonlocal n_done
+            job_id = job[0]
+            attempts[job_id] = attempts.get(job_id, 0) + 1
+            retry = attempts[job_id] <= self.max_retries
+            # A worker that crashed or is still planning has to be replaced, and a retry
+            # needs a new worker to plan with a new seed. A worker that found no solution
+            # for the last attempt of a job is healthy and takes the next job.
+            if restart or retry:
+                self.restart_worker(slot)
+            if retry:
+                print("Job {} failed ({}), retry {}/{} with seed {}".format(job_id, reason, attempts[job_id],
+                                                                           self.max_retries, self.workers[slot].seed))
+                self.workers[slot].retry = job
+            else:
+                n_done += 1
+                failed.append((job_id, reason))
+                report(job_id, "failed: " + reason)
+
+        for slot in range(self.n_workers):
+            self.start_worker(slot)
+
+        try:
+            while True:
+                # Keep the bounded queue filled
+                while not jobs_exhausted and len(pending) < self.queue_size:
+                    try:
+                        pending.append(next(jobs))
+                    except StopIteration:
+                        jobs_exhausted = True
+
+                # Hand out jobs to idle workers
+                for slot, worker in enumerate(self.workers):
+                    if worker.ready and worker.job is None and (worker.retry is not None or len(pending) > 0):
+                        worker.job = worker.retry if worker.retry is not None else pending.popleft()
+                        worker.retry = None
+                        worker.deadline = time.time() + self.job_timeout if self.job_timeout else None
+                        worker.conn.send(worker.job)
+
+                busy = [w for w in self.workers if w.job is not None or not w.ready]
+                if jobs_exhausted and len(pending) == 0 and all(w.job is None and w.retry is None for w in self.workers):
+                    break
+
+                deadlines = [w.deadline for w in busy if w.deadline is not None]
+                wait_time = max(0.0, min(deadlines) - time.time()) if len(deadlines) > 0 else None
+                ready_conns = wait([w.conn for w in busy], wait_time)
+
+                for slot, worker in enumerate(self.workers):
+                    if worker.conn in ready_conns:
+                        try:
+                            job_id, success, result = worker.conn.recv()
+                        except (EOFError, OSError):
+                            # The worker process died
+                            if not worker.ready:
+                                raise RuntimeError("Worker {} died while starting up".format(slot))
+                            if worker.job is not None:
+                                handle_failure(slot, worker.job, "worker crashed", restart=True)
+                            else:
+                                self.restart_worker(slot)
+                            continue
+
+                        if job_id == "ready":
+                            worker.ready = True
+                            continue
+
+                        job = worker.job
+                        worker.job = None
+                        worker.deadline = None
+                        if success:
+                            n_done += 1
+                            if on_result is not None:
+                                on_result(job_id, result)
+                            report(job_id, "done")
+                        else:
+                            handle_failure(slot, job, str(result))
+                    elif worker.deadline is not None and time.time() >= worker.deadline:
+                        handle_failure(slot, worker.job, "timed out after {}s".format(self.job_timeout), restart=True)
+        finally:
+            for slot in range(self.n_workers):
+                self.stop_worker(slot, kill=self.workers[slot] is not None and self.workers[slot].job is not None)
+
+        print("Finished", n_done, "jobs in", format_duration(time.time() - start_time), "with", len(failed), "failures")
+        return failed
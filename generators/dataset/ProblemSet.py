@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import numpy as np
+import os
+import pandas as pd
+
+# Binary problem sets are stored in the NumPy .npy format: a small header followed by
+# a float64 array of shape (nProblems, 2, 3) holding the (x, y, theta) start and goal
+# pose of every problem. The array can be memory mapped, so problems are only read
+# from the disk when they are accessed.
+
+def get_binary_filepath(text_filepath):
+    return os.path.splitext(text_filepath)[0] + ".npy"
+
+def save_problem_set(filepath, start_poses, goal_poses):
+    assert start_poses.shape == goal_poses.shape, "Number of start and goal poses must be the same"
+    problems = np.empty((start_poses.shape[0], 2, 3), dtype=np.float64)
+    problems[:, 0, :] = start_poses
+    problems[:, 1, :] = goal_poses
+    np.save(filepath, problems)
+    return filepath
+
+def load_problem_set(filepath, mmap=True):
+    problems = np.load(filepath, mmap_mode='r' if mmap else None)
+    assert problems.ndim == 3 and problems.shape[1:] == (2, 3) and problems.dtype == np.float64,\
+        "Problem set {} does not contain a float64 (n, 2, 3) array".format(filepath)
+    return problems
+
+def load_text_problem_set(filepath):
+    df = pd.read_csv(filepath, header=None, sep='\t', usecols=[1,2,3])
+    data = df.values
+    nProblems = int(data.shape[0]/2)
+    problems = np.empty((nProblems, 2, 3), dtype=np.float64)
+    problems[:, 0, :] = data[:nProblems, :]
+    problems[:, 1, :] = data[nProblems:, :]
+    return problems
+
+def convert_text_problem_set(text_filepath):
+    problems = load_text_problem_set(text_filepath)
+    return save_problem_set(get_binary_filepath(text_filepath), problems[:, 0, :], problems[:, 1, :])
+
+def load_testing_problem_set(filepath):
+    # A testing dataset holds the start, source and destination pose of every robot mission,
+    # and every mission consists of the three problems start -> source -> destination -> start
+    df = pd.read_csv(filepath, header=None, sep='\t', usecols=[1,2,3])
+    data = df.values
+    n_missions = int(data.shape[0]/3)
+    starts = data[:n_missions]
+    sources = data[n_missions:2*n_missions]
+    destinations = data[2*n_missions:3*n_missions]
+
+    problems = np.empty((n_missions, 3, 2, 3), dtype=np.float64)
+    problems[:, 0, 0, :] = starts
+    problems[:, 0, 1, :] = sources
+    problems[:, 1, 0, :] = sources
+    problems[:, 1, 1, :] = destinations
+    problems[:, 2, 0, :] = destinations
+    problems[:, 2, 1, :] = starts
+    return problems.reshape((3 * n_missions, 2, 3))
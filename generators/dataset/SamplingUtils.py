@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import numpy as np
+
+# A precomputed lookup of all the map pixels that are far enough from the obstacles
+# for the robot to be placed on them
+class ClearanceMap:
+    def __init__(self, img, robot_radius):
+        self.img_height = img.shape[0]
+        self.img_width = img.shape[1]
+        self.robot_radius = int(robot_radius)
+
+        colors = img[:, :, 0:3] if img.ndim == 3 else img[:, :, np.newaxis]
+        color_norms = np.linalg.norm(colors, axis=2)
+        self.free_mask = self.compute_free_mask(color_norms)
+
+    def compute_free_mask(self, color_norms):
+        obstacles = np.isclose(color_norms, 0.0, rtol=0.0, atol=1e-8)
+
+        # Integral image of the obstacles to count the obstacles in any box with four lookups
+        integral = np.zeros((self.img_height + 1, self.img_width + 1), dtype=np.int64)
+        integral[1:, 1:] = np.cumsum(np.cumsum(obstacles, axis=0), axis=1)
+
+        # The box around a pixel spans (pos - radius, pos + radius] clipped to the map
+        xs = np.arange(self.img_width)
+        ys = np.arange(self.img_height)
+        min_x = np.maximum(0, xs - self.robot_radius) + 1
+        max_x = np.minimum(self.img_width - 1, xs + self.robot_radius) + 1
+        min_y = np.maximum(0, ys - self.robot_radius) + 1
+        max_y = np.minimum(self.img_height - 1, ys + self.robot_radius) + 1
+
+        n_obstacles = integral[max_y][:, max_x] - integral[min_y][:, max_x] \
+                      - integral[max_y][:, min_x] + integral[min_y][:, min_x]
+
+        return (color_norms > 0.0) & (n_obstacles == 0)
+
+    def is_within_map(self, positions):
+        return (positions[:, 0] > 0) & (positions[:, 0] < self.img_width) & \
+               (positions[:, 1] > 0) & (positions[:, 1] < self.img_height)
+
+    def is_valid(self, positions):
+        valid = self.is_within_map(positions)
+        # Inverted indices because image is given as height x width
+        pixels = positions[valid].astype(int)
+        valid[valid] = self.free_mask[pixels[:, 1], pixels[:, 0]]
+        return valid
+
+    def filter_samples(self, samples, maxNumSamples):
+        valid_indices = np.flatnonzero(self.is_valid(samples[:, 0:2]))
+        return samples[valid_indices[:maxNumSamples], :]
+
+def sample_gaussian_mixture(means, covs, counts, clearance_map, oversampling, rng=np.random):
+    '''Draw counts[i] valid samples (x, y, theta) from the Gaussian with mean means[i]
+    and diagonal covariance covs[i]. All the components are sampled together and the
+    returned samples are ordered by component.'''
+    means = np.asarray(means, dtype=float).reshape(-1, 2)
+    covs = np.asarray(covs, dtype=float).reshape(-1, 2, 2)
+    assert np.allclose(covs[:, 0, 1], 0.0) and np.allclose(covs[:, 1, 0], 0.0), "Only diagonal covariances are supported"
+    stds = np.sqrt(np.stack((covs[:, 0, 0], covs[:, 1, 1]), axis=1))
+
+    nComponents = means.shape[0]
+    remaining = np.asarray(counts, dtype=int).copy()
+    accepted_samples = []
+    accepted_components = []
+
+    while remaining.sum() > 0:
+        # Oversample to account for samples that will discarded due to obstacles
+        nDraws = np.ceil(remaining * oversampling).astype(int)
+        components = np.repeat(np.arange(nComponents), nDraws)
+
+        samples = np.zeros((components.size, 3))
+        samples[:, 0:2] = means[components] + stds[components] * rng.standard_normal((components.size, 2))
+        samples[:, 2] = rng.uniform(-np.pi, np.pi, components.size)
+
+        valid = clearance_map.is_valid(samples[:, 0:2])
+        samples = samples[valid]
+        components = components[valid]
+
+        # Keep only as many valid samples of every component as still required
+        rank = np.arange(components.size) - np.searchsorted(components, components, side='left')
+        keep = rank < remaining[components]
+        accepted_samples.append(samples[keep])
+        accepted_components.append(components[keep])
+        remaining -= np.bincount(components[keep], minlength=nComponents)
+
+    components = np.concatenate(accepted_components)
+    order = np.argsort(components, kind='stable')
+    return np.concatenate(accepted_samples)[order]
+
+def split_equally(nSamples, nComponents):
+    counts = np.full(nComponents, nSamples // nComponents, dtype=int)
+    counts[:nSamples % nComponents] += 1
+    return counts
@@ -257,17 +257,71 @@ class LogAnalyzer:
         plt.savefig(plot_name, format='svg')
         # fig.savefig(os.path.join(self.get_directory_to_save_plots(fleets, assisted_sampling), "PathLengths.svg"), bbox_inches=self.plot_utils.subplot_extent(fig, ax2))
 
+    def plot_resource_usage(self, assisted_sampling, usage_df, fleets=None):
+        if fleets is None:
+            fleets = self.fleet_missions
+        planning_df = pd.read_csv(self.planning_csv_path, index_col=None)
+        execution_df = pd.read_csv(self.execution_csv_path, index_col=None)
+        plan_usage = get_plan_resource_usage(planning_df, usage_df)
+        test_usage = get_test_resource_usage(execution_df, usage_df)
+
+        fig = plt.figure(figsize=(15, 15))
+
+        # Resource usage over time with the start of every plan
+        ax1 = fig.add_subplot(211)
+        ax1.plot(usage_df["Time"], usage_df["CPU (%)"], color='b', label="CPU (%)")
+        ax1.set_ylabel("CPU usage (% of one core)")
+        ax1_rss = ax1.twinx()
+        ax1_rss.plot(usage_df["Time"], usage_df["RSS (MB)"], color='r', label="RSS (MB)")
+        ax1_rss.set_ylabel("Memory (MB)")
+        for start in pd.to_datetime(planning_df["Planning Start Time"], format="%d-%m-%Y %H:%M:%S"):
+            ax1.axvline(x=start, linestyle=':', color='k', alpha=0.3)
+        ax1.set_title("Resource usage of the test processes (dotted lines: plan start times)")
+
+        ax2 = fig.add_subplot(223)
+        from_recall = plan_usage["From recall"] == 1
+        ax2.scatter(plan_usage["CPU (%)"][~from_recall], plan_usage["Total planning time"][~from_recall], color='b', label="From scratch")
+        ax2.scatter(plan_usage["CPU (%)"][from_recall], plan_usage["Total planning time"][from_recall], color='g', label="From recall")
+        ax2.set_xlabel("Mean CPU usage while planning (%)")
+        ax2.set_ylabel("Total planning time (s)")
+        ax2.legend()
+        ax2.set_title("Planning time vs CPU usage (correlation: {:.2f})".format(
+                      plan_usage["CPU (%)"].corr(plan_usage["Total planning time"])))
+
+        ax3 = fig.add_subplot(224)
+        if len(test_usage) > 0:
+            ax3.scatter(test_usage["Num of replans"], test_usage["Peak CPU (%)"], color='b', label="Peak CPU (%)")
+            ax3.scatter(test_usage["Num of replans"], test_usage["Peak RSS (MB)"], color='r', label="Peak RSS (MB)")
+            ax3.legend()
+        ax3.set_xlabel("Num of replans")
+        ax3.set_title("Replans vs resource usage per test")
+
+        fig.suptitle(self.get_figure_title("Resource usage", fleets, assisted_sampling))
+
+        plot_name = os.path.join(self.get_directory_to_save_plots(fleets, assisted_sampling), "resource_usage.svg")
+        plt.savefig(plot_name, format='svg')
+
+    def report_timing_noise(self, assisted_sampling, ledger_df, fleets=None):
+        if fleets is None:
+            fleets = self.fleet_missions
+        planning_df = pd.read_csv(self.planning_csv_path, index_col=None)
+        execution_df = pd.read_csv(self.execution_csv_path, index_col=None)
+        noise_df = get_timing_noise(planning_df, execution_df, ledger_df)
+        if len(noise_df) == 0:
+            print("Not enough serial and parallel tests to compare their timing")
+            return
+
+        print("Timing of the tests run in parallel compared to the serial baseline:")
+        print(noise_df.to_string(index=False, float_format="{:.3f}".format))
+        report_name = os.path.join(self.get_directory_to_save_plots(fleets, assisted_sampling), "timing_noise.csv")
+        noise_df.to_csv(report_name, index=False)
+
     def get_directory_to_save_plots(self, fleets, assisted_sampling):
         if self.save_path is None:
-            sampling_name = "UsingHotspots" if assisted_sampling else "Uniform"
-            kinematics = "Holonomic" if self.get_holonomic(fleets) else "ReedsSheep"
-            self.save_path = os.path.abspath(os.path.split(os.path.abspath(sys.argv[0]))[0]  + "/../../generated/executionData/")
-            self.save_path = os.path.join(self.save_path, self.get_map_name(fleets))
-            self.save_path = os.path.join(self.save_path, self.get_planner_name(fleets))
-            self.save_path = os.path.join(self.save_path, str(self.get_nRobots(fleets))+"_Robots")
-            self.save_path = os.path.join(self.save_path, kinematics)
-            self.save_path = os.path.join(self.save_path, sampling_name)
-            self.save_path = os.path.join(self.save_path, str(self.nExperiences)+"_TrainingExperiences/Plots")
+            execution_dir = artifactRegistry.get_execution_dir(self.get_map_name(fleets), self.get_planner_name(fleets),
+                                                               self.get_nRobots(fleets), not self.get_holonomic(fleets),
+                                                               not assisted_sampling, self.nExperiences)
+            self.save_path = os.path.join(execution_dir, "Plots")
 
         # Make the directory if it does not exist
         try:
@@ -312,5 +366,14 @@ def main():
     la.plot_execution_stats(assisted_sampling)
     la.plot_path_predictability_stats(assisted_sampling, similarity_threshold=0.3)
 
+    usage_df = load_resource_usage(log_dir)
+    if usage_df is not None:
+        la.plot_resource_usage(assisted_sampling, usage_df)
+
+    # Runs of launchTests.py with --parallel and --serial_baseline
+    ledger_df = load_run_ledger(log_dir)
+    if ledger_df is not None and "Parallel Instances" in ledger_df and ledger_df["Parallel Instances"].nunique() > 1:
+        la.report_timing_noise(assisted_sampling, ledger_df)
+
 if __name__ == "__main__":
     main()
@@ -7,6 +7,8 @@ import sys
 import argparse
 import pandas as pd
 import re
+import json
+import artifactRegistry
 
 # A class to extract relevant lines from a complete log file of a test run and generate a CSV logg file
 class logParser:
@@ -339,18 +341,109 @@ class logParser:
         df.to_csv(csv_filepath)
         print("Execution logs CSV generated/extended at", csv_filepath)
 
-def get_log_filename(args):
-    sampling_name = "Uniform" if args.no_hotspots else "UsingHotspots"
-    kinematics = "ReedsSheep" if args.constrained else "Holonomic"
-    planner_names = ["SIMPLE(RRT-Connect)", "Lightning", "Thunder", "EGraphs", "SIMPLE(RRT-Star)"]
-    directory = os.path.abspath(os.path.split(os.path.abspath(sys.argv[0]))[0]  + "/../../generated/executionData/")
-    directory = os.path.join(directory, args.map)
-    directory = os.path.join(directory, planner_names[args.planner])
-    directory = os.path.join(directory, str(args.nRobots)+"_Robots")
-    directory = os.path.join(directory, kinematics)
-    directory = os.path.join(directory, sampling_name)
-    directory = os.path.join(directory, str(args.nExperiences)+"_TrainingExperiences/Logs")
+# Generates the same CSV files from the structured event log ("CompleteLog.jsonl") that
+# the planning library and the tests write next to the text log, one JSON object per
+# line. Only the events are parsed, so the time does not depend on the size of the text log.
+class eventLogParser:
+    def __init__(self):
+        self.events = None
+
+    def read_events(self, events_filepath):
+        self.events = []
+        with open(events_filepath) as f:
+            for l in f:
+                l = l.strip()
+                if len(l) == 0:
+                    continue
+                try:
+                    self.events.append(json.loads(l))
+                except ValueError:
+                    # The last line of a log that is still being written may be incomplete
+                    print("Skipping malformed event:", l[:80])
+        return self.events
+
+    def has_planning_events(self):
+        # Logs of planning libraries built without the event log only have the events of the tests
+        return any(e["event"] == "plan" for e in self.events)
+
+    def generate_planning_csv(self, csv_filepath):
+        assert(self.events is not None)
+
+        columns = ["Test Name", "Test Start Time",  "Planning Start Time", "Map Filename", "Map Resolution", "Start X", "Start Y", "Start Theta",
+                   "Goal X", "Goal Y", "Goal Theta", "Planner Type", "Holonomic",
+                   "Planning Time", "Path simplification time", "From recall", "Total planning time", "Path Length", "Path"]
+        rows = []
+        test_name, test_time = "-", "-"
+        for e in self.events:
+            if e["event"] == "test_start":
+                test_name, test_time = e["test_name"], e["time"]
+            elif e["event"] == "plan":
+                rows.append([test_name, test_time, e["start_time"], e["map_filename"], e["map_resolution"],
+                             e["start"][0], e["start"][1], e["start"][2], e["goal"][0], e["goal"][1], e["goal"][2],
+                             e["planner_type"], 1 if e["holonomic"] else 0,
+                             e["planning_time"], e["simplification_time"],
+                             "-" if e["from_recall"] is None else e["from_recall"],
+                             e["total_planning_time"], e["path_length"],
+                             "".join("{};{};{};".format(*pose) for pose in e["path"])])
+
+        nPlans = len(rows)
+        assert (nPlans % 3 == 0), "Expected number of plans to be a multiple of 3!!"
+        df = pd.DataFrame(rows, index=np.arange(1, nPlans+1, 1), columns=columns)
+        df.to_csv(csv_filepath)
+        print("Planning logs CSV generated/extended at", csv_filepath)
+
+    def generate_execution_csv(self, csv_filepath):
+        assert(self.events is not None)
+
+        tests = []
+        nRobots = 1
+        for e in self.events:
+            if e["event"] == "test_start":
+                tests.append({"name": e["test_name"], "time": e["time"], "replans": 0, "missions": {}})
+            elif len(tests) == 0:
+                continue
+            elif e["event"] == "replan":
+                tests[-1]["replans"] += 1
+            elif e["event"] in ["mission_start", "mission_complete"]:
+                if e["event"] == "mission_start" and e["mission"] == 0:
+                    nRobots = max(nRobots, e["robot"])
+                tests[-1]["missions"].setdefault((e["robot"], e["mission"]), {}).update(
+                    {"start": e["time"]} if e["event"] == "mission_start" else {"end": e["time"], "duration": e["duration"]})
+
+        columns = ["Test Name", "Test Start Time", "Num of replans", "Robot ID", "Successful Misions",
+                   "Mission1 Duration", "Mission2 Duration", "Mission3 Duration",
+                   "Mission1 Start Time", "Mission1 End Time",
+                   "Mission2 Start Time", "Mission2 End Time",
+                   "Mission3 Start Time", "Mission3 End Time",]
+        rows = []
+        for t in tests:
+            for robot_id in range(1, nRobots+1):
+                missions = [t["missions"].get((robot_id, m), {}) for m in range(3)]
+                rows.append([t["name"], t["time"], float(t["replans"]), robot_id,
+                             sum("duration" in m for m in missions)] +
+                            [m.get("duration", "x") for m in missions] +
+                            [v for m in missions for v in (m.get("start", "x"), m.get("end", "x"))])
+
+        df = pd.DataFrame(rows, index=np.arange(1, len(rows)+1, 1), columns=columns)
+        df.to_csv(csv_filepath)
+        print("Execution logs CSV generated/extended at", csv_filepath)
+
+def get_events_filename(log_filepath):
+    return os.path.splitext(log_filepath)[0] + ".jsonl"
+
+def register_csv_logs(args, csv_filepaths):
+    # When a given log file is parsed, for example the snapshots of launchTests.py, the
+    # tool that passed it registers the CSV logs
+    if args.log_file is not None:
+        return
+    config = {"map": args.map, "planner": args.planner, "nRobots": args.nRobots, "constrained": args.constrained,
+              "no_hotspots": args.no_hotspots, "nExperiences": args.nExperiences}
+    for kind, csv_filepath in csv_filepaths.items():
+        artifactRegistry.register_artifact(kind, csv_filepath, config, [get_log_filename(args)])
 
+def get_log_filename(args):
+    directory = artifactRegistry.get_execution_log_dir(args.map, artifactRegistry.planner_names[args.planner], args.nRobots,
+                                                       args.constrained, args.no_hotspots, args.nExperiences)
     return directory + "/CompleteLog.log"
 
 
@@ -363,6 +456,8 @@ def main():
     parser.add_argument("--no_hotspots", type=bool, help="Indicate if the experience databases are generated using uniform sampling of the map. Default: False (hotspots used)", default=False)
     parser.add_argument("--nExperiences", type=int, help="Number of training problems used to build the experience DB. Default: 100", default=100)
     parser.add_argument("--tags_filename", type=str, help="Filename of file containing tags used to filter the log", default="default_tags.txt")
+    parser.add_argument("--log_file", type=str, help="Path of the log file to parse instead of the complete log of the test configuration. The CSV files are written next to it", default=None)
+    parser.add_argument("--text_log", type=bool, help="Parse the text log even if a structured event log exists next to it. Default: False", default=False)
     args = parser.parse_args()
 
     planner_names = ["rrt_connect", "lightning", "thunder", "rrt_star"]
@@ -371,7 +466,7 @@ def main():
     map_name = os.path.splitext(args.map)[0]
 
     tags_filepath = root_dir + "/generators/logging/tags/" + args.tags_filename
-    log_filepath = get_log_filename(args)
+    log_filepath = args.log_file if args.log_file is not None else get_log_filename(args)
 
     if not os.path.isfile(tags_filepath):
         print("Log tags file does not exist! \nPath specified was:\n", tags_filepath)
@@ -387,11 +482,24 @@ def main():
     csv_planning_log_filename = os.path.dirname(log_filepath) + "/Planning.csv"
     csv_execution_log_filename = os.path.dirname(log_filepath) + "/Execution.csv"
 
+    events_filepath = get_events_filename(log_filepath)
+    if not args.text_log and os.path.isfile(events_filepath):
+        elp = eventLogParser()
+        elp.read_events(events_filepath)
+        if elp.has_planning_events():
+            print("Found event log at:", events_filepath)
+            elp.generate_planning_csv(csv_planning_log_filename)
+            elp.generate_execution_csv(csv_execution_log_filename)
+            register_csv_logs(args, {"planningCSV": csv_planning_log_filename, "executionCSV": csv_execution_log_filename})
+            return
+        print("Event log has no planning events, falling back to the text log")
+
     lp = logParser(tags_filepath)
     lp.extract_tagged_lines(log_filepath)
     # lp.dump_log_summary(summary_log_filename)
     lp.generate_planning_csv(csv_planning_log_filename)
     lp.generate_execution_csv(csv_execution_log_filename)
+    register_csv_logs(args, {"planningCSV": csv_planning_log_filename, "executionCSV": csv_execution_log_filename})
 
 if __name__ == "__main__":
     main()
@@ -8,10 +8,12 @@ import sys
 import argparse
 import pandas as pd
 import re
+import datetime
 import matplotlib.pyplot as plt
 from matplotlib.transforms import Bbox
 from ctypes import *
 import seaborn as sns
+import artifactRegistry
 sns.set(style="darkgrid")
 
 # A class to pass the array of poses to the shared libarary for comparison
@@ -20,6 +22,45 @@ class PathPose(Structure):
               ("y", c_double),
               ("theta", c_double)]
 
+# Optimal path costs keyed by (planner, map, nRobots), shared by all the fleets of a process.
+# Every entry remembers the modification time of its source and is reloaded if it changes.
+optimal_costs_cache = {}
+
+def get_optimality_directory(planner_name, map_name, nRobots):
+    return artifactRegistry.get_optimality_dir(planner_name, map_name, nRobots)
+
+def read_optimal_costs(directory, nCosts):
+    # Only the costs are read: the costs member of the compressed result store, or the
+    # first data line of every Path<i>.txt file without parsing the path below it.
+    # Path<i>.txt files are written by renaming, so a compressed file older than the
+    # directory was built from other paths and is ignored.
+    results_filepath = directory + ".npz"
+    if os.path.isfile(results_filepath) and os.path.getmtime(results_filepath) >= os.path.getmtime(directory):
+        with np.load(results_filepath) as data:
+            return data["costs"]
+
+    costs = np.zeros(nCosts)
+    for i in range(nCosts):
+        with open(os.path.join(directory, "Path" + str(i+1) + ".txt"), 'r') as f:
+            line = f.readline()
+            while line.startswith('#'):
+                line = f.readline()
+        costs[i] = float(line.split('\t')[0])
+    return costs
+
+def get_optimal_costs(planner_name, map_name, nRobots):
+    directory = get_optimality_directory(planner_name, map_name, nRobots)
+    results_filepath = directory + ".npz"
+    # Results are written by renaming, so the directory changes whenever a Path<i>.txt file does
+    results_mtime = os.path.getmtime(results_filepath) if os.path.isfile(results_filepath) else None
+    mtimes = (results_mtime, os.path.getmtime(directory))
+
+    key = (planner_name, map_name, nRobots)
+    cached = optimal_costs_cache.get(key)
+    if cached is None or cached[0] != mtimes:
+        optimal_costs_cache[key] = (mtimes, read_optimal_costs(directory, 3 * nRobots))
+    return optimal_costs_cache[key][1]
+
 class PlanData():
     def __init__(self, df):
         self.start_time = None
@@ -209,21 +250,7 @@ class FleetMissionData:
         assert self.nRobots == len(self.robot_missions), "Number of missions loaded not equal to number of robots in fleet!!"
 
     def load_optimal_path_lengths(self, planner_name="ARA-Star"):
-        directory = os.path.abspath(os.path.split(os.path.abspath(sys.argv[0]))[0]  + "/../../generated/testingData/Optimality/")
-        directory = os.path.join(directory, planner_name)
-        directory = os.path.join(directory, self.map + "-" + str(self.nRobots) + "Problems")
-        files = [f for f in os.listdir(directory) if os.path.isfile(os.path.join(directory, f))]
-        costs = []
-        paths = []
-        # Recontruct file names to avoid sorting problems for filenames greater than 9
-        for i in range(len(files)):
-            files[i] = "Path" + str(i+1) + ".txt"
-            filepath = os.path.join(directory, files[i])
-            loaded_data = np.loadtxt(filepath, delimiter='\t')
-            costs.append(loaded_data[0, 0])
-            paths.append(loaded_data[1:, :])
-
-        optimal_costs = np.array(costs)
+        optimal_costs = get_optimal_costs(planner_name, self.map, self.nRobots)
         assert optimal_costs.size == (3 * self.nRobots), "Number of optimal path costs not equal to total number of robot plans"
 
         for i in range(self.nRobots):
@@ -271,19 +298,8 @@ class FleetMissionData:
         return num_of_deliveries, total_delivery_time
 
     def get_log_path(self, assisted_sampling):
-        sampling_name = "UsingHotspots" if assisted_sampling else "Uniform"
-        kinematics = "Holonomic" if self.get_holonomic() else "ReedsSheep"
-        planner_names = ["SIMPLE(RRT-Connect)", "Lightning", "Thunder", "EGraphs", "SIMPLE(RRT-Star)"]
-
-        directory = os.path.abspath(os.path.split(os.path.abspath(sys.argv[0]))[0]  + "/../../generated/executionData/")
-        directory = os.path.join(directory, self.map)
-        directory = os.path.join(directory, self.planner)
-        directory = os.path.join(directory, str(self.nRobots)+"_Robots")
-        directory = os.path.join(directory, kinematics)
-        directory = os.path.join(directory, sampling_name)
-        directory = os.path.join(directory, str(self.nExperiences)+"_TrainingExperiences/Logs")
-
-        return directory
+        return artifactRegistry.get_execution_log_dir(self.map, self.planner, self.nRobots, not self.get_holonomic(),
+                                                      not assisted_sampling, self.nExperiences)
 
 class DWT:
     def __init__(self):
@@ -291,29 +307,22 @@ class DWT:
 
     def load_native_library(self):
         self.cdll = cdll.LoadLibrary('libcomparePaths.so')
-        self.cdll.comparePaths.arguments = [POINTER(PathPose), c_int, POINTER(PathPose), c_int, c_bool, c_double, c_double]
+        self.cdll.comparePaths.argtypes = [POINTER(PathPose), c_int, POINTER(PathPose), c_int, c_bool, c_double, c_double]
         self.cdll.comparePaths.restype = c_bool
 
+    def as_pose_pointer(self, path):
+        # A contiguous (n, 3) float64 array has the memory layout of PathPose[n]
+        path = np.ascontiguousarray(path, dtype=np.float64).reshape((-1, 3))
+        return path, path.ctypes.data_as(POINTER(PathPose))
+
     def compare_paths(self, path1, path2, is_holonomic, similarity_threshold):
         # Use DWT to compare two paths
-        pose_array1, pose_array2 = [], []
-        for i in range(path1.shape[0]):
-            pose = PathPose()
-            pose.x = path1[i][0]
-            pose.y = path1[i][1]
-            pose.theta = path1[i][2]
-            pose_array1.append(pose)
-
-        for i in range(path2.shape[0]):
-            pose = PathPose()
-            pose.x = path2[i][0]
-            pose.y = path2[i][1]
-            pose.theta = path2[i][2]
-            pose_array2.append(pose)
-
-        return self.cdll.comparePaths((PathPose * len(pose_array1))(*pose_array1), len(pose_array1),
-                                     (PathPose * len(pose_array2))(*pose_array2), len(pose_array2),
-                                     bool(is_holonomic), c_double(4.0), c_double(similarity_threshold))
+        path1, pose_array1 = self.as_pose_pointer(path1)
+        path2, pose_array2 = self.as_pose_pointer(path2)
+
+        return self.cdll.comparePaths(pose_array1, path1.shape[0],
+                                      pose_array2, path2.shape[0],
+                                      bool(is_holonomic), 4.0, similarity_threshold)
 
     def load_similarities_from_file(self, directory, assisted_sampling, similarity_threshold):
         filename = "Similarities_" + str(similarity_threshold) + '.txt'
@@ -563,15 +572,94 @@ class PlotUtils:
         return bbox.expanded(1.0 + pad, 1.0 + pad).transformed(fig.dpi_scale_trans.inverted())
 
 def get_log_dir(args):
-    sampling_name = "Uniform" if args.no_hotspots else "UsingHotspots"
-    kinematics = "ReedsSheep" if args.constrained else "Holonomic"
-    planner_names = ["SIMPLE(RRT-Connect)", "Lightning", "Thunder", "EGraphs", "SIMPLE(RRT-Star)"]
-    directory = os.path.abspath(os.path.split(os.path.abspath(sys.argv[0]))[0]  + "/../../generated/executionData/")
-    directory = os.path.join(directory, args.map)
-    directory = os.path.join(directory, planner_names[args.planner])
-    directory = os.path.join(directory, str(args.nRobots)+"_Robots")
-    directory = os.path.join(directory, kinematics)
-    directory = os.path.join(directory, sampling_name)
-    directory = os.path.join(directory, str(args.nExperiences)+"_TrainingExperiences/Logs")
-
-    return directory
+    return artifactRegistry.get_execution_log_dir(args.map, artifactRegistry.planner_names[args.planner], args.nRobots,
+                                                  args.constrained, args.no_hotspots, args.nExperiences)
+
+def load_resource_usage(log_dir):
+    # Resource usage samples written by launchTests.py --profile_interval, None if the tests were not profiled
+    filepath = os.path.join(log_dir, "ResourceUsage.csv")
+    if not os.path.isfile(filepath):
+        return None
+    usage_df = pd.read_csv(filepath)
+    # The samples are stored as UNIX time, the logs use the local time
+    local_timezone = datetime.datetime.now().astimezone().tzinfo
+    usage_df["Time"] = pd.to_datetime(usage_df["Time"], unit="s", utc=True).dt.tz_convert(local_timezone).dt.tz_localize(None)
+    return usage_df.sort_values("Time", kind="stable").reset_index(drop=True)
+
+def get_plan_resource_usage(planning_df, usage_df):
+    '''The mean CPU usage, the peak memory and the disk I/O of the test processes
+    while every plan of the planning CSV was computed.'''
+    starts = pd.to_datetime(planning_df["Planning Start Time"], format="%d-%m-%Y %H:%M:%S")
+    # The start times are logged with a resolution of one second
+    durations = np.maximum(planning_df["Total planning time"].astype(float).values, 1.0)
+    ends = starts + pd.to_timedelta(durations, unit="s")
+
+    sample_times = usage_df["Time"].values
+    first = np.searchsorted(sample_times, starts.values, side="left")
+    last = np.searchsorted(sample_times, ends.values, side="right")
+
+    rows = []
+    for i, (f, l) in enumerate(zip(first, last)):
+        samples = usage_df.iloc[f:max(l, f + 1)]
+        rows.append({"CPU (%)": samples["CPU (%)"].mean(), "Peak RSS (MB)": samples["RSS (MB)"].max(),
+                     "Read (kB)": samples["Read (kB)"].sum(), "Written (kB)": samples["Written (kB)"].sum()})
+    plan_usage_df = pd.DataFrame(rows, index=planning_df.index)
+    return pd.concat([planning_df[["Test Start Time", "Planning Start Time", "Total planning time", "From recall"]], plan_usage_df], axis=1)
+
+def get_test_resource_usage(execution_df, usage_df):
+    '''The resource usage of every test of the execution CSV together with its number
+    of replans. Tests are matched to the profiled iterations by their start time.'''
+    iterations = usage_df.groupby("Iteration").agg(first_sample=("Time", "min"), last_sample=("Time", "max"),
+                                                   mean_cpu=("CPU (%)", "mean"), peak_cpu=("CPU (%)", "max"),
+                                                   peak_rss=("RSS (MB)", "max"), peak_threads=("Threads", "max"))
+    tests = execution_df.groupby("Test Start Time", sort=False)["Num of replans"].first()
+
+    rows = []
+    for test_start_time, nReplans in tests.items():
+        # The tests log the hour in the 1-24 format, so a test started at midnight is not matched
+        start = pd.to_datetime(test_start_time, format="%d-%m-%Y %H:%M:%S", errors="coerce")
+        match = iterations[(iterations["first_sample"].dt.floor("s") <= start) & (iterations["last_sample"] >= start)]
+        if len(match) == 0:
+            continue
+        it = match.iloc[0]
+        rows.append({"Test Start Time": test_start_time, "Iteration": match.index[0], "Num of replans": nReplans,
+                     "Mean CPU (%)": it["mean_cpu"], "Peak CPU (%)": it["peak_cpu"],
+                     "Peak RSS (MB)": it["peak_rss"], "Peak Threads": it["peak_threads"]})
+    return pd.DataFrame(rows)
+
+def load_run_ledger(log_dir):
+    filepath = os.path.join(log_dir, "RunLedger.csv")
+    if not os.path.isfile(filepath):
+        return None
+    return pd.read_csv(filepath, dtype={"Test Start Time": str})
+
+def get_timing_noise(planning_df, execution_df, ledger_df):
+    '''Compares the timing of the tests that ran alone (the serial baseline of
+    launchTests.py) with the tests that ran next to other instances of the test.
+    Tests are matched to the iterations of the run ledger by their start time.'''
+    ledger_df = ledger_df.dropna(subset=["Test Start Time"])
+    in_parallel = dict(zip(ledger_df["Test Start Time"], ledger_df["Parallel Instances"] > 1))
+
+    mission_columns = ["Mission1 Duration", "Mission2 Duration", "Mission3 Duration"]
+    durations = execution_df.melt(id_vars=["Test Start Time"], value_vars=mission_columns, value_name="Duration")
+    durations = durations[durations["Duration"].astype(str) != "x"]
+    metrics = {"Total planning time": (planning_df["Test Start Time"], planning_df["Total planning time"].astype(float)),
+               "Mission duration": (durations["Test Start Time"], durations["Duration"].astype(float)),
+               "Startup time": (ledger_df["Test Start Time"], ledger_df["Startup Time"].astype(float)),
+               "Wall time": (ledger_df["Test Start Time"], ledger_df["Wall Time"].astype(float))}
+
+    rows = []
+    for metric, (test_start_times, values) in metrics.items():
+        parallel = test_start_times.map(in_parallel)
+        serial_values = values[parallel.eq(False)].dropna()
+        parallel_values = values[parallel.eq(True)].dropna()
+        if len(serial_values) < 2 or len(parallel_values) < 2:
+            continue
+        difference = parallel_values.mean() - serial_values.mean()
+        rows.append({"Metric": metric,
+                     "Serial Count": len(serial_values), "Serial Mean": serial_values.mean(), "Serial Std": serial_values.std(),
+                     "Parallel Count": len(parallel_values), "Parallel Mean": parallel_values.mean(), "Parallel Std": parallel_values.std(),
+                     "Change (%)": 100.0 * difference / serial_values.mean(),
+                     # Welch's t statistic, values beyond about 2 mean that running in parallel changed the timing
+                     "Welch t": difference / np.sqrt(serial_values.var() / len(serial_values) + parallel_values.var() / len(parallel_values))})
+    return pd.DataFrame(rows)
@@ -3,51 +3,20 @@ import errno
 import sys
 import subprocess
 import argparse
-import zipfile
-import datetime
 import time
-
-def zip_logs(log_dir):
-    files_to_zip = []
-    log_dir = os.path.abspath(log_dir + "/../") + "/"
-    for root, dirs, files in os.walk(log_dir):
-        for file in files:
-            if not file.endswith(".zip"):
-                files_to_zip.append(os.path.join(root, file))
-
-    common_path_prefix = os.path.commonprefix(files_to_zip)
-
-    if len(files_to_zip) > 0:
-        curr_time = datetime.datetime.now().strftime("%H:%M:%S %b %d %Y")
-        zip_file_path = log_dir + curr_time + '.zip'
-        zipf = zipfile.ZipFile(zip_file_path, 'w', zipfile.ZIP_DEFLATED)
-        print("Zipping following files to", zip_file_path)
-        for f in files_to_zip:
-            arc_name = os.path.relpath(f, common_path_prefix)
-            zipf.write(f, arc_name)
-            print(arc_name)
-        zipf.close()
-        print("Zipping complete\n")
-
-def clear_logs(log_dir):
-    files_to_clear = []
-    log_dir = os.path.abspath(log_dir + "/../") + "/"
-    for root, dirs, files in os.walk(log_dir):
-        for file in files:
-            if not file.endswith(".zip"):
-                files_to_clear.append(os.path.join(root, file))
-    print("Clearing existing log files...")
-    for f in files_to_clear:
-        if os.path.isfile(f) and (not f.endswith(".zip") and not f.endswith(".dummyLog")):
-            os.remove(f)
-            print("Deleted file:", f)
-    print("Cleared all previous log files\n")
+import csv
+import shutil
+import re
+import artifactRegistry
+from processTree import ProcessTree, kill_orphans
+from logArchiver import start_archiving
+from resourceSampler import ResourceSampler
 
 def initialize_test(args):
     log_dir = setup_log_directory(args)
     setup_experienceDB_directory(args)
-    zip_logs(log_dir)
-    clear_logs(log_dir)
+    # The logs of the previous runs are moved out of the way and archived while the tests run
+    return start_archiving(os.path.abspath(log_dir + "/../"))
 
 def create_directory_if_needed(dirPath):
     # Make the directory if it does not exist
@@ -59,37 +28,264 @@ def create_directory_if_needed(dirPath):
         else:
             raise "Could not create directory {}".format(dirPath)
 
+def get_experienceDB_directory(args):
+    return artifactRegistry.get_experienceDB_dir(args.map, args.nExperiences, args.no_hotspots, args.constrained, args.planner)
+
 def setup_experienceDB_directory(args):
-    sampling_name = "Uniform" if args.no_hotspots else "UsingHotspots"
-    kinematics = "ReedsSheep" if args.constrained else "Holonomic"
-    planner_names = ["SIMPLE(RRT-Connect)", "Lightning", "Thunder", "EGraphs", "SIMPLE(RRT-Star)"]
-    directory = os.path.abspath(os.path.split(os.path.abspath(sys.argv[0]))[0]  + "/generated/experienceDBs/")
-    directory = os.path.join(directory, args.map)
-    directory = os.path.join(directory, str(args.nExperiences)+"_TrainingExperiences")
-    directory = os.path.join(directory, sampling_name)
-    directory = os.path.join(directory, kinematics)
-    if args.planner == 3:
-        directory = os.path.join(directory, planner_names[args.planner])
+    create_directory_if_needed(get_experienceDB_directory(args))
 
-    create_directory_if_needed(directory)
+def get_experienceDB_path(args):
+    return artifactRegistry.get_experienceDB_path(args.map, args.nExperiences, args.no_hotspots, args.constrained, args.planner)
 
-def setup_log_directory(args):
-    sampling_name = "Uniform" if args.no_hotspots else "UsingHotspots"
-    kinematics = "ReedsSheep" if args.constrained else "Holonomic"
-    planner_names = ["SIMPLE(RRT-Connect)", "Lightning", "Thunder", "EGraphs", "SIMPLE(RRT-Star)"]
-    directory = os.path.abspath(os.path.split(os.path.abspath(sys.argv[0]))[0]  + "/generated/executionData/")
-    directory = os.path.join(directory, args.map)
-    directory = os.path.join(directory, planner_names[args.planner])
-    directory = os.path.join(directory, str(args.nRobots)+"_Robots")
-    directory = os.path.join(directory, kinematics)
-    directory = os.path.join(directory, sampling_name)
-    directory = os.path.join(directory, str(args.nExperiences)+"_TrainingExperiences")
-    directory = os.path.join(directory, "Logs")
+def copy_experienceDB(experienceDB_path, instance_dir):
+    # The experience based planners add new experiences to their database while testing,
+    # so every instance of a parallel run gets its own copy. "-" keeps the shared database.
+    if experienceDB_path is None or not os.path.exists(experienceDB_path):
+        return "-"
+    if os.path.isdir(experienceDB_path):
+        copy_path = os.path.join(instance_dir, os.path.basename(os.path.normpath(experienceDB_path)))
+        shutil.copytree(experienceDB_path, copy_path)
+        return copy_path + "/"
+    copy_path = os.path.join(instance_dir, os.path.basename(experienceDB_path))
+    shutil.copy2(experienceDB_path, copy_path)
+    return copy_path
 
-    create_directory_if_needed(directory)
+def get_log_directory(args):
+    return artifactRegistry.get_execution_log_dir(args.map, artifactRegistry.planner_names[args.planner], args.nRobots,
+                                                  args.constrained, args.no_hotspots, args.nExperiences)
+
+def get_test_config(args):
+    # Configuration of the tests the execution log is registered with
+    return {"map": args.map, "planner": args.planner, "nRobots": args.nRobots, "constrained": args.constrained,
+            "no_hotspots": args.no_hotspots, "nExperiences": args.nExperiences}
 
+def register_logs(args, log_filepath, experienceDB_path, csv_extracted):
+    # The complete log grows with every iteration, so it is only hashed and registered once
+    # at the end of the run. It is registered before the CSV logs extracted from it, which
+    # would be stale otherwise.
+    config = get_test_config(args)
+    artifactRegistry.register_artifact("executionLog", log_filepath, config,
+                                       [experienceDB_path, artifactRegistry.get_testing_dataset_filepath(args.map, args.nRobots)])
+    if not csv_extracted:
+        return
+    log_dir = os.path.dirname(log_filepath)
+    for kind, filename in [("planningCSV", "Planning.csv"), ("executionCSV", "Execution.csv")]:
+        artifactRegistry.register_artifact(kind, os.path.join(log_dir, filename), config, [log_filepath])
+
+def setup_log_directory(args):
+    directory = get_log_directory(args)
+    create_directory_if_needed(directory)
     return directory
 
+def build_run_classpath(offline):
+    # Compiles the project and resolves its dependencies once, so that every iteration
+    # can start the test directly with java instead of going through gradle
+    build_cmd = ["./gradlew", "writeRunClasspath"]
+    if offline:
+        build_cmd.append("--offline")
+    subprocess.run(build_cmd, check=True)
+    with open("build/runClasspath.txt") as f:
+        return f.read().strip()
+
+def wait_for_test_start(tree, log_filepath, log_offset, deadline):
+    # The test is considered started once it logs its start line, which happens after the
+    # JVM, the coordinator and the motion planner are initialized
+    while time.perf_counter() < deadline and not tree.reap(block=False):
+        if os.path.isfile(log_filepath) and os.path.getsize(log_filepath) > log_offset:
+            with open(log_filepath) as f:
+                f.seek(log_offset)
+                if "Test \"" in f.read():
+                    return True
+        time.sleep(0.05)
+    return False
+
+def read_new_log_lines(log_filepath, log_offset):
+    if not os.path.isfile(log_filepath):
+        return []
+    with open(log_filepath) as f:
+        f.seek(log_offset)
+        return f.readlines()
+
+def get_test_start_time(log_lines):
+    # Identifies the test in the CSV logs
+    for l in log_lines:
+        match = re.match(r'Test ".*" started at (.*)', l)
+        if match is not None:
+            return match.group(1).strip()
+    return None
+
+ledger_columns = ["Iteration", "Run ID", "Launcher", "Instance", "Parallel Instances", "CPUs", "Outcome", "Exit Code",
+                  "Wall Time", "Startup Time", "Test Start Time", "Peak RSS (kB)", "User CPU Time", "System CPU Time",
+                  "Robots Done", "Resources Released", "Killed Orphans"]
+
+def append_to_run_ledger(ledger_filepath, row):
+    # One row per iteration, written as soon as the iteration finished
+    write_header = not os.path.isfile(ledger_filepath)
+    with open(ledger_filepath, 'a', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=ledger_columns)
+        if write_header:
+            writer.writeheader()
+        writer.writerow(row)
+
+def partition_cpus(n_instances):
+    '''Splits the CPUs this process may run on into n_instances disjoint sets of the
+    same size, one for every instance of a parallel run.'''
+    cpus = sorted(os.sched_getaffinity(0))
+    assert len(cpus) >= n_instances, "Cannot pin {} instances to {} CPUs".format(n_instances, len(cpus))
+    size = len(cpus) // n_instances
+    return [set(cpus[i*size:(i+1)*size]) for i in range(n_instances)]
+
+def get_batch_sizes(nIterations, parallel, serial_baseline):
+    # The serial baseline runs first, one iteration at a time, then up to parallel at a time
+    n_serial = nIterations if parallel == 1 else min(serial_baseline, nIterations)
+    batch_sizes = [1] * n_serial
+    n_parallel = nIterations - n_serial
+    while n_parallel > 0:
+        batch_sizes.append(min(parallel, n_parallel))
+        n_parallel -= batch_sizes[-1]
+    return batch_sizes
+
+def merge_instance_logs(instance_dir, log_dir):
+    # Appends the logs of an instance to the logs of the configuration, as if the test ran alone
+    for filename in ["CompleteLog.log", "CompleteLog.jsonl"]:
+        instance_filepath = os.path.join(instance_dir, filename)
+        if os.path.isfile(instance_filepath):
+            with open(instance_filepath, 'rb') as src, open(os.path.join(log_dir, filename), 'ab') as dst:
+                shutil.copyfileobj(src, dst)
+
+class TestRun():
+    '''One iteration of the test: its processes, the sampling of their resource usage and
+    the log it writes to. Several runs are alive at the same time in a parallel run.'''
+    def __init__(self, iteration, cmd, log_filepath, args, instance=1, n_instances=1, cpus=None):
+        self.iteration = iteration
+        self.cmd = cmd
+        self.log_filepath = log_filepath
+        self.args = args
+        self.instance = instance
+        self.n_instances = n_instances
+        self.cpus = cpus
+        self.prefix = "Instance {}: ".format(instance) if n_instances > 1 else ""
+        self.tree = None
+        self.sampler = None
+        self.startup_time = float("nan")
+        self.killed_orphans = []
+
+    def start(self, samples_filepath):
+        self.log_offset = os.path.getsize(self.log_filepath) if os.path.isfile(self.log_filepath) else 0
+        self.launch_time = time.perf_counter()
+        self.deadline = self.launch_time + self.args.timeout
+        self.tree = ProcessTree(self.cmd, self.cpus)
+        if self.args.profile_interval > 0:
+            self.sampler = ResourceSampler(self.tree, samples_filepath, self.iteration, self.args.profile_interval)
+            self.sampler.start()
+
+    def wait_for_start(self):
+        if wait_for_test_start(self.tree, self.log_filepath, self.log_offset, self.deadline):
+            self.startup_time = time.perf_counter() - self.launch_time
+            print(self.prefix + "Test started {:.2f} seconds after launch".format(self.startup_time))
+            return True
+        print(self.prefix + "Test did not log its start")
+        return False
+
+    def finish(self, ledger_filepath):
+        args = self.args
+        tree = self.tree
+        if not tree.wait(self.deadline):
+            print(self.prefix + "Test timed out, killing all its processes")
+            tree.kill()
+        if self.sampler is not None:
+            print(self.prefix + "Recorded {} resource usage samples".format(self.sampler.stop()))
+
+        # Continue as soon as all the processes of the test have exited and released their ports
+        release_start = time.perf_counter()
+        released = tree.wait_until_released(args.sleep)
+        if released:
+            print(self.prefix + "Test processes released their resources after {:.2f} seconds".format(time.perf_counter() - release_start))
+        else:
+            # Processes that survived the test, for example forked by a test that exited normally
+            leftovers = tree.kill()
+            self.killed_orphans.extend(leftovers)
+            print(self.prefix + "Test processes did not release their resources within {} seconds, killed {}".format(args.sleep, leftovers))
+            tree.wait_until_released(args.sleep)
+
+        new_log_lines = read_new_log_lines(self.log_filepath, self.log_offset)
+        outcome = tree.get_outcome()
+        append_to_run_ledger(ledger_filepath, {
+            "Iteration": self.iteration,
+            "Run ID": tree.run_id,
+            "Launcher": "java" if args.warm_jvm else "gradle",
+            "Instance": self.instance,
+            "Parallel Instances": self.n_instances,
+            "CPUs": " ".join(str(cpu) for cpu in sorted(self.cpus)) if self.cpus is not None else "",
+            "Outcome": outcome,
+            "Exit Code": tree.process.returncode,
+            "Wall Time": tree.wall_time,
+            "Startup Time": self.startup_time,
+            "Test Start Time": get_test_start_time(new_log_lines),
+            "Peak RSS (kB)": tree.get_peak_rss(),
+            "User CPU Time": tree.rusage.ru_utime,
+            "System CPU Time": tree.rusage.ru_stime,
+            "Robots Done": sum(" done!" in l for l in new_log_lines),
+            "Resources Released": released,
+            "Killed Orphans": " ".join(str(pid) for pid in self.killed_orphans)})
+        print(self.prefix + "Test iteration {} finished with outcome {} after {:.2f} seconds".format(self.iteration, outcome, tree.wall_time))
+
+def get_generator_env():
+    # The scripts in generators import the artifact registry from the root of the repository
+    root_dir = os.path.dirname(os.path.abspath(__file__))
+    python_path = os.environ.get("PYTHONPATH")
+    return dict(os.environ, PYTHONPATH=root_dir if not python_path else root_dir + os.pathsep + python_path)
+
+class LogExtractor():
+    '''Extracts the CSV logs of the finished iterations in the background while the
+    next iteration runs. The parser works on a snapshot of the log, as the next test
+    appends to the log, and only one extraction runs at a time.'''
+    def __init__(self, extract_csv_cmd, log_filepath):
+        self.extract_csv_cmd = extract_csv_cmd
+        self.log_filepath = log_filepath
+        self.snapshot_filepath = os.path.splitext(log_filepath)[0] + "Snapshot.log"
+        # The structured event log is parsed instead of the text log when it exists
+        self.events_filepath = os.path.splitext(log_filepath)[0] + ".jsonl"
+        self.events_snapshot_filepath = os.path.splitext(self.snapshot_filepath)[0] + ".jsonl"
+        self.process = None
+        self.iteration = None
+        self.errors = []
+        self.last_succeeded = False
+
+    def wait(self):
+        if self.process is None:
+            return
+        returncode = self.process.wait()
+        self.last_succeeded = returncode == 0
+        if not self.last_succeeded:
+            self.errors.append("Extracting the CSV log after iteration {} failed with exit code {}".format(self.iteration, returncode))
+        self.process = None
+
+    def start(self, iteration):
+        # The previous extraction ran during this iteration, so it has usually finished by now
+        self.wait()
+        self.iteration = iteration
+        if not os.path.isfile(self.log_filepath):
+            self.last_succeeded = False
+            self.errors.append("No log to extract after iteration {}".format(iteration))
+            return
+        shutil.copyfile(self.log_filepath, self.snapshot_filepath)
+        if os.path.isfile(self.events_filepath):
+            shutil.copyfile(self.events_filepath, self.events_snapshot_filepath)
+        try:
+            self.process = subprocess.Popen(self.extract_csv_cmd + ["--log_file=" + self.snapshot_filepath],
+                                            env=get_generator_env())
+        except OSError as exc:
+            self.last_succeeded = False
+            self.errors.append("Could not extract the CSV log after iteration {}: {}".format(iteration, exc))
+
+    def finish(self):
+        self.wait()
+        for filepath in [self.snapshot_filepath, self.events_snapshot_filepath]:
+            if os.path.isfile(filepath):
+                os.remove(filepath)
+        return self.errors
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--nRobots", type=int, help="Number of robots to be used in the testing. Default: 3", default=3)
@@ -100,13 +296,30 @@ def main():
     parser.add_argument("--nExperiences", type=int, help="Number of training problems used to build the experience DB. Default: 100", default=100)
     parser.add_argument("--nIterations", type=int, help="Number to test iterations to run. Default: 2", default=2)
     parser.add_argument("--timeout", type=int, help="Maximum time allowed for each test in seconds. Default: 300", default=300)
-    parser.add_argument("--sleep", type=int, help="Maximum time to pause between iterations in seconds. Default: 10", default=10)
+    parser.add_argument("--sleep", type=int, help="Maximum time to wait for the processes of an iteration to exit and release their ports in seconds. Default: 10", default=10)
     parser.add_argument("--offline", type=bool, help="Indicate if gradle should try to use the existing snapshots", default=False)
+    parser.add_argument("--warm_jvm", type=bool, help="Build the classpath once and start every iteration directly with java instead of gradle. Default: False", default=False)
+    parser.add_argument("--profile_interval", type=float, help="Interval in seconds at which the resource usage of the test processes is sampled. Default: 0 (no sampling)", default=0)
+    parser.add_argument("--parallel", type=int, help="Number of test instances to run at the same time, each pinned to its own share of the CPUs with its own logs and experience database. Implies --warm_jvm. Default: 1", default=1)
+    parser.add_argument("--serial_baseline", type=int, help="Number of iterations to run one at a time before the parallel ones, to compare their timing. Default: 0", default=0)
     args = parser.parse_args()
 
-    initialize_test(args)
+    if args.parallel > 1 and not args.warm_jvm:
+        # Concurrent gradle builds of the same project would wait for each other
+        print("Running the parallel instances with --warm_jvm")
+        args.warm_jvm = True
+    cpu_sets = partition_cpus(args.parallel) if args.parallel > 1 else None
+
+    archiver = initialize_test(args)
+    log_filepath = os.path.join(get_log_directory(args), "CompleteLog.log")
+    ledger_filepath = os.path.join(get_log_directory(args), "RunLedger.csv")
+    samples_filepath = os.path.join(get_log_directory(args), "ResourceUsage.csv")
 
-    if args.offline:
+    if args.warm_jvm:
+        run_test_cmd = ["java", "-cp", build_run_classpath(args.offline), "se.oru.coordination.coordination_oru.demo.DemoLauncher",
+               "customTests.CustomTesting", str(args.nRobots), str(args.planner), args.map, str(int(args.constrained)),
+               str(int(args.no_hotspots)), str(args.nExperiences)]
+    elif args.offline:
         run_test_cmd = ["./gradlew", "run", "--offline","-Pdemo=customTests.CustomTesting", "-PnRobots="+str(args.nRobots),
                "-Pplanner="+str(args.planner), "-Pmap="+args.map, "-Pconstrained="+str(int(args.constrained)),
                "-Pno_hotspots="+str(int(args.no_hotspots)), "-Pexp="+str(args.nExperiences)]
@@ -124,28 +337,86 @@ def main():
     if args.no_hotspots:
         extract_csv_cmd.extend(["--no_hotspots="+bool_strings[int(args.no_hotspots)]])
 
-    for i in range(args.nIterations):
-        if i > 0:
-            # Sleep for some time to let all the process close properly before starting next iteration
-            print("Waiting {} seconds before starting next iteration...".format(args.sleep))
-            time.sleep(args.sleep)
+    log_dir = get_log_directory(args)
+    experienceDB_path = get_experienceDB_path(args)
+    batch_sizes = get_batch_sizes(args.nIterations, args.parallel, args.serial_baseline)
+    # Number of iterations and the time they took, for the serial and the parallel iterations
+    throughput = {}
+
+    extractor = LogExtractor(extract_csv_cmd, log_filepath)
+    iteration = 0
+    for n_instances in batch_sizes:
+        if iteration > 0:
             print("\n\n\n")
 
-        print("=============== Starting test iteration {}/{} ====================".format(i+1, args.nIterations))
-        try:
-            subprocess.run(run_test_cmd, timeout=args.timeout)
-        except subprocess.TimeoutExpired as exc:
-            print("Test timed out")
+        serial = cpu_sets is None or iteration < args.serial_baseline
+        if n_instances == 1:
+            print("=============== Starting test iteration {}/{} ====================".format(iteration+1, args.nIterations))
+        else:
+            print("=============== Starting test iterations {}-{}/{} on {} instances ====================".format(
+                  iteration+1, iteration+n_instances, args.nIterations, n_instances))
+        batch_start = time.perf_counter()
+        # Processes of earlier launchers that were killed before they could clean up
+        killed_orphans = kill_orphans()
+        if len(killed_orphans) > 0:
+            print("Killed orphaned test processes", killed_orphans)
 
-        # Extract the CSV log of all the iterations executed till now
-        try:
-            subprocess.run(extract_csv_cmd)
-        except:
-            print("Error in extracting CSV log")
+        runs = []
+        if serial:
+            # Serial iterations run exactly like without --parallel, directly on the logs of the configuration
+            runs.append(TestRun(iteration+1, run_test_cmd, log_filepath, args))
+            runs[0].start(samples_filepath)
+            runs[0].wait_for_start()
+        else:
+            instances_dir = os.path.join(log_dir, "Instances")
+            if os.path.isdir(instances_dir):
+                shutil.rmtree(instances_dir)
+            for j in range(n_instances):
+                instance_dir = os.path.join(instances_dir, str(j+1))
+                create_directory_if_needed(instance_dir)
+                instance_cmd = run_test_cmd + [instance_dir, copy_experienceDB(experienceDB_path, instance_dir)]
+                run = TestRun(iteration+j+1, instance_cmd, os.path.join(instance_dir, "CompleteLog.log"), args,
+                              j+1, n_instances, cpu_sets[j])
+                runs.append(run)
+                run.start(samples_filepath)
+                # The tests are identified by their start time, which is logged with a resolution of
+                # one second, so the next instance is only launched a second after this one started
+                if run.wait_for_start() and j < n_instances - 1:
+                    time.sleep(1.0)
+        runs[0].killed_orphans.extend(killed_orphans)
+
+        for run in runs:
+            run.finish(ledger_filepath)
+        if not serial:
+            for j in range(n_instances):
+                merge_instance_logs(os.path.join(instances_dir, str(j+1)), log_dir)
+            shutil.rmtree(instances_dir)
+
+        iteration += n_instances
+        mode = "serial" if serial else "parallel"
+        n_done, elapsed = throughput.get(mode, (0, 0.0))
+        throughput[mode] = (n_done + n_instances, elapsed + time.perf_counter() - batch_start)
+
+        # Extract the CSV log of all the iterations executed till now while the next iteration runs
+        extractor.start(iteration)
+
+    for mode, (n_done, elapsed) in throughput.items():
+        print("{} {} iterations in {:.1f} seconds ({:.1f} seconds per iteration)".format(n_done, mode, elapsed, elapsed / n_done))
+    if len(throughput) > 1:
+        print("Run AnalyzeLogs.py to compare the timing of the serial and the parallel iterations")
+
+    errors = extractor.finish()
+    for e in errors:
+        print(e)
+    register_logs(args, log_filepath, experienceDB_path, extractor.last_succeeded)
 
-    # Sleep for some time to let all the process close properly
-    time.sleep(args.sleep)
+    if archiver is not None and archiver.is_alive():
+        print("Waiting for the archiving of the previous logs to finish...")
+        archiver.join()
     print("All tests completed!")
+    # The CSV logs are extracted from the complete log every time, so only the last extraction matters
+    if not extractor.last_succeeded:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,160 @@
+import os
+import shutil
+import json
+import tarfile
+import threading
+import zipfile
+import datetime
+import time
+from artifactRegistry import hash_file
+
+# zstandard or lz4 are used to compress the archives if one of them is installed,
+# otherwise the archives are zip files compressed with the fastest deflate level
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+# Archives the logs of previous test runs without delaying the next run. The files are
+# first moved into a staging directory, which only renames them, so the log directory
+# is clean right away. A background thread then compresses the staged files into a
+# timestamped archive next to the logs and deletes them. The index lists every archived
+# file by its path relative to the log directory, with the hash of its content in every
+# run it was archived from. A content that is already stored in an earlier archive is
+# not stored again, and the index tells in which archive and under which name it is.
+
+archive_extensions = (".zip", ".tar.zst", ".tar.lz4")
+staging_dirname = ".archiveStaging"
+index_filename = "ArchiveIndex.json"
+
+def is_archive_file(filename):
+    return filename.endswith(archive_extensions) or filename == index_filename
+
+def stage_logs(base_dir):
+    '''Moves all the files below base_dir that are not archives into a new staging
+    directory and returns it, or None if there was nothing to archive.'''
+    staging_dir = os.path.join(base_dir, staging_dirname, datetime.datetime.now().strftime("%H:%M:%S %b %d %Y"))
+    n_staged = 0
+    for root, dirs, files in os.walk(base_dir):
+        if staging_dirname in dirs:
+            dirs.remove(staging_dirname)
+        for file in files:
+            if is_archive_file(file):
+                continue
+            filepath = os.path.join(root, file)
+            staged_filepath = os.path.join(staging_dir, os.path.relpath(filepath, base_dir))
+            os.makedirs(os.path.dirname(staged_filepath), exist_ok=True)
+            # Dummy logs are placeholders that have to stay in the log directory
+            if file.endswith(".dummyLog"):
+                shutil.copy2(filepath, staged_filepath)
+            else:
+                os.rename(filepath, staged_filepath)
+            n_staged += 1
+    return staging_dir if n_staged > 0 else None
+
+def load_index(base_dir):
+    index_filepath = os.path.join(base_dir, index_filename)
+    if not os.path.isfile(index_filepath):
+        return {"files": {}, "stored": {}}
+    with open(index_filepath) as f:
+        index = json.load(f)
+    if "files" not in index:
+        # Earlier indexes only mapped the hash of every stored content to its archive
+        index = {"files": {}, "stored": {h: {"archive": a, "member": None} for h, a in index.items()}}
+    return index
+
+def save_index(base_dir, index):
+    index_filepath = os.path.join(base_dir, index_filename)
+    with open(index_filepath + ".tmp", 'w') as f:
+        json.dump(index, f, indent=1)
+    os.replace(index_filepath + ".tmp", index_filepath)
+
+class ArchiveWriter():
+    def __init__(self, base_filepath):
+        self.zip = None
+        self.tar = None
+        self.stream = None
+        self.file = None
+        if zstandard is not None:
+            self.filepath = base_filepath + ".tar.zst"
+            self.file = open(self.filepath + ".partial", 'wb')
+            self.stream = zstandard.ZstdCompressor(level=3).stream_writer(self.file)
+            self.tar = tarfile.open(fileobj=self.stream, mode="w|")
+        elif lz4 is not None:
+            self.filepath = base_filepath + ".tar.lz4"
+            self.stream = lz4.frame.open(self.filepath + ".partial", 'wb')
+            self.tar = tarfile.open(fileobj=self.stream, mode="w|")
+        else:
+            self.filepath = base_filepath + ".zip"
+            self.zip = zipfile.ZipFile(self.filepath + ".partial", 'w', zipfile.ZIP_DEFLATED, compresslevel=1)
+
+    def add(self, filepath, arc_name):
+        if self.zip is not None:
+            self.zip.write(filepath, arc_name)
+        else:
+            self.tar.add(filepath, arc_name)
+
+    def close(self):
+        if self.zip is not None:
+            self.zip.close()
+        else:
+            self.tar.close()
+            self.stream.close()
+            if self.file is not None and not self.file.closed:
+                self.file.close()
+        # The archive only gets its final name once it is complete
+        os.replace(self.filepath + ".partial", self.filepath)
+
+def archive_staged_logs(base_dir, staging_dir):
+    start_time = time.time()
+    index = load_index(base_dir)
+    archive_name = os.path.basename(staging_dir)
+    archive = None
+    n_archived = 0
+    n_duplicates = 0
+    for root, dirs, files in os.walk(staging_dir):
+        for file in sorted(files):
+            if file.endswith(".partial"):
+                continue
+            filepath = os.path.join(root, file)
+            rel_path = os.path.relpath(filepath, staging_dir)
+            file_hash = hash_file(filepath)
+            index["files"].setdefault(rel_path, {})[archive_name] = file_hash
+            if file_hash in index["stored"]:
+                n_duplicates += 1
+                continue
+            if archive is None:
+                archive = ArchiveWriter(os.path.join(staging_dir, archive_name))
+            archive.add(filepath, rel_path)
+            index["stored"][file_hash] = {"archive": archive_name, "member": rel_path}
+            n_archived += 1
+
+    if archive is not None:
+        archive.close()
+        os.replace(archive.filepath, os.path.join(base_dir, os.path.basename(archive.filepath)))
+    if n_archived + n_duplicates > 0:
+        save_index(base_dir, index)
+    shutil.rmtree(staging_dir)
+    print("Archived {} log files of {} ({} already archived) in {:.1f} seconds".format(n_archived, archive_name, n_duplicates,
+                                                                                     time.time() - start_time))
+
+def archive_pending_logs(base_dir):
+    # Staging directories of launchers that were interrupted are archived as well
+    staging_root = os.path.join(base_dir, staging_dirname)
+    for staging_name in sorted(os.listdir(staging_root)):
+        archive_staged_logs(base_dir, os.path.join(staging_root, staging_name))
+    os.rmdir(staging_root)
+
+def start_archiving(base_dir):
+    '''Stages the logs below base_dir and archives them in a background thread, which
+    is returned. The thread is not a daemon, so the interpreter waits for it at exit.'''
+    stage_logs(base_dir)
+    if not os.path.isdir(os.path.join(base_dir, staging_dirname)):
+        return None
+    thread = threading.Thread(target=archive_pending_logs, args=(base_dir,), name="LogArchiver")
+    thread.start()
+    return thread
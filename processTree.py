@@ -0,0 +1,227 @@
+import os
+import signal
+import subprocess
+import time
+import uuid
+
+# Tracks all the processes that are started for one test iteration, so that the next
+# iteration is only started once they have all exited and released their ports. The
+# test is started in its own process group, and every process of the group, every
+# descendant of the test and every process that inherited the run ID from the
+# environment of the test belongs to the tree. The last one catches the JVM that the
+# gradle daemon starts for "gradlew run", which is neither a descendant nor in the
+# process group of the test. Only works on Linux, since it reads /proc.
+
+run_id_variable = "LAUNCH_TESTS_RUN_ID"
+launcher_pid_variable = "LAUNCH_TESTS_LAUNCHER_PID"
+
+def read_process_stat(pid):
+    try:
+        with open("/proc/{}/stat".format(pid)) as f:
+            stat = f.read()
+    except (FileNotFoundError, ProcessLookupError, PermissionError):
+        return None
+    # The command name is in parentheses and may contain spaces
+    fields = stat[stat.rfind(")") + 2:].split()
+    # state, ppid, pgid, start time
+    return fields[0], int(fields[1]), int(fields[2]), int(fields[19])
+
+def list_processes():
+    processes = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            stat = read_process_stat(int(entry))
+            if stat is not None:
+                processes[int(entry)] = stat
+    return processes
+
+def read_process_file(pid, name):
+    try:
+        with open("/proc/{}/{}".format(pid, name), 'rb') as f:
+            return f.read()
+    except (FileNotFoundError, ProcessLookupError, PermissionError):
+        return b""
+
+def read_environ_variable(environ, name):
+    prefix = (name + "=").encode()
+    for entry in environ.split(b"\0"):
+        if entry.startswith(prefix):
+            return entry[len(prefix):].decode()
+    return None
+
+def exit_code_from_status(status):
+    # Negative signal number if the process was killed, like Popen.returncode
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+def kill_orphans():
+    '''Kills the test processes left behind by launchers that are no longer running,
+    for example after a launcher was killed itself. Returns the killed pids.'''
+    killed = []
+    for pid in list_processes():
+        environ = read_process_file(pid, "environ")
+        launcher_pid = read_environ_variable(environ, launcher_pid_variable)
+        if launcher_pid is None or b"GradleDaemon" in read_process_file(pid, "cmdline"):
+            continue
+        launcher_pid = int(launcher_pid)
+        if launcher_pid != os.getpid() and not os.path.exists("/proc/{}".format(launcher_pid)):
+            try:
+                os.kill(pid, signal.SIGKILL)
+                killed.append(pid)
+            except (ProcessLookupError, PermissionError):
+                pass
+    return killed
+
+def get_socket_inodes(pid):
+    inodes = set()
+    fd_dir = "/proc/{}/fd".format(pid)
+    try:
+        fds = os.listdir(fd_dir)
+    except (FileNotFoundError, ProcessLookupError, PermissionError):
+        return inodes
+    for fd in fds:
+        try:
+            target = os.readlink(os.path.join(fd_dir, fd))
+        except OSError:
+            continue
+        if target.startswith("socket:["):
+            inodes.add(int(target[8:-1]))
+    return inodes
+
+def get_listening_sockets():
+    # Maps the inode of every listening TCP socket to its port
+    sockets = {}
+    for table in ["/proc/net/tcp", "/proc/net/tcp6"]:
+        try:
+            with open(table) as f:
+                lines = f.readlines()[1:]
+        except FileNotFoundError:
+            continue
+        for l in lines:
+            fields = l.split()
+            if fields[3] == "0A":
+                sockets[int(fields[9])] = int(fields[1].split(":")[-1], 16)
+    return sockets
+
+class ProcessTree():
+    def __init__(self, cmd, cpus=None):
+        self.run_id = uuid.uuid4().hex
+        env = dict(os.environ)
+        env[run_id_variable] = self.run_id
+        env[launcher_pid_variable] = str(os.getpid())
+        self.launch_time = time.perf_counter()
+        # The CPU affinity is set before the command is executed and inherited by all its descendants
+        preexec_fn = (lambda: os.sched_setaffinity(0, cpus)) if cpus is not None else None
+        self.process = subprocess.Popen(cmd, env=env, start_new_session=True, preexec_fn=preexec_fn)
+        self.pgid = self.process.pid
+        # Filled in when the started process is reaped with wait4
+        self.wall_time = None
+        self.rusage = None
+        self.timed_out = False
+        # The start time identifies a process together with its pid, as pids are reused
+        self.members = {}
+        self.ignored = set()
+        self.ports = set()
+        self.update()
+
+    def is_member(self, pid, stat, processes):
+        state, ppid, pgid, start_time = stat
+        if pgid == self.pgid or (ppid in self.members and processes.get(ppid, (None,) * 4)[3] == self.members[ppid]):
+            return True
+        if (pid, start_time) in self.ignored:
+            return False
+        environ = read_process_file(pid, "environ")
+        cmdline = read_process_file(pid, "cmdline")
+        # A gradle daemon started by the test is shared with later builds and is not waited for
+        if read_environ_variable(environ, run_id_variable) == self.run_id and b"GradleDaemon" not in cmdline:
+            return True
+        self.ignored.add((pid, start_time))
+        return False
+
+    def update(self):
+        processes = list_processes()
+        new_members = True
+        while new_members:
+            new_members = False
+            for pid, stat in processes.items():
+                if pid not in self.members and self.is_member(pid, stat, processes):
+                    self.members[pid] = stat[3]
+                    new_members = True
+
+        alive = self.get_alive_members(processes)
+        if len(alive) > 0:
+            listening = get_listening_sockets()
+            for pid in alive:
+                self.ports.update(listening[inode] for inode in get_socket_inodes(pid) if inode in listening)
+        return alive
+
+    def get_alive_members(self, processes=None):
+        if processes is None:
+            processes = list_processes()
+        # The members are copied first, since a sampling thread may call this during an update
+        return [pid for pid, start_time in list(self.members.items())
+                if pid in processes and processes[pid][3] == start_time and processes[pid][0] != "Z"]
+
+    def reap(self, block):
+        # The process is reaped with wait4 instead of Popen.wait to get its resource usage
+        if self.process.returncode is not None:
+            return True
+        pid, status, rusage = os.wait4(self.process.pid, 0 if block else os.WNOHANG)
+        if pid == 0:
+            return False
+        self.wall_time = time.perf_counter() - self.launch_time
+        self.rusage = rusage
+        self.process.returncode = exit_code_from_status(status)
+        return True
+
+    def wait(self, deadline, poll_interval=0.5):
+        '''Waits until the started process exits or the deadline passes, and returns
+        False if the deadline passed.'''
+        while not self.reap(block=False):
+            if time.perf_counter() >= deadline:
+                return False
+            self.update()
+            time.sleep(max(0.0, min(poll_interval, deadline - time.perf_counter())))
+        return True
+
+    def kill(self):
+        '''Kills all the processes of the tree and returns their pids.'''
+        if self.process.returncode is None:
+            self.timed_out = True
+        alive = self.update()
+        try:
+            os.killpg(self.pgid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        for pid in alive:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        self.reap(block=True)
+        return alive
+
+    def get_outcome(self):
+        if self.timed_out:
+            return "timeout"
+        return "ok" if self.process.returncode == 0 else "crash"
+
+    def get_peak_rss(self):
+        # In kilobytes. Only covers the started process and the descendants it waited for,
+        # so not the JVM that a gradle daemon starts
+        return self.rusage.ru_maxrss if self.rusage is not None else None
+
+    def wait_until_released(self, timeout, poll_interval=0.1):
+        '''Waits until all the processes of the tree have exited and the ports they were
+        listening on are free again. Returns False if that did not happen in time.'''
+        deadline = time.perf_counter() + timeout
+        while True:
+            alive = self.update()
+            busy_ports = self.ports.intersection(get_listening_sockets().values())
+            if len(alive) == 0 and len(busy_ports) == 0:
+                return True
+            if time.perf_counter() >= deadline:
+                print("Still running processes:", alive, "still listening ports:", sorted(busy_ports))
+                return False
+            time.sleep(poll_interval)
@@ -0,0 +1,82 @@
+import os
+import threading
+import time
+import csv
+from processTree import read_process_file
+
+# Samples the resource usage of all the processes of a test from /proc at a fixed
+# interval while the test runs. CPU usage is in percent of one core, the read and
+# written bytes are the disk I/O since the previous sample. The samples of every
+# iteration are appended to a CSV file next to the logs when the iteration finished.
+
+clock_ticks = os.sysconf("SC_CLK_TCK")
+page_size = os.sysconf("SC_PAGE_SIZE")
+sample_columns = ["Iteration", "Time", "Processes", "Threads", "CPU (%)", "RSS (MB)", "Read (kB)", "Written (kB)"]
+
+def read_process_usage(pid):
+    stat = read_process_file(pid, "stat").decode()
+    if len(stat) == 0:
+        return None
+    fields = stat[stat.rfind(")") + 2:].split()
+    io = {}
+    for l in read_process_file(pid, "io").decode().splitlines():
+        key, value = l.split(":")
+        io[key] = int(value)
+    # start time, cpu ticks, threads, rss bytes, read bytes, written bytes
+    return (int(fields[19]), int(fields[11]) + int(fields[12]), int(fields[17]), int(fields[21]) * page_size,
+            io.get("read_bytes", 0), io.get("write_bytes", 0))
+
+class ResourceSampler(threading.Thread):
+    def __init__(self, tree, samples_filepath, iteration, interval):
+        super().__init__(name="ResourceSampler", daemon=True)
+        self.tree = tree
+        self.samples_filepath = samples_filepath
+        self.iteration = iteration
+        self.interval = interval
+        self.samples = []
+        self.previous = {}
+        self.stop_event = threading.Event()
+
+    def sample(self):
+        now = time.time()
+        n_processes = n_threads = rss = cpu_ticks = read_bytes = written_bytes = 0
+        current = {}
+        for pid in self.tree.get_alive_members():
+            usage = read_process_usage(pid)
+            if usage is None:
+                continue
+            start_time, ticks, threads, process_rss, process_read, process_written = usage
+            current[(pid, start_time)] = (ticks, process_read, process_written)
+            n_processes += 1
+            n_threads += threads
+            rss += process_rss
+            # Processes that started since the last sample count from their start
+            previous_ticks, previous_read, previous_written = self.previous.get((pid, start_time), (0, 0, 0))
+            cpu_ticks += ticks - previous_ticks
+            read_bytes += process_read - previous_read
+            written_bytes += process_written - previous_written
+
+        # Nothing to record once all the processes have exited
+        if n_processes == 0:
+            return
+        elapsed = now - self.samples[-1][1] if len(self.samples) > 0 else self.interval
+        self.previous = current
+        self.samples.append((self.iteration, round(now, 3), n_processes, n_threads,
+                             round(100.0 * cpu_ticks / clock_ticks / max(elapsed, 1e-3), 1), round(rss / 1e6, 1),
+                             read_bytes // 1000, written_bytes // 1000))
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.sample()
+            self.stop_event.wait(self.interval)
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+        write_header = not os.path.isfile(self.samples_filepath)
+        with open(self.samples_filepath, 'a', newline='') as f:
+            writer = csv.writer(f)
+            if write_header:
+                writer.writerow(sample_columns)
+            writer.writerows(self.samples)
+        return len(self.samples)
@@ -0,0 +1,270 @@
+import os
+import sys
+import subprocess
+import argparse
+import itertools
+import sqlite3
+import datetime
+import time
+import yaml
+import pandas as pd
+import launchTests
+import artifactRegistry
+from processTree import kill_orphans
+
+# Runs a sweep of test configurations described by a YAML grid. Every value of the grid
+# keys may be a single value or a list, and every combination of them is one job that
+# runs launchTests.py for nIterations iterations. Example spec:
+#
+#   name: BRSU_Floor0_Comparison
+#   map: [BRSU_Floor0]
+#   planner: [0, 1, 2, 3]
+#   nRobots: [3, 5, 10]
+#   constrained: [False]
+#   no_hotspots: [False]
+#   nExperiences: [100]
+#   nIterations: 50
+#   timeout: 120
+#   warm_jvm: True
+#   cpus_per_job: 2
+#   parallel: 1
+#   serial_baseline: 0
+#
+# Independent jobs run concurrently, each configuration writes to its own execution log
+# directory, and the output of every job is kept in its own file in the campaign
+# directory. The state of the jobs is saved after every change, so running the same
+# spec again only runs the jobs that are missing, failed or were interrupted.
+
+grid_keys = ["map", "planner", "nRobots", "constrained", "no_hotspots", "nExperiences"]
+grid_defaults = {"map": "BRSU_Floor0", "planner": 1, "nRobots": 3, "constrained": False,
+                 "no_hotspots": False, "nExperiences": 100}
+run_defaults = {"nIterations": 2, "timeout": 300, "sleep": 10, "offline": False, "warm_jvm": False, "profile_interval": 0,
+                "cpus_per_job": 2, "parallel": 1, "serial_baseline": 0}
+experience_planners = [1, 2, 3]
+
+def load_spec(spec_filepath):
+    with open(spec_filepath, 'r') as stream:
+        spec = yaml.safe_load(stream)
+    unknown = set(spec.keys()) - set(grid_keys) - set(run_defaults.keys()) - {"name"}
+    assert len(unknown) == 0, "Unknown keys in campaign spec: {}".format(", ".join(sorted(unknown)))
+    if "name" not in spec:
+        spec["name"] = os.path.splitext(os.path.basename(spec_filepath))[0]
+    for k, v in run_defaults.items():
+        spec.setdefault(k, v)
+    return spec
+
+def expand_jobs(spec):
+    values = []
+    for k in grid_keys:
+        v = spec.get(k, grid_defaults[k])
+        values.append(v if isinstance(v, list) else [v])
+
+    jobs = []
+    for combination in itertools.product(*values):
+        config = argparse.Namespace(**dict(zip(grid_keys, combination)))
+        jobs.append((get_job_id(config), config))
+    return jobs
+
+def get_job_id(config):
+    return "{}-{}-{}_Robots-{}-{}-{}_TrainingExperiences".format(config.map, artifactRegistry.planner_names[config.planner],
+                                                                 config.nRobots, artifactRegistry.get_kinematics_name(config.constrained),
+                                                                 artifactRegistry.get_sampling_name(config.no_hotspots), config.nExperiences)
+
+def get_resource_key(config):
+    # The experience based planners save new experiences to the database while testing,
+    # and the database does not depend on the number of robots, so the jobs that share a
+    # database must not run at the same time
+    if config.planner not in experience_planners:
+        return None
+    return (config.map, config.planner, config.constrained, config.no_hotspots, config.nExperiences)
+
+def get_launch_command(config, spec):
+    # launchTests.py parses its flags with type=bool, so a flag is only passed when it is set
+    cmd = ["python3", "launchTests.py", "--map="+config.map, "--planner="+str(config.planner),
+           "--nRobots="+str(config.nRobots), "--nExperiences="+str(config.nExperiences),
+           "--nIterations="+str(spec["nIterations"]), "--timeout="+str(spec["timeout"]),
+           "--sleep="+str(spec["sleep"])]
+    if config.constrained:
+        cmd.append("--constrained=True")
+    if config.no_hotspots:
+        cmd.append("--no_hotspots=True")
+    if spec["offline"]:
+        cmd.append("--offline=True")
+    if spec["warm_jvm"]:
+        cmd.append("--warm_jvm=True")
+    if spec["profile_interval"] > 0:
+        cmd.append("--profile_interval="+str(spec["profile_interval"]))
+    if spec["parallel"] > 1:
+        cmd.extend(["--parallel="+str(spec["parallel"]), "--serial_baseline="+str(spec["serial_baseline"])])
+    return cmd
+
+def find_execution_csv(config):
+    # The registry knows where the tests of the configuration wrote their CSV log, the
+    # path is only built for the runs that were not registered
+    if os.path.isfile(artifactRegistry.registry_filepath):
+        try:
+            with artifactRegistry.ArtifactRegistry() as registry:
+                execution_csv = registry.find("executionCSV", launchTests.get_test_config(config))
+            if execution_csv is not None:
+                return execution_csv
+        except sqlite3.Error as exc:
+            print("Could not query the artifact registry:", exc)
+    return os.path.join(launchTests.get_log_directory(config), "Execution.csv")
+
+def count_completed_iterations(config):
+    execution_csv = find_execution_csv(config)
+    if not os.path.isfile(execution_csv):
+        return 0
+    try:
+        df = pd.read_csv(execution_csv)
+    except (pd.errors.EmptyDataError, pd.errors.ParserError):
+        return 0
+    return df["Test Start Time"].nunique()
+
+class CampaignState():
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.jobs = {}
+        if os.path.isfile(filepath):
+            with open(filepath, 'r') as stream:
+                self.jobs = yaml.safe_load(stream) or {}
+
+    def get_status(self, job_id):
+        return self.jobs.get(job_id, {}).get("status", "missing")
+
+    def update(self, job_id, **values):
+        self.jobs.setdefault(job_id, {}).update(values)
+        self.save()
+
+    def save(self):
+        # Written to a temporary file first so that an interrupted campaign never leaves a broken state file
+        tmp_filepath = self.filepath + ".tmp"
+        with open(tmp_filepath, 'w') as stream:
+            yaml.safe_dump(self.jobs, stream, default_flow_style=False)
+        os.replace(tmp_filepath, self.filepath)
+
+class CampaignRunner():
+    def __init__(self, spec, root_dir, campaign_dir, cpu_budget, rerun_all=False):
+        self.spec = spec
+        self.root_dir = root_dir
+        self.campaign_dir = campaign_dir
+        # cpus_per_job is the share of one test instance, a job may run several instances at once
+        cpus_per_job = spec["cpus_per_job"] * spec["parallel"]
+        self.max_parallel_jobs = max(1, cpu_budget // cpus_per_job)
+        # Jobs that pin their instances to CPUs get disjoint sets of CPUs to split between them
+        self.free_cpu_sets = None
+        if spec["parallel"] > 1:
+            cpus = sorted(os.sched_getaffinity(0))[:max(cpu_budget, cpus_per_job)]
+            cpu_sets = [set(cpus[i*cpus_per_job:(i+1)*cpus_per_job]) for i in range(self.max_parallel_jobs)]
+            # With fewer CPUs than the budget the last jobs get no CPUs of their own and are not pinned
+            self.free_cpu_sets = [s for s in cpu_sets if len(s) > 0]
+        self.job_cpus = {}
+        self.state = CampaignState(os.path.join(campaign_dir, "CampaignState.yaml"))
+        self.jobs = self.get_pending_jobs(expand_jobs(spec), rerun_all)
+
+    def get_pending_jobs(self, jobs, rerun_all):
+        pending = []
+        for job_id, config in jobs:
+            status = self.state.get_status(job_id)
+            # A completed job is run again if its logs were removed since
+            if not rerun_all and status == "completed" and count_completed_iterations(config) >= self.spec["nIterations"]:
+                continue
+            if status != "missing":
+                print("Job", job_id, "is", status, "and will be run again")
+            pending.append((job_id, config))
+        return pending
+
+    def start_job(self, job_id, config):
+        output_filepath = os.path.join(self.campaign_dir, job_id + ".log")
+        output = open(output_filepath, 'w')
+        preexec_fn = None
+        if self.free_cpu_sets:
+            cpus = self.job_cpus[job_id] = self.free_cpu_sets.pop(0)
+            preexec_fn = lambda: os.sched_setaffinity(0, cpus)
+        process = subprocess.Popen(get_launch_command(config, self.spec), stdout=output, stderr=subprocess.STDOUT,
+                                   cwd=self.root_dir, preexec_fn=preexec_fn)
+        attempts = self.state.jobs.get(job_id, {}).get("attempts", 0) + 1
+        self.state.update(job_id, status="running", attempts=attempts, output=output_filepath,
+                          log_directory=launchTests.get_log_directory(config),
+                          started=datetime.datetime.now().isoformat(timespec="seconds"))
+        print("Started job", job_id)
+        return process, output
+
+    def finish_job(self, job_id, config, process):
+        if job_id in self.job_cpus:
+            self.free_cpu_sets.append(self.job_cpus.pop(job_id))
+        n_completed = count_completed_iterations(config)
+        if process.returncode == 0 and n_completed >= self.spec["nIterations"]:
+            status = "completed"
+        else:
+            status = "failed"
+        self.state.update(job_id, status=status, returncode=process.returncode, completed_iterations=int(n_completed),
+                          finished=datetime.datetime.now().isoformat(timespec="seconds"))
+        print("Job", job_id, status, "({}/{} iterations)".format(n_completed, self.spec["nIterations"]))
+
+    def run(self):
+        waiting = list(self.jobs)
+        running = {}
+        n_jobs = len(waiting)
+        print("Running", n_jobs, "jobs with up to", self.max_parallel_jobs, "jobs in parallel")
+
+        try:
+            while len(waiting) > 0 or len(running) > 0:
+                # Start the next jobs whose experience database is not used by a running job
+                busy_resources = set(get_resource_key(config) for config, _, _ in running.values())
+                for job in list(waiting):
+                    if len(running) >= self.max_parallel_jobs:
+                        break
+                    job_id, config = job
+                    resource = get_resource_key(config)
+                    if resource is not None and resource in busy_resources:
+                        continue
+                    waiting.remove(job)
+                    busy_resources.add(resource)
+                    process, output = self.start_job(job_id, config)
+                    running[job_id] = (config, process, output)
+
+                time.sleep(1)
+                for job_id, (config, process, output) in list(running.items()):
+                    if process.poll() is not None:
+                        output.close()
+                        del running[job_id]
+                        self.finish_job(job_id, config, process)
+                        print("[{}/{}] jobs finished".format(n_jobs - len(waiting) - len(running), n_jobs))
+        finally:
+            # Interrupted jobs stay in the running state and are run again on the next invocation
+            for config, process, output in running.values():
+                process.terminate()
+                process.wait()
+                output.close()
+            # The tests run in sessions of their own, so they do not get the signal of their
+            # launchTests.py and are killed as orphans once it exited
+            if len(running) > 0:
+                killed = kill_orphans()
+                if len(killed) > 0:
+                    print("Killed the test processes of the interrupted jobs", killed)
+
+        failed = [job_id for job_id, _ in self.jobs if self.state.get_status(job_id) != "completed"]
+        print("Campaign finished with", len(failed), "failed jobs")
+        for job_id in failed:
+            print("  ", job_id)
+        return failed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("spec", type=str, help="Path to the YAML file describing the grid of test configurations")
+    parser.add_argument("--cpus", type=int, help="Number of CPUs the concurrent jobs may use. Default: all", default=os.cpu_count())
+    parser.add_argument("--rerun_all", type=bool, help="Run all the jobs again, also the completed ones. Default: False", default=False)
+    args = parser.parse_args()
+
+    spec = load_spec(args.spec)
+    root_dir = os.path.abspath(os.path.split(os.path.abspath(sys.argv[0]))[0])
+    campaign_dir = os.path.join(root_dir, "generated", "campaigns", spec["name"])
+    launchTests.create_directory_if_needed(campaign_dir)
+
+    runner = CampaignRunner(spec, root_dir, campaign_dir, args.cpus, args.rerun_all)
+    failed = runner.run()
+    sys.exit(1 if len(failed) > 0 else 0)
+
+if __name__ == "__main__":
+    main()
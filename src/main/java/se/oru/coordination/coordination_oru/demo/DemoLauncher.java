@@ -30,6 +30,7 @@ public class DemoLauncher {
         "\nconstrained represents if the robot must follow ReedsSheep car like motion"+
         "\nno_hotspots represents if the experiences were generated using uniform sampling of the map"+
         "\nexp represents the number of training problems used to build the experience DB"+
+        "\n\nlaunchTests.py --parallel also passes the log directory and the experience DB of every instance"+
         "\nAvailable options for <demo>");
 
 		List<ClassLoader> classLoadersList = new LinkedList<ClassLoader>();
@@ -72,7 +73,8 @@ public class DemoLauncher {
 		//Forces to loads the class so that license and (c) are printed even if no demo is invoked
         Class.forName("se.oru.coordination.coordination_oru.TrajectoryEnvelopeCoordinator");
 
-		if (args.length == 1 || args.length == 7) {
+		// 7 arguments for a test configuration, 9 when a parallel instance also passes its log directory and experience DB
+		if (args.length == 1 || args.length == 7 || args.length == 9) {
 			String className = args[0];
 			try {
 				Class<?> cl = Class.forName(testsPackage+"."+className);
@@ -8,6 +8,7 @@ import java.util.ArrayList;
 import java.util.Calendar;
 import java.util.Comparator;
 
+import com.google.gson.JsonObject;
 import com.vividsolutions.jts.geom.Coordinate;
 
 import org.metacsp.multi.spatioTemporal.paths.Pose;
@@ -56,6 +57,10 @@ public abstract class CustomTesting {
 
     protected static String logDir_;
     protected static String logFilename_;
+    protected static String eventsFilename_;
+    // Set when several instances of the test run in parallel, each with its own logs and database
+    protected static String logDirOverride_ = null;
+    protected static String experienceDBOverride_ = null;
 
     protected static void parseArguments(String[] args) {
         if (args != null && args.length >= 3 )
@@ -66,6 +71,11 @@ public abstract class CustomTesting {
             useReedsSheepCars_ = Integer.parseInt(args[3]) > 0;
             useHotspots_ = Integer.parseInt(args[4]) < 1;
             nExperiences_ = Integer.parseInt(args[5]);
+            if (args.length >= 8) {
+                logDirOverride_ = args[6].endsWith("/") ? args[6] : args[6] + "/";
+                // "-" keeps the shared database, for the planners that do not use one
+                experienceDBOverride_ = args[7].equals("-") ? null : args[7];
+            }
         }
         else {
             System.out.println("ERROR: Insuficient number of arguments passed!!");
@@ -76,6 +86,8 @@ public abstract class CustomTesting {
         mapConfig_ = "maps/" + mapName_ + ".yaml";
         missionConfig_ = "generated/testingData/" + mapName_ + "-" + nRobots_ + "Problems.txt";
         logFilename_ = getLogFileName();
+        // Structured events, one JSON object per line, next to the text log (see LogParser.py)
+        eventsFilename_ = logDir_ + "CompleteLog.jsonl";
     }
 
     protected static void setupTEC() {
@@ -191,11 +203,16 @@ public abstract class CustomTesting {
         logDir_ = "generated/executionData/" + mapName_ + plannerName +
                   Integer.toString(nRobots_) + "_Robots/" + kinematics + "/" + 
                   samplingName + "/" + Integer.toString(nExperiences_) + "_TrainingExperiences/Logs/";
+        if (logDirOverride_ != null)
+            logDir_ = logDirOverride_;
 
         return logDir_ + "CompleteLog.log";
     }
 
     protected static String getExperienceDBName() {
+        if (experienceDBOverride_ != null)
+            return experienceDBOverride_;
+
         String dbName = "_unknown";
         if (plannerType_ == OMPLPlanner.PLANNER_TYPE.LIGHTNING)
             dbName = "Lightning.db";
@@ -213,6 +230,19 @@ public abstract class CustomTesting {
         return dbPath;
     }
 
+    protected static void logEvent(JsonObject event) {
+        appendToFile(eventsFilename_, event.toString() + "\n");
+    }
+
+    protected static JsonObject getMissionEvent(String type, int robotID, int missionNumber, String time) {
+        JsonObject event = new JsonObject();
+        event.addProperty("event", type);
+        event.addProperty("robot", robotID);
+        event.addProperty("mission", missionNumber);
+        event.addProperty("time", time);
+        return event;
+    }
+
     protected static String getCurrentTime() {
         SimpleDateFormat sdf = new SimpleDateFormat("dd-MM-yyyy kk:mm:ss");
 	    return sdf.format(Calendar.getInstance().getTime());
@@ -353,7 +383,13 @@ public abstract class CustomTesting {
         setupTEC();
 
         Missions.loadLocationAndPathData(missionConfig_);
-        appendToFile(logFilename_, "\n\nTest \"" + mapName_ + "\" started at " + getCurrentTime() + "\n");
+        String testStartTime = getCurrentTime();
+        appendToFile(logFilename_, "\n\nTest \"" + mapName_ + "\" started at " + testStartTime + "\n");
+        JsonObject testStartEvent = new JsonObject();
+        testStartEvent.addProperty("event", "test_start");
+        testStartEvent.addProperty("test_name", mapName_);
+        testStartEvent.addProperty("time", testStartTime);
+        logEvent(testStartEvent);
 
         int[] robotIDs = addMissions();
         // int[] robotIDs = initializeRobots();
@@ -383,10 +419,14 @@ public abstract class CustomTesting {
                         synchronized(tec_) {
                             if (tec_.isFree(robotID)) {
                                 if (!firstTime) {
+                                    String completionTime = getCurrentTime();
                                     appendToFile(logFilename_, robotTag + " Mission " + missionNumber + " from " + sourceLocation +
-                                    " to " + destinationLocation + " completed at " + getCurrentTime() + "\n");
+                                    " to " + destinationLocation + " completed at " + completionTime + "\n");
                                     long elapsed = Calendar.getInstance().getTimeInMillis()-startTime;
                                     appendToFile(logFilename_, robotTag + " Time to complete mission " + missionNumber + " : " + elapsed/1000.0 + "s\n");
+                                    JsonObject completionEvent = getMissionEvent("mission_complete", robotID, missionNumber, completionTime);
+                                    completionEvent.addProperty("duration", elapsed/1000.0);
+                                    logEvent(completionEvent);
 
                                     missionNumber = missionNumber+1;
                                     if (missionNumber >= maxNumOfMissions)
@@ -400,8 +440,13 @@ public abstract class CustomTesting {
                                 Mission m = Missions.getMission(robotID, missionNumber);
                                 sourceLocation = m.getFromLocation();
                                 destinationLocation = m.getToLocation();
+                                String missionStartTime = getCurrentTime();
                                 appendToFile(logFilename_, robotTag + " Start Mission " + missionNumber + " from " + sourceLocation +
-                                " to " + destinationLocation + " at " + getCurrentTime() + "\n");
+                                " to " + destinationLocation + " at " + missionStartTime + "\n");
+                                JsonObject missionStartEvent = getMissionEvent("mission_start", robotID, missionNumber, missionStartTime);
+                                missionStartEvent.addProperty("from", sourceLocation);
+                                missionStartEvent.addProperty("to", destinationLocation);
+                                logEvent(missionStartEvent);
                                 tec_.addMissions(m);
                                 tec_.computeCriticalSections();
                                 tec_.startTrackingAddedMissions();